@@ -21,8 +21,8 @@ export default function DeleteConfirmationModal({
   const queryClient = useQueryClient();
 
   const deleteDomainMutation = useMutation({
-    mutationFn: async (domainId: number) => {
-      return apiRequest("DELETE", `/api/domains/${domainId}`);
+    mutationFn: async (domainName: string) => {
+      return apiRequest("DELETE", `/api/domains/${encodeURIComponent(domainName)}`);
     },
     onSuccess: () => {
       queryClient.invalidateQueries({ queryKey: ["/api/domains"] });
@@ -44,7 +44,7 @@ export default function DeleteConfirmationModal({
 
   const handleDelete = () => {
     if (domain) {
-      deleteDomainMutation.mutate(domain.id);
+      deleteDomainMutation.mutate(domain.name);
     }
   };
 
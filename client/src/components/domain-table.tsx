@@ -21,8 +21,8 @@ export default function DomainTable({ domains, isLoading, onDeleteDomain }: Doma
   const queryClient = useQueryClient();
 
   const installSSLMutation = useMutation({
-    mutationFn: async (domainId: number) => {
-      return apiRequest("POST", `/api/domains/${domainId}/ssl`);
+    mutationFn: async (domainName: string) => {
+      return apiRequest("POST", `/api/domains/${encodeURIComponent(domainName)}/ssl`);
     },
     onSuccess: () => {
       queryClient.invalidateQueries({ queryKey: ["/api/domains"] });
@@ -160,7 +160,7 @@ export default function DomainTable({ domains, isLoading, onDeleteDomain }: Doma
                       <Button
                         variant="ghost"
                         size="sm"
-                        onClick={() => installSSLMutation.mutate(domain.id)}
+                        onClick={() => installSSLMutation.mutate(domain.name)}
                         disabled={installSSLMutation.isPending}
                       >
                         <Shield className="h-4 w-4" />
@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+
+import json
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List
+
+from domain_index import SEARCH_MODES
+from inventory_io import EXPORT_FORMATS, IMPORT_FORMATS, export_records, import_names
+from record_fields import parse_fields
+
+
+class ActionError(Exception):
+    """Unknown action or missing arguments"""
+
+
+def require_domain(args: List[str]) -> str:
+    if not args:
+        raise ActionError("Domain name required")
+    return args[0]
+
+
+def parse_options(args: List[str]) -> Dict[str, str]:
+    """Parse key=value arguments"""
+    options = {}
+    for arg in args:
+        key, sep, value = arg.partition("=")
+        if not sep or not key:
+            raise ActionError(f"Expected key=value, got: {arg}")
+        options[key] = value
+    return options
+
+
+def int_option(options: Dict[str, str], key: str, default=None):
+    if key not in options:
+        return default
+    try:
+        return int(options[key])
+    except ValueError:
+        raise ActionError(f"{key} must be an integer")
+
+
+def dispatch(dm, action: str, args: List[str]) -> Dict:
+    """Run one API action against a domain manager and return its JSON result"""
+    # Start from zero so a mutation reports only the lock waits it caused itself
+    dm.locks.take_thread_wait_ms()
+
+    if action == "list":
+        options = parse_options(args)
+        try:
+            fields = parse_fields(options.get("fields"))
+        except ValueError as e:
+            raise ActionError(str(e))
+        domains = dm.list_domains(fields)
+        return {"success": True, "data": domains}
+
+    elif action == "stats":
+        stats = dm.get_domain_stats()
+        return {"success": True, "data": stats}
+
+    elif action == "get":
+        domain_name = require_domain(args)
+        domain = dm.get_domain(domain_name)
+        if domain is None:
+            return {"success": False, "message": f"Domain {domain_name} not found"}
+        return {"success": True, "data": domain}
+
+    elif action == "search":
+        if not args:
+            raise ActionError("Search query required")
+        mode = args[1] if len(args) > 1 and args[1] else "suffix"
+        try:
+            limit = int(args[2]) if len(args) > 2 else 50
+            offset = int(args[3]) if len(args) > 3 else 0
+        except ValueError:
+            raise ActionError("Limit and offset must be integers")
+        if mode not in SEARCH_MODES:
+            raise ActionError(f"Unknown search mode: {mode}")
+        return {"success": True, "data": dm.search_domains(args[0], mode, limit, offset)}
+
+    elif action == "expiring":
+        options = parse_options(args)
+        if "days" in options and "expired_for" in options:
+            raise ActionError("Use either days= or expired_for=, not both")
+        data = dm.expiring_domains(
+            within_days=int_option(options, "days"),
+            expired_for=int_option(options, "expired_for"),
+            limit=int_option(options, "limit", 50),
+            offset=int_option(options, "offset", 0)
+        )
+        return {"success": True, "data": data}
+
+    elif action == "traffic":
+        options = parse_options(args)
+        data = dm.traffic_stats(
+            domain=options.get("domain") or None,
+            since_hours=int_option(options, "since"),
+            limit=int_option(options, "limit", 50)
+        )
+        return {"success": True, "data": data}
+
+    elif action == "health":
+        refresh = len(args) > 0 and args[0].lower() == "refresh"
+        return {"success": True, "data": dm.backend_health(refresh)}
+
+    elif action == "changes":
+        options = parse_options(args)
+        data = dm.changes_since(int_option(options, "since", 0), int_option(options, "limit", 500))
+        return {"success": True, "data": data}
+
+    elif action == "audit":
+        failing_only = not (args and args[0].lower() == "all")
+        return {"success": True, "data": dm.audit_tls(failing_only)}
+
+    elif action == "drift":
+        include_diff = not (args and args[0].lower() == "false")
+        report = dm.detect_drift(include_diff)
+        return {"success": True, "data": report}
+
+    elif action == "consolidate":
+        enabled = not (args and args[0].lower() == "false")
+        result = dm.set_consolidated_mode(enabled)
+
+    elif action == "migrate":
+        result = dm.migrate_vhosts()
+
+    elif action == "layout":
+        if not args:
+            raise ActionError("Layout required: flat or sharded")
+        result = dm.set_layout(args[0])
+
+    elif action == "set_upstream":
+        domain_name = require_domain(args)
+        if len(args) < 2:
+            raise ActionError("Upstream address required")
+        result = dm.set_upstream(domain_name, args[1])
+
+    elif action == "set_profile":
+        domain_name = require_domain(args)
+        if len(args) < 2:
+            raise ActionError("Profile name required")
+        result = dm.set_profile(domain_name, args[1])
+
+    elif action == "access_log":
+        domain_name = require_domain(args)
+        if len(args) < 2 or args[1].lower() not in ("on", "off"):
+            raise ActionError("Access log state required: on or off")
+        result = dm.set_access_log(domain_name, args[1].lower() == "on")
+
+    elif action == "add":
+        domain_name = require_domain(args)
+        install_ssl = len(args) > 1 and args[1].lower() == "true"
+        options = {}
+        if len(args) > 2 and args[2]:
+            options["upstream"] = args[2]
+        if len(args) > 3 and args[3]:
+            options["profile"] = args[3]
+        if len(args) > 4 and args[4].lower() == "true":
+            options["access_log"] = True
+        result = dm.add_domain(domain_name, install_ssl, **options)
+
+    elif action == "import":
+        options = parse_options(args)
+        fmt = options.get("format", "auto")
+        if fmt not in IMPORT_FORMATS:
+            raise ActionError(f"Unknown import format: {fmt}. Valid formats: {', '.join(IMPORT_FORMATS)}")
+        chunk_size = int_option(options, "chunk", 500)
+        if chunk_size < 1:
+            raise ActionError("chunk must be at least 1")
+        add_options = {key: options[key] for key in ("upstream", "profile") if options.get(key)}
+        path = options.get("file", "-")
+        stream = sys.stdin if path == "-" else open(path, 'r', newline='')
+        try:
+            report = import_names(
+                dm, stream, fmt, options.get("column") or None, chunk_size, add_options,
+                dry_run=options.get("dry_run", "").lower() == "true",
+                max_errors=int_option(options, "errors", 100)
+            )
+        except ValueError as e:
+            raise ActionError(str(e))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+        return {"success": True, "data": report}
+
+    elif action == "history":
+        domain_name = args[0] if args else None
+        return {"success": True, "data": dm.snapshot_history(domain_name)}
+
+    elif action == "restore":
+        domain_name = require_domain(args)
+        options = parse_options(args[1:])
+        result = dm.restore_domain(domain_name, version=int_option(options, "version"),
+                                   at=int_option(options, "at"))
+
+    elif action == "restore_tree":
+        options = parse_options(args)
+        if "at" not in options:
+            raise ActionError("Point in time required: at=<unix seconds>")
+        result = dm.restore_tree(int_option(options, "at"))
+
+    elif action == "delete":
+        domain_name = require_domain(args)
+        options = parse_options(args[1:])
+        result = dm.delete_domain(domain_name, cleanup=options.get("cleanup", "").lower() == "true")
+
+    elif action == "gc":
+        # Only reports unless told otherwise
+        options = parse_options(args)
+        result = dm.collect_garbage(dry_run=options.get("dry_run", "true").lower() != "false")
+
+    elif action == "prepare_ssl" and hasattr(dm, "prepare_ssl_config"):
+        domain_name = require_domain(args)
+        result = dm.prepare_ssl_config(domain_name)
+
+    elif action == "install_ssl" and hasattr(dm, "install_ssl"):
+        domain_name = require_domain(args)
+        force_renewal = len(args) > 1 and args[1].lower() == "true"
+        result = dm.install_ssl(domain_name, force_renewal)
+
+    else:
+        raise ActionError(f"Unknown action: {action}")
+
+    # Mutations report how long they waited for their locks
+    result["lock_wait_ms"] = dm.locks.take_thread_wait_ms()
+    return result
+
+
+def uses_stdio(action: str, args: List[str]) -> bool:
+    """export writes to stdout, and import reads stdin unless given a file="""
+    if action == "export":
+        return True
+    return action == "import" and not any(arg.startswith("file=") and arg != "file=-" for arg in args)
+
+
+def export_inventory(dm, args: List[str]) -> None:
+    """Stream every domain record to stdout as CSV or NDJSON"""
+    options = parse_options(args)
+    fmt = options.get("format", "ndjson")
+    if fmt not in EXPORT_FORMATS:
+        raise ActionError(f"Unknown export format: {fmt}. Valid formats: {', '.join(EXPORT_FORMATS)}")
+    try:
+        fields = parse_fields(options.get("fields"))
+    except ValueError as e:
+        raise ActionError(str(e))
+    export_records(dm.iter_domains(fields), sys.stdout, fmt, fields)
+    sys.stdout.flush()
+
+
+def serve(dm, max_workers: int = 8) -> None:
+    """
+    Long-lived mode: answer newline-delimited JSON requests from stdin.
+    Each request is {"id": ..., "action": ..., "args": [...]} and each response
+    is the action result with the same "id". Requests run concurrently, so
+    identical reads share one computation through the manager cache.
+    """
+    output_lock = threading.Lock()
+
+    def respond(request_id, result: Dict) -> None:
+        result["id"] = request_id
+        line = json.dumps(result)
+        with output_lock:
+            sys.stdout.write(line + "\n")
+            sys.stdout.flush()
+
+    def handle(request: Dict) -> None:
+        action = request.get("action", "")
+        args = [str(a) for a in request.get("args", [])]
+        try:
+            if uses_stdio(action, args):
+                # stdin and stdout carry the request protocol here
+                raise ActionError(f"{action} streams through stdin/stdout; run it as its own process")
+            result = dispatch(dm, action, args)
+        except Exception as e:
+            result = {"success": False, "message": f"Error: {str(e)}"}
+        respond(request.get("id"), result)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for line in sys.stdin:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+            except ValueError:
+                respond(None, {"success": False, "message": "Invalid request"})
+                continue
+            pool.submit(handle, request)
+
+
+def run(manager_factory: Callable) -> None:
+    """Command line entry point shared by the API scripts"""
+    if len(sys.argv) < 2:
+        print(json.dumps({"success": False, "message": "No action specified"}))
+        sys.exit(1)
+
+    action = sys.argv[1]
+    dm = manager_factory()
+
+    if action == "serve":
+        serve(dm)
+        return
+
+    if action == "export":
+        # The inventory itself is the output, so errors go to stderr
+        try:
+            export_inventory(dm, sys.argv[2:])
+        except Exception as e:
+            print(f"Error exporting domains: {str(e)}", file=sys.stderr)
+            sys.exit(1)
+        return
+
+    try:
+        print(json.dumps(dispatch(dm, action, sys.argv[2:])))
+
+    except ActionError as e:
+        print(json.dumps({"success": False, "message": str(e)}))
+        sys.exit(1)
+
+    except Exception as e:
+        print(json.dumps({"success": False, "message": f"Error: {str(e)}"}))
+        sys.exit(1)
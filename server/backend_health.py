@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, List, Set
+
+_PROXY_PASS = re.compile(r"^\s*proxy_pass\s+https?://([^;/\s$]+)[^;]*;", re.MULTILINE)
+_FASTCGI_PASS = re.compile(r"^\s*fastcgi_pass\s+([^;\s$]+);", re.MULTILINE)
+_INCLUDE = re.compile(r"^\s*include\s+([^;\s*]+);", re.MULTILINE)
+
+
+def config_backends(config: str, upstreams: Dict[str, str], read_include: Callable[[str], str]) -> Set[str]:
+    """
+    Backends a vhost talks to: host:port for proxied upstreams and unix:/path
+    for sockets, following includes so snippets such as php-fpm.conf count.
+    upstreams maps upstream block names to their server address.
+    """
+    backends = set()
+    pending = [config]
+    seen_includes = set()
+    while pending:
+        text = pending.pop()
+        for target in _PROXY_PASS.findall(text):
+            # Keepalive pools resolve to their server; older vhosts proxy to host:port directly
+            backend = upstreams.get(target, target)
+            if ":" in backend:
+                backends.add(backend)
+        for target in _FASTCGI_PASS.findall(text):
+            backend = upstreams.get(target, target)
+            if backend.startswith("unix:") or ":" in backend:
+                backends.add(backend)
+        for path in _INCLUDE.findall(text):
+            if path not in seen_includes:
+                seen_includes.add(path)
+                pending.append(read_include(path))
+    return backends
+
+
+class BackendProber:
+    """
+    Concurrent connect checks for upstream TCP addresses and unix sockets.
+
+    Every distinct backend is probed once per run no matter how many vhosts
+    share it; at most `concurrency` connections are open at a time and each
+    gives up after `timeout` seconds. Results are kept in `state_file` for
+    `ttl` seconds, so repeated health requests, from this process or the
+    next, only probe backends that are new or stale.
+    """
+
+    def __init__(self, state_file: str, concurrency: int = 64, timeout: float = 1.0, ttl: float = 10.0):
+        self.state_file = state_file
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.ttl = ttl
+        # One probe run at a time; a caller that waited finds the results fresh
+        self._lock = threading.Lock()
+
+    def _load(self) -> Dict[str, Dict]:
+        try:
+            with open(self.state_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, results: Dict[str, Dict]) -> None:
+        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        tmp_file = f"{self.state_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(results, f, separators=(",", ":"))
+        os.replace(tmp_file, self.state_file)
+
+    async def _connect(self, backend: str) -> None:
+        import asyncio
+
+        if backend.startswith("unix:"):
+            _, writer = await asyncio.open_unix_connection(backend[len("unix:"):])
+        else:
+            host, _, port = backend.rpartition(":")
+            _, writer = await asyncio.open_connection(host.strip("[]"), int(port))
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except OSError:
+            pass
+
+    async def _probe_one(self, backend: str, semaphore) -> Dict:
+        import asyncio
+
+        result = {
+            "backend": backend,
+            "type": "unix" if backend.startswith("unix:") else "tcp",
+            "healthy": False,
+            "latencyMs": None,
+            "error": None
+        }
+        async with semaphore:
+            started = time.monotonic()
+            try:
+                await asyncio.wait_for(self._connect(backend), self.timeout)
+                result["healthy"] = True
+            except asyncio.TimeoutError:
+                result["error"] = f"timed out after {self.timeout:g}s"
+            except (OSError, ValueError) as e:
+                result["error"] = e.strerror if isinstance(e, OSError) and e.strerror else str(e)
+            result["latencyMs"] = round((time.monotonic() - started) * 1000, 3)
+        return result
+
+    async def _probe_all(self, backends: List[str]) -> List[Dict]:
+        import asyncio
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        return await asyncio.gather(*(self._probe_one(backend, semaphore) for backend in backends))
+
+    def probe(self, backends: List[str], refresh: bool = False) -> Dict[str, Dict]:
+        """Result for every backend, probing only those without a fresh result"""
+        # Each backend is probed once, however often it is listed
+        backends = list(dict.fromkeys(backends))
+        with self._lock:
+            saved = self._load()
+            now = time.time()
+            stale = [b for b in backends
+                     if refresh or b not in saved or not 0 <= now - saved[b].get("probedAt", 0) < self.ttl]
+
+            # Backends no vhost uses any more are forgotten
+            results = {backend: saved[backend] for backend in backends if backend not in stale}
+            if stale:
+                # Imported here: asyncio takes tens of milliseconds to load, which every
+                # other action would otherwise pay
+                import asyncio
+
+                for result in asyncio.run(self._probe_all(stale)):
+                    result["probedAt"] = now
+                    results[result["backend"]] = result
+            if stale or len(results) != len(saved):
+                try:
+                    self._save(results)
+                except OSError:
+                    # Still answered; the next request just probes again
+                    pass
+
+            return {backend: dict(results[backend], cached=backend not in stale) for backend in backends}
+
+
+def read_include_file(path: str) -> str:
+    try:
+        with open(path, 'r') as f:
+            return f.read()
+    except OSError:
+        return ""
+
+
+def summarize_health(usage: Dict[str, List[str]], results: Dict[str, Dict], sample: int = 5) -> Dict:
+    """Unhealthy backends first, each with the number of domains behind it and a few of their names"""
+    backends = []
+    for backend, domains in usage.items():
+        entry = dict(results[backend])
+        entry["domains"] = len(domains)
+        entry["sample"] = sorted(domains)[:sample]
+        backends.append(entry)
+    backends.sort(key=lambda entry: (entry["healthy"], -entry["domains"], entry["backend"]))
+
+    healthy = sum(1 for entry in backends if entry["healthy"])
+    return {
+        "checked": len(backends),
+        "healthy": healthy,
+        "unhealthy": len(backends) - healthy,
+        "backends": backends
+    }
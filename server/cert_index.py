@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Sample/development certificates carry no parseable expiry, so their
+# expiry is simulated as 90 days from the file's modification time
+SIMULATED_LIFETIME_DAYS = 90
+
+_PEM_MARKER = b"-----BEGIN CERTIFICATE-----"
+
+# cryptography costs a few hundred milliseconds to import, so it is only
+# loaded once a certificate actually has to be parsed
+_x509 = False
+
+
+def x509_module():
+    """cryptography's x509 module, imported on first use; None when the package is missing"""
+    global _x509
+    if _x509 is False:
+        try:
+            from cryptography import x509
+        except ImportError:
+            # Without it every certificate is treated as unparseable
+            x509 = None
+        _x509 = x509
+    return _x509
+
+
+def load_certificate(data: bytes):
+    """The first certificate of a PEM file, or None when there is none (or no x509 support)"""
+    if _PEM_MARKER not in data:
+        return None
+    x509 = x509_module()
+    if x509 is None:
+        return None
+    try:
+        return x509.load_pem_x509_certificate(data)
+    except ValueError:
+        return None
+
+
+def certificate_names(cert) -> List[str]:
+    """DNS names a certificate covers: its SANs, or the subject common name without them"""
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+
+    try:
+        san = cert.extensions.get_extension_for_class(x509.SubjectAlternativeName).value
+        names = san.get_values_for_type(x509.DNSName)
+    except x509.ExtensionNotFound:
+        names = []
+    if not names:
+        names = [attribute.value for attribute in cert.subject.get_attributes_for_oid(NameOID.COMMON_NAME)]
+    return [name.lower() for name in names]
+
+
+def certificate_not_after(cert) -> datetime:
+    """Expiry as a naive UTC datetime"""
+    not_after = getattr(cert, "not_valid_after_utc", None)
+    return not_after.replace(tzinfo=None) if not_after else cert.not_valid_after
+
+
+class CertificateIndex:
+    """
+    Index of the certificates in an ssl directory.
+    Each certificate file is parsed once and every name it covers
+    (subject alternative names, including wildcards) is mapped back to it,
+    so a single SAN or wildcard certificate is visible to every vhost it serves.
+    """
+
+    def __init__(self, ssl_dir: str, simulate_expiry: bool = True,
+                 preload: Optional[Callable[[], Dict[str, Tuple[Tuple, Optional[Dict]]]]] = None):
+        self.ssl_dir = ssl_dir
+        self._prefix = os.path.join(ssl_dir, "")
+        self.simulate_expiry = simulate_expiry
+        # path -> (stat key, parsed certificate)
+        self._parsed: Dict[str, Tuple[Tuple, Optional[Dict]]] = {}
+        # Parse results persisted by an earlier process, revalidated by stat like any other
+        self._preload = preload
+        # Bumped whenever a certificate is parsed again or goes away
+        self.generation = 0
+        self._exact: Dict[str, Dict] = {}
+        self._wildcard: Dict[str, Dict] = {}
+        self._loaded = False
+        # Set by scanned() for the calling thread
+        self._local = threading.local()
+
+    @staticmethod
+    def _stat_key(st: os.stat_result) -> Tuple:
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _parse_certificate(self, path: str, st: os.stat_result) -> Optional[Dict]:
+        """Parse a certificate file into its covered names and expiry"""
+        file_domain = os.path.basename(path)[:-len(".crt")]
+
+        try:
+            with open(path, 'rb') as f:
+                cert = load_certificate(f.read())
+        except OSError:
+            cert = None
+
+        if cert is not None:
+            names = certificate_names(cert)
+            not_after = certificate_not_after(cert)
+        elif self.simulate_expiry:
+            names = [file_domain.lower()]
+            not_after = datetime.fromtimestamp(st.st_mtime) + timedelta(days=SIMULATED_LIFETIME_DAYS)
+        else:
+            return None
+
+        return {
+            "path": path,
+            "file_domain": file_domain,
+            "names": names,
+            "not_after": not_after,
+        }
+
+    def _seed(self) -> None:
+        if self._preload is not None:
+            preload, self._preload = self._preload, None
+            seeded = preload()
+            seeded.update(self._parsed)
+            self._parsed = seeded
+
+    def parsed_entries(self) -> Dict[str, Tuple[Tuple, Optional[Dict]]]:
+        """Every parse result with the stat key it was made for"""
+        self._seed()
+        return dict(self._parsed)
+
+    def refresh(self) -> None:
+        """Rescan the ssl directory, re-parsing only certificates whose files changed"""
+        self._seed()
+        parsed = {}
+        reparsed = False
+
+        try:
+            with os.scandir(self.ssl_dir) as entries:
+                for entry in entries:
+                    if not entry.name.endswith(".crt"):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except OSError:
+                        continue
+
+                    key = self._stat_key(st)
+                    cached = self._parsed.get(entry.path)
+                    if cached and cached[0] == key:
+                        parsed[entry.path] = cached
+                    else:
+                        parsed[entry.path] = (key, self._parse_certificate(entry.path, st))
+                        reparsed = True
+        except FileNotFoundError:
+            pass
+
+        if reparsed or len(parsed) != len(self._parsed):
+            self.generation += 1
+        self._parsed = parsed
+        self._rebuild()
+        self._loaded = True
+
+    def _rebuild(self) -> None:
+        """Rebuild the name maps from the parsed certificates"""
+        exact = {}
+        wildcard = {}
+
+        for _, cert in self._parsed.values():
+            if cert is None:
+                continue
+            for name in cert["names"]:
+                target = wildcard if name.startswith("*.") else exact
+                key = name[2:] if name.startswith("*.") else name
+                # When several certificates cover a name, prefer the one valid longest
+                current = target.get(key)
+                if current is None or cert["not_after"] > current["not_after"]:
+                    target[key] = cert
+
+        self._exact = exact
+        self._wildcard = wildcard
+
+    @contextmanager
+    def scanned(self) -> Iterator[None]:
+        """
+        Refresh, then answer own_certificate() from that scan instead of
+        stat'ing each domain's file, for the calling thread within the block.
+        For listings that look up every domain right after the scan.
+        """
+        self.refresh()
+        self._local.scanned = True
+        try:
+            yield
+        finally:
+            self._local.scanned = False
+
+    def ensure_loaded(self) -> None:
+        if not self._loaded:
+            self.refresh()
+
+    def own_certificate(self, domain: str) -> Optional[Dict]:
+        """Return the certificate stored under the domain's own file name, if any"""
+        path = f"{self._prefix}{domain}.crt"
+        if getattr(self._local, "scanned", False):
+            cached = self._parsed.get(path)
+            return cached[1] if cached else None
+
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+
+        self._seed()
+        key = self._stat_key(st)
+        cached = self._parsed.get(path)
+        if cached and cached[0] == key:
+            return cached[1]
+
+        cert = self._parse_certificate(path, st)
+        self._parsed[path] = (key, cert)
+        self.generation += 1
+        if self._loaded:
+            self._rebuild()
+        return cert
+
+    @staticmethod
+    def covers(cert: Dict, name: str) -> bool:
+        """Check whether a certificate covers a name, directly or by wildcard"""
+        name = name.lower()
+        if name in cert["names"]:
+            return True
+        return "." in name and f"*.{name.split('.', 1)[1]}" in cert["names"]
+
+    def lookup(self, domain: str, full_scan: bool = True) -> Optional[Dict]:
+        """Find the certificate covering a domain, by its own file, SAN or wildcard"""
+        own = self.own_certificate(domain)
+        if own is not None:
+            return own
+
+        name = domain.lower()
+        if not full_scan and not self._loaded:
+            # Only probe certificates named after a parent domain, which is where
+            # SAN and wildcard certificates are normally stored
+            labels = name.split(".")
+            for i in range(1, len(labels) - 1):
+                cert = self.own_certificate(".".join(labels[i:]))
+                if cert is not None and self.covers(cert, name):
+                    return cert
+            return None
+
+        self.ensure_loaded()
+        if name in self._exact:
+            return self._exact[name]
+
+        # A wildcard covers exactly one label below its base name
+        if "." in name:
+            return self._wildcard.get(name.split(".", 1)[1])
+        return None
+
+    def certificates(self) -> List[Dict]:
+        """Return every parsed certificate"""
+        self.ensure_loaded()
+        return [cert for _, cert in self._parsed.values() if cert is not None]
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Tuple
+
+EVENT_TYPES = ["added", "removed", "enabled", "disabled", "cert_changed"]
+
+
+class ChangeFeed:
+    """
+    Bounded, sequence-numbered log of domain changes for incremental clients.
+
+    Events are appended to a JSON-lines file; once it holds twice `capacity`
+    events it is compacted to the newest `capacity`. A caller whose sequence
+    number is older than the oldest kept event, or newer than the newest one
+    (the log was reset), is told to resync from a full listing.
+    Appends must be serialized by the caller; reads need no lock.
+    """
+
+    def __init__(self, log_file: str, cert_snapshot_file: str, capacity: int = 1000):
+        self.log_file = log_file
+        self.cert_snapshot_file = cert_snapshot_file
+        self.capacity = capacity
+
+    def _read(self) -> List[Dict]:
+        events = []
+        try:
+            with open(self.log_file, 'r') as f:
+                for line in f:
+                    try:
+                        events.append(json.loads(line))
+                    except ValueError:
+                        # A line still being appended by another process
+                        break
+        except FileNotFoundError:
+            pass
+        return events
+
+    def _last_seq(self) -> int:
+        """Sequence number of the newest event, reading only the end of the log"""
+        try:
+            with open(self.log_file, 'rb') as f:
+                size = f.seek(0, os.SEEK_END)
+                f.seek(max(0, size - 4096))
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return 0
+        for line in reversed(lines):
+            try:
+                return json.loads(line)["seq"]
+            except (ValueError, KeyError):
+                continue
+        return 0
+
+    def append(self, events: List[Tuple[str, str]]) -> int:
+        """Record (type, domain) events and return the newest sequence number"""
+        seq = self._last_seq()
+        if not events:
+            return seq
+
+        now = int(time.time())
+        lines = []
+        for event_type, domain in events:
+            if event_type not in EVENT_TYPES:
+                raise ValueError(f"Unknown change type: {event_type}")
+            seq += 1
+            lines.append(json.dumps({"seq": seq, "type": event_type, "name": domain, "at": now}) + "\n")
+
+        os.makedirs(os.path.dirname(self.log_file), exist_ok=True)
+        with open(self.log_file, 'a') as f:
+            f.write("".join(lines))
+
+        # Compact each time another `capacity` events have been added, so appends stay cheap
+        if seq >= 2 * self.capacity and seq // self.capacity != (seq - len(events)) // self.capacity:
+            self._compact()
+        return seq
+
+    def _compact(self) -> None:
+        kept = self._read()[-self.capacity:]
+        tmp_file = f"{self.log_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'w') as f:
+            f.write("".join(json.dumps(event) + "\n" for event in kept))
+        os.replace(tmp_file, self.log_file)
+
+    def since(self, seq: int, limit: int = 500) -> Dict:
+        """Events after seq, oldest first, or a resync marker when they are no longer all kept"""
+        events = self._read()
+        latest = events[-1]["seq"] if events else 0
+        oldest = events[0]["seq"] if events else latest + 1
+
+        if seq > latest or seq < oldest - 1:
+            return {"resync": True, "seq": latest, "events": [], "more": False}
+
+        # Sequence numbers are contiguous, so the first wanted event is at a fixed position
+        start = seq - oldest + 1
+        page = events[start:start + limit]
+        return {
+            "resync": False,
+            "seq": page[-1]["seq"] if page else seq,
+            "events": page,
+            "more": start + limit < len(events)
+        }
+
+    def certificate_changes(self, ssl_dir: str) -> List[str]:
+        """
+        Domains whose certificate file appeared, changed or went away since the
+        last call, including renewals done outside the manager. The first call
+        only records the current state.
+        """
+        current = {}
+        try:
+            with os.scandir(ssl_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".crt"):
+                        try:
+                            st = entry.stat()
+                        except OSError:
+                            continue
+                        current[entry.name[:-len(".crt")]] = [st.st_ino, st.st_size, st.st_mtime_ns]
+        except FileNotFoundError:
+            pass
+
+        try:
+            with open(self.cert_snapshot_file, 'r') as f:
+                previous = json.load(f)
+        except (OSError, ValueError):
+            previous = None
+
+        if previous == current:
+            return []
+
+        os.makedirs(os.path.dirname(self.cert_snapshot_file), exist_ok=True)
+        tmp_file = f"{self.cert_snapshot_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(current, f, separators=(",", ":"))
+        os.replace(tmp_file, self.cert_snapshot_file)
+
+        if previous is None:
+            return []
+        changed = set()
+        for stem in set(previous) | set(current):
+            if previous.get(stem) != current.get(stem):
+                # Extra key types are {domain}.ecc.crt or {domain}.rsa.crt
+                changed.add(stem[:-4] if stem.endswith((".ecc", ".rsa")) else stem)
+        return sorted(changed)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import threading
+from typing import List, Optional
+
+from write_journal import Journal
+
+# Placeholder rendered through generate_nginx_config to obtain the shared block
+PLACEHOLDER_DOMAIN = "consolidated.invalid"
+
+
+class ConsolidatedVhosts:
+    """
+    Consolidated vhost mode: one shared server block serves every domain that
+    uses the unmodified template. The block includes a generated file with one
+    server_name line per domain, so adding or removing a domain rewrites only
+    that small include file instead of a full vhost and symlink.
+    The mode is active while the shared vhost exists in sites-available.
+    """
+
+    VHOST_NAME = "_consolidated"
+
+    def __init__(self, sites_available: str, sites_enabled: str, include_dir: str):
+        self.conf_file = os.path.join(sites_available, f"{self.VHOST_NAME}.conf")
+        self.link_file = os.path.join(sites_enabled, f"{self.VHOST_NAME}.conf")
+        self.names_file = os.path.join(include_dir, "server_names.conf")
+        self._names: Optional[List[str]] = None
+        self._names_key = None
+
+    @property
+    def enabled(self) -> bool:
+        return os.path.exists(self.conf_file)
+
+    def render_server_block(self, template: str) -> str:
+        """Turn a generated single-domain vhost into the shared server block"""
+        block, count = re.subn(
+            rf"^(\s*)server_name {re.escape(PLACEHOLDER_DOMAIN)} www\.{re.escape(PLACEHOLDER_DOMAIN)};$",
+            rf"\1include {self.names_file};",
+            template,
+            flags=re.MULTILINE
+        )
+        if count != 1:
+            raise ValueError("Template has no single server_name line to consolidate")
+        return block
+
+    def names(self) -> List[str]:
+        """Domains served by the shared block, cached until the include file changes"""
+        try:
+            st = os.stat(self.names_file)
+        except OSError:
+            return []
+
+        key = (st.st_ino, st.st_size, st.st_mtime_ns)
+        if self._names is None or self._names_key != key:
+            names = []
+            with open(self.names_file, 'r') as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) >= 2 and parts[0] == "server_name":
+                        names.append(parts[1].rstrip(";"))
+            self._names = names
+            self._names_key = key
+        return self._names
+
+    def contains(self, domain: str) -> bool:
+        return self.enabled and domain in self.names()
+
+    @staticmethod
+    def _render_names(names: List[str]) -> str:
+        lines = ["# Generated by the domain manager - one line per consolidated domain\n"]
+        lines.extend(f"server_name {name} www.{name};\n" for name in names)
+        return "".join(lines)
+
+    def _write_names(self, names: List[str]) -> None:
+        os.makedirs(os.path.dirname(self.names_file), exist_ok=True)
+        tmp_file = f"{self.names_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'w') as f:
+            f.write(self._render_names(names))
+        os.replace(tmp_file, self.names_file)
+        self._names = None
+
+    def enable(self, template: str, journal: Journal) -> None:
+        """Create the shared vhost, its include file and its enabled symlink in one journal batch"""
+        block = self.render_server_block(template)
+        with journal.batch() as batch:
+            if not os.path.exists(self.names_file):
+                batch.write(self.names_file, self._render_names([]))
+            batch.write(self.conf_file, block)
+            if not os.path.lexists(self.link_file):
+                batch.symlink(self.conf_file, self.link_file)
+        self._names = None
+
+    def disable(self) -> None:
+        """Remove the shared vhost and include file"""
+        for path in (self.link_file, self.conf_file, self.names_file):
+            if os.path.lexists(path):
+                os.remove(path)
+        self._names = None
+
+    def add(self, domains: List[str]) -> None:
+        names = list(self.names())
+        existing = set(names)
+        names.extend(domain for domain in domains if domain not in existing)
+        self._write_names(names)
+
+    def remove(self, domain: str) -> bool:
+        names = self.names()
+        if domain not in names:
+            return False
+        self._write_names([name for name in names if name != domain])
+        return True
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+from bisect import bisect_right
+from typing import Dict, List, Optional, Set, Tuple
+
+SEARCH_MODES = ["suffix", "exact", "substring"]
+
+
+class _Node:
+    __slots__ = ("children", "name", "count", "ordered", "offsets")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.name: Optional[str] = None
+        # Names at or below this node
+        self.count = 0
+        # Children in label order and the running name count before each of them
+        self.ordered: List["_Node"] = []
+        self.offsets: List[int] = []
+
+
+class DomainIndex:
+    """
+    In-memory name index for search.
+
+    Names are stored in a trie keyed on reversed DNS labels, so
+    "blog.example.com" lives under com -> example -> blog and every name at or
+    below a parent domain (or public suffix such as co.uk) is one subtree.
+    Subtree sizes are kept per node, so totals and page offsets need no
+    traversal of the names before the requested page.
+    Substring queries use a trigram index and only verify the candidates
+    shared by all of the query's trigrams.
+    """
+
+    def __init__(self, entries: List[Tuple[str, str]]):
+        self._root = _Node()
+        self._paths: Dict[str, str] = {}
+        # Built on the first substring query; suffix and exact lookups never need it
+        self._trigrams: Optional[Dict[str, Set[int]]] = None
+
+        for name, path in entries:
+            name = name.lower()
+            if name not in self._paths:
+                self._paths[name] = path
+                self._insert(name)
+
+        # Positions in alphabetical order, so sorted candidates are sorted names
+        self._names: List[str] = sorted(self._paths)
+        self._finalize(self._root)
+
+    def __len__(self) -> int:
+        return len(self._names)
+
+    def _insert(self, name: str) -> None:
+        node = self._root
+        node.count += 1
+        for label in reversed(name.split(".")):
+            child = node.children.get(label)
+            if child is None:
+                child = node.children[label] = _Node()
+            node = child
+            node.count += 1
+        node.name = name
+
+    def _finalize(self, root: _Node) -> None:
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            node.ordered = [node.children[label] for label in sorted(node.children)]
+            running = 1 if node.name is not None else 0
+            for child in node.ordered:
+                node.offsets.append(running)
+                running += child.count
+            stack.extend(node.ordered)
+
+    def _trigram_index(self) -> Dict[str, Set[int]]:
+        if self._trigrams is None:
+            trigrams: Dict[str, Set[int]] = {}
+            for position, name in enumerate(self._names):
+                for i in range(len(name) - 2):
+                    trigrams.setdefault(name[i:i+3], set()).add(position)
+            self._trigrams = trigrams
+        return self._trigrams
+
+    def path(self, name: str) -> Optional[str]:
+        return self._paths.get(name.lower())
+
+    def _find_node(self, labels: List[str]) -> Optional[_Node]:
+        node = self._root
+        for label in reversed(labels):
+            node = node.children.get(label)
+            if node is None:
+                return None
+        return node
+
+    def _suffix(self, query: str, limit: int, offset: int) -> Tuple[int, List[str]]:
+        # A leading dot ("co.uk" vs ".co.uk") excludes the parent itself
+        strict = query.startswith(".")
+        node = self._find_node(query.strip(".").split("."))
+        if node is None:
+            return 0, []
+
+        total = node.count
+        if strict and node.name is not None:
+            total -= 1
+            offset += 1
+
+        # Pre-order walk in label order, entering the page through the offsets
+        names: List[str] = []
+        stack = [(node, offset)]
+        while stack and len(names) < limit:
+            current, skip = stack.pop()
+            if current.name is not None and skip == 0:
+                names.append(current.name)
+            if not current.ordered:
+                continue
+
+            # First child whose subtree still holds names past the offset
+            index = max(bisect_right(current.offsets, skip) - 1, 0)
+            child_skip = max(skip - current.offsets[index], 0)
+            # Every later sibling holds at least one name, so limit of them is enough
+            resume = [(child, 0) for child in current.ordered[index + 1:index + limit]]
+            stack.extend(reversed(resume))
+            stack.append((current.ordered[index], child_skip))
+        return total, names
+
+    def _substring(self, query: str, limit: int, offset: int) -> Tuple[int, List[str]]:
+        if len(query) < 3:
+            # Too short for the trigram index
+            matches = [name for name in self._names if query in name]
+            return len(matches), matches[offset:offset + limit]
+
+        trigrams = self._trigram_index()
+        candidates: Optional[Set[int]] = None
+        # Smallest trigram sets first keep the intersection cheap
+        trigram_sets = sorted(
+            (trigrams.get(query[i:i+3], set()) for i in range(len(query) - 2)), key=len
+        )
+        for positions in trigram_sets:
+            candidates = set(positions) if candidates is None else candidates & positions
+            if not candidates:
+                return 0, []
+        matches = [self._names[p] for p in sorted(candidates) if query in self._names[p]]
+        return len(matches), matches[offset:offset + limit]
+
+    def search(self, query: str, mode: str = "suffix", limit: int = 50, offset: int = 0) -> Dict:
+        """One page of names matching query plus the total number of matches"""
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode: {mode}")
+        query = query.strip().lower()
+        if not query:
+            return {"total": 0, "names": []}
+
+        if mode == "exact":
+            names = [query] if query in self._paths and offset == 0 else []
+            total = 1 if query in self._paths else 0
+        elif mode == "suffix":
+            total, names = self._suffix(query, limit, offset)
+        else:
+            total, names = self._substring(query, limit, offset)
+
+        return {"total": total, "names": names}
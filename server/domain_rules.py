@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import re
+from typing import Optional
+
+# The same rules back the zod schema in shared/schema.ts, so a name the API
+# accepts is never rejected later by a manager, and the other way round
+RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "shared", "domain-rules.json")
+
+with open(RULES_FILE, 'r') as f:
+    RULES = json.load(f)
+
+_LABEL = re.compile(RULES["labelPattern"])
+# Every label at once, for the common case of a valid name
+_LABEL_BODY = RULES["labelPattern"].lstrip("^").rstrip("$")
+_NAME = re.compile(rf"{_LABEL_BODY}(?:\.{_LABEL_BODY})*")
+
+
+def domain_name_error(name: str) -> Optional[str]:
+    """Why name is not a valid domain name, or None when it is"""
+    if len(name) <= RULES["maxLength"] and _NAME.fullmatch(name):
+        return None
+    if not name:
+        return "empty"
+    if len(name) > RULES["maxLength"]:
+        return "too_long"
+    for label in name.split("."):
+        if not label:
+            # Leading, trailing or consecutive dots
+            return "empty_label"
+        if len(label) > RULES["maxLabelLength"]:
+            return "label_too_long"
+        if not _LABEL.fullmatch(label):
+            return "invalid_label"
+    return None
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+from bisect import bisect_left
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+
+class ExpiryIndex:
+    """
+    Domains with a certificate, sorted by (notAfter, domain).
+    Range queries bisect the sorted expiry dates, so a window costs
+    O(log n) plus the size of the returned page, and results come back
+    soonest first.
+    """
+
+    def __init__(self, entries: List[Tuple[datetime, str, str]]):
+        # entries: (not_after, domain, config path)
+        ordered = sorted(entries)
+        self._dates = [not_after for not_after, _, _ in ordered]
+        self._domains = [domain for _, domain, _ in ordered]
+        self._paths = {domain: path for _, domain, path in ordered}
+
+    def __len__(self) -> int:
+        return len(self._dates)
+
+    def path(self, domain: str) -> Optional[str]:
+        return self._paths.get(domain)
+
+    def range(self, start: Optional[datetime], end: Optional[datetime],
+              limit: int = 50, offset: int = 0) -> Dict:
+        """Domains expiring in [start, end), None meaning unbounded; one page plus the total"""
+        low = 0 if start is None else bisect_left(self._dates, start)
+        high = len(self._dates) if end is None else bisect_left(self._dates, end)
+        high = max(low, high)
+
+        first = low + offset
+        last = min(first + limit, high)
+        return {
+            "total": high - low,
+            "entries": [(self._dates[i], self._domains[i]) for i in range(first, last)]
+        }
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+import fcntl
+import hashlib
+import os
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
+
+class LockTimeout(Exception):
+    """Raised when a lock could not be acquired in time"""
+
+
+class LockManager:
+    """
+    Cross-process reader/writer locking with flock().
+
+    Every API call runs in its own Python process, so locks live in lock files
+    under the manager state directory:
+      - read():           shared tree lock - list/stats/get run in parallel
+      - write(domain):    shared tree lock + exclusive per-domain lock, so
+                          mutations of different domains do not serialize
+      - exclusive():      exclusive tree lock for operations on the whole tree
+    Locks are reentrant within a thread. Wait times are recorded per acquisition.
+    """
+
+    def __init__(self, lock_dir: str, timeout: float = 30.0, slow_wait_ms: float = 50.0):
+        self.lock_dir = lock_dir
+        self.timeout = timeout
+        self.slow_wait_ms = slow_wait_ms
+        # Recent acquisitions only, so a long-lived process does not grow without bound
+        self.waits = deque(maxlen=1000)
+        self.acquisitions = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+
+    def _held(self) -> Dict[str, Dict]:
+        if not hasattr(self._local, "held"):
+            self._local.held = {}
+        return self._local.held
+
+    def _domain_lock_path(self, domain: str) -> str:
+        # Two-character prefix directories keep the lock directory small
+        prefix = hashlib.sha1(domain.encode()).hexdigest()[:2]
+        return os.path.join(self.lock_dir, "domains", prefix, f"{domain}.lock")
+
+    def _acquire(self, fd: int, exclusive: bool) -> None:
+        mode = fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH
+        deadline = time.monotonic() + self.timeout
+        delay = 0.001
+
+        while True:
+            try:
+                fcntl.flock(fd, mode | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise LockTimeout(f"Timed out after {self.timeout:.0f}s waiting for lock")
+                time.sleep(delay)
+                delay = min(delay * 2, 0.05)
+
+    @contextmanager
+    def _lock(self, path: str, exclusive: bool) -> Iterator[None]:
+        held = self._held()
+        current = held.get(path)
+        if current is not None:
+            if exclusive and not current["exclusive"]:
+                raise RuntimeError(f"Cannot upgrade shared lock {path} to exclusive")
+            current["depth"] += 1
+            try:
+                yield
+            finally:
+                current["depth"] -= 1
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        start = time.monotonic()
+        try:
+            self._acquire(fd, exclusive)
+        except BaseException:
+            os.close(fd)
+            raise
+
+        self._record(path, exclusive, (time.monotonic() - start) * 1000)
+        held[path] = {"exclusive": exclusive, "depth": 1}
+        try:
+            yield
+        finally:
+            del held[path]
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def _record(self, path: str, exclusive: bool, wait_ms: float) -> None:
+        lock_name = os.path.relpath(path, self.lock_dir)
+        mode = "exclusive" if exclusive else "shared"
+        with self._stats_lock:
+            self.waits.append({"lock": lock_name, "mode": mode, "wait_ms": round(wait_ms, 3)})
+            self.acquisitions += 1
+            self.total_wait += wait_ms
+            self.max_wait = max(self.max_wait, wait_ms)
+        self._local.wait_ms = getattr(self._local, "wait_ms", 0.0) + wait_ms
+        if wait_ms >= self.slow_wait_ms:
+            print(f"Slow lock: waited {wait_ms:.1f}ms for {mode} {lock_name}", file=sys.stderr)
+
+    def read(self):
+        """Shared lock on the whole tree for read-only operations"""
+        return self._lock(os.path.join(self.lock_dir, "tree.lock"), False)
+
+    def exclusive(self):
+        """Exclusive lock on the whole tree"""
+        return self._lock(os.path.join(self.lock_dir, "tree.lock"), True)
+
+    @contextmanager
+    def write(self, domain: str) -> Iterator[None]:
+        """Lock a single domain for modification"""
+        with self.read():
+            with self._lock(self._domain_lock_path(domain), True):
+                yield
+
+    def take_thread_wait_ms(self) -> float:
+        """Return and reset the lock wait accumulated by the calling thread"""
+        wait_ms = getattr(self._local, "wait_ms", 0.0)
+        self._local.wait_ms = 0.0
+        return round(wait_ms, 3)
+
+    def stats(self) -> Dict:
+        """Summary of lock waits recorded by this manager"""
+        with self._stats_lock:
+            return {
+                "acquisitions": self.acquisitions,
+                "total_wait_ms": round(self.total_wait, 3),
+                "max_wait_ms": round(self.max_wait, 3),
+            }
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+import csv
+import itertools
+import json
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from domain_rules import domain_name_error
+from record_fields import LIST_FIELDS
+
+IMPORT_FORMATS = ["auto", "csv", "lines"]
+EXPORT_FORMATS = ["csv", "ndjson"]
+
+# Header cells that name the domain column of a CSV file
+NAME_COLUMNS = ("name", "domain", "domain_name", "hostname")
+
+
+def normalize_name(value: str) -> str:
+    """Names compare case-insensitively and may be written fully qualified"""
+    name = value.strip().lower()
+    return name[:-1] if name.endswith(".") else name
+
+
+def read_names(stream: Iterable[str], fmt: str = "auto", column: Optional[str] = None) -> Iterator[Tuple[int, str]]:
+    """
+    (line number, raw name) for every name in a CSV file or a plain list,
+    one line at a time. Blank lines and lines starting with # are skipped.
+    The CSV column is the header cell called column, the 0-based index
+    column, or else the first header cell in NAME_COLUMNS, or else column 0.
+    """
+    if fmt not in IMPORT_FORMATS:
+        raise ValueError(f"Unknown import format: {fmt}")
+
+    lines = iter(stream)
+    first = next(lines, None)
+    if first is None:
+        return
+    lines = itertools.chain([first], lines)
+    if fmt == "auto":
+        fmt = "csv" if "," in first else "lines"
+
+    if fmt == "lines":
+        for number, line in enumerate(lines, 1):
+            value = line.strip()
+            if number == 1 and value.lower() in NAME_COLUMNS:
+                # A one-word header would otherwise pass as a single-label name
+                continue
+            if value and not value.startswith("#"):
+                yield number, value
+        return
+
+    reader = csv.reader(lines)
+    index = None
+    for row in reader:
+        cells = [cell.strip() for cell in row]
+        if not any(cells) or cells[0].startswith("#"):
+            continue
+
+        if index is None:
+            lowered = [cell.lower() for cell in cells]
+            if column is not None and not column.isdigit():
+                if column.lower() not in lowered:
+                    raise ValueError(f"Column {column} not found in the CSV header")
+                index = lowered.index(column.lower())
+                continue
+            if column is not None:
+                index = int(column)
+            else:
+                index = next((lowered.index(name) for name in NAME_COLUMNS if name in lowered), 0)
+            # A header row names the column instead of holding a domain
+            if index < len(lowered) and lowered[index] in NAME_COLUMNS:
+                continue
+
+        yield reader.line_num, cells[index] if index < len(cells) else ""
+
+
+def import_names(dm, stream: Iterable[str], fmt: str = "auto", column: Optional[str] = None,
+                 chunk_size: int = 500, options: Optional[Dict] = None, dry_run: bool = False,
+                 max_errors: int = 100) -> Dict:
+    """
+    Validate, deduplicate and add every name in stream, handing accepted
+    names to dm.add_domains chunk_size at a time. Memory stays bounded by
+    the set of distinct names; per-line errors beyond max_errors are only counted.
+    """
+    options = options or {}
+    report = {
+        "lines": 0, "accepted": 0, "added": 0, "duplicates": 0, "invalid": 0,
+        "existing": 0, "failed": 0, "chunks": 0, "dryRun": dry_run,
+        "errors": [], "errorsTruncated": False
+    }
+    seen = set()
+    # Accepted names waiting for the next chunk, with the line each came from
+    pending: Dict[str, int] = {}
+
+    def record_error(line: int, name: str, error: str) -> None:
+        if len(report["errors"]) < max_errors:
+            report["errors"].append({"line": line, "name": name, "error": error})
+        else:
+            report["errorsTruncated"] = True
+
+    def flush() -> None:
+        if not pending:
+            return
+        report["chunks"] += 1
+        result = dm.add_domains(list(pending), **options)
+        if not result["success"]:
+            failures = [{"name": name, "error": result["message"]} for name in pending]
+        else:
+            report["added"] += len(result["added"])
+            failures = result["failed"]
+        for failure in failures:
+            if failure["error"] == "already exists":
+                report["existing"] += 1
+            else:
+                report["failed"] += 1
+            record_error(pending[failure["name"]], failure["name"], failure["error"])
+        pending.clear()
+
+    for line, raw in read_names(stream, fmt, column):
+        report["lines"] += 1
+        name = normalize_name(raw)
+        error = domain_name_error(name)
+        if error:
+            report["invalid"] += 1
+            record_error(line, raw, error)
+            continue
+        if name in seen:
+            report["duplicates"] += 1
+            continue
+        seen.add(name)
+        report["accepted"] += 1
+
+        if not dry_run:
+            pending[name] = line
+            if len(pending) >= chunk_size:
+                flush()
+    flush()
+    return report
+
+
+def _csv_value(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def export_records(records: Iterable[Dict], out: TextIO, fmt: str = "ndjson",
+                   fields: Optional[Iterable[str]] = None) -> int:
+    """Write domain records to out as they are produced; returns how many were written"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    columns: List[str] = [field for field in LIST_FIELDS if fields is None or field in fields]
+    writer = csv.writer(out) if fmt == "csv" else None
+    if writer:
+        writer.writerow(columns)
+
+    count = 0
+    for record in records:
+        if writer:
+            writer.writerow([_csv_value(record.get(field)) for field in columns])
+        else:
+            out.write(json.dumps(record) + "\n")
+        count += 1
+    return count
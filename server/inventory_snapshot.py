@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+
+import mmap
+import os
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from site_layout import FLAT, SHARDED
+
+MAGIC = b"DMINV\x00\x00\x02"
+
+# Counts of directories, domains and certificates, the string table size and
+# whether the domains were resolved with the sharded layout taking precedence
+_HEADER = struct.Struct("<8sIIIIB")
+# Path (string offset, length) and stat key
+_DIR = struct.Struct("<IIQQq")
+# Name (string offset, length), vhost inode, enabled link inode, vhost ctime, flags
+_DOMAIN = struct.Struct("<IIQQdB")
+# Path and comma-joined names (string offset, length each), stat key, notAfter, flags
+_CERT = struct.Struct("<IIIIQQqdB")
+
+_ENABLED = 1
+_CONF_SHARDED = 2
+_LINK_SHARDED = 4
+_HAS_LINK = 8
+_PARSED = 1
+
+# Directory changes within this window of a scan are not trusted to show in its mtime
+RACY_WINDOW_NS = 2_000_000_000
+
+
+class InventoryEntry:
+    """What a listing needs to know about one per-domain vhost"""
+
+    __slots__ = ("conf_file", "conf_ino", "link_file", "link_ino", "enabled", "created")
+
+    def __init__(self, conf_file: str, conf_ino: int, link_file: Optional[str], link_ino: int,
+                 enabled: bool, created: float):
+        self.conf_file = conf_file
+        self.conf_ino = conf_ino
+        self.link_file = link_file
+        self.link_ino = link_ino
+        self.enabled = enabled
+        self.created = created
+
+
+class _StringTable:
+    def __init__(self):
+        self.parts: List[bytes] = []
+        self.size = 0
+
+    def add(self, text: str) -> Tuple[int, int]:
+        data = text.encode()
+        offset = self.size
+        self.parts.append(data)
+        self.size += len(data)
+        return offset, len(data)
+
+
+class Inventory:
+    """
+    Per-domain vhost inventory persisted between processes.
+
+    The snapshot file is a header, fixed-width records for the directories,
+    domains and certificates, and one string table, read through mmap. On
+    each use every recorded directory is stat'ed and only the directories
+    whose stat changed are listed again; within them a vhost or enabled link
+    is only re-examined when its inode changed. A new process therefore
+    answers from the snapshot instead of stat'ing every vhost, link and
+    certificate, and a cold start without a snapshot costs one full scan.
+    """
+
+    def __init__(self, snapshot_file: str, layout, accept: Callable[[str], bool]):
+        self.snapshot_file = snapshot_file
+        self.layout = layout
+        # Decides which vhost file names are managed domains
+        self.accept = accept
+        self.cert_index = None
+        # Reentrant: saving asks the certificate index, which may pull certificates() first
+        self._lock = threading.RLock()
+        self._loaded = False
+        self._dirs: Dict[str, Tuple[int, int, int]] = {}
+        self._entries: Dict[str, InventoryEntry] = {}
+        self._certs: Dict[str, Tuple[Tuple, Optional[Dict]]] = {}
+        # Layout mode the entries were resolved under, and the listing built from them
+        self._mode: Optional[str] = None
+        self._listing: Optional[List[Tuple[str, str]]] = None
+        self._saved_generation = 0
+
+    def track(self, cert_index) -> None:
+        """Persist cert_index's parsed certificates with the inventory"""
+        self.cert_index = cert_index
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        try:
+            snapshot = self._read()
+        except (OSError, ValueError, struct.error, UnicodeDecodeError):
+            snapshot = None
+        if snapshot:
+            self._dirs, self._entries, self._certs, self._mode = snapshot
+
+    def _read(self) -> Optional[Tuple[Dict, Dict, Dict, str]]:
+        with open(self.snapshot_file, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < _HEADER.size:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                magic, dir_count, domain_count, cert_count, string_size, sharded = _HEADER.unpack_from(data, 0)
+                if magic != MAGIC:
+                    return None
+                dir_start = _HEADER.size
+                domain_start = dir_start + dir_count * _DIR.size
+                cert_start = domain_start + domain_count * _DOMAIN.size
+                string_start = cert_start + cert_count * _CERT.size
+                if string_start + string_size != size:
+                    # Truncated or from a different version
+                    return None
+                strings = data[string_start:size]
+
+                dirs = {}
+                for offset, length, ino, dir_size, mtime_ns in _DIR.iter_unpack(data[dir_start:domain_start]):
+                    dirs[strings[offset:offset + length].decode()] = (ino, dir_size, mtime_ns)
+
+                entries = {}
+                layout = self.layout
+                # Flat paths are the common case and cheaper to build by hand than through os.path.join
+                conf_prefix = layout.sites_available + os.sep
+                link_prefix = layout.sites_enabled + os.sep
+                for offset, length, conf_ino, link_ino, created, flags in _DOMAIN.iter_unpack(data[domain_start:cert_start]):
+                    name = strings[offset:offset + length].decode()
+                    if flags & _CONF_SHARDED:
+                        conf_file = layout.conf_path(name, SHARDED)
+                    else:
+                        conf_file = f"{conf_prefix}{name}.conf"
+                    link_file = None
+                    if flags & _LINK_SHARDED:
+                        link_file = layout.link_path(name, SHARDED)
+                    elif flags & _HAS_LINK:
+                        link_file = f"{link_prefix}{name}.conf"
+                    entries[name] = InventoryEntry(conf_file, conf_ino, link_file, link_ino,
+                                                   bool(flags & _ENABLED), created)
+
+                certs = {}
+                for (path_offset, path_length, names_offset, names_length, ino, cert_size, mtime_ns,
+                     not_after, flags) in _CERT.iter_unpack(data[cert_start:string_start]):
+                    path = strings[path_offset:path_offset + path_length].decode()
+                    cert = None
+                    if flags & _PARSED:
+                        names = strings[names_offset:names_offset + names_length].decode()
+                        cert = {
+                            "path": path,
+                            "file_domain": os.path.basename(path)[:-len(".crt")],
+                            "names": names.split(",") if names else [],
+                            "not_after": datetime.fromtimestamp(not_after),
+                        }
+                    certs[path] = ((ino, cert_size, mtime_ns), cert)
+        return dirs, entries, certs, SHARDED if sharded else FLAT
+
+    def _save(self) -> None:
+        strings = _StringTable()
+
+        dir_records = []
+        for path, key in self._dirs.items():
+            dir_records.append(_DIR.pack(*strings.add(path), *key))
+
+        domain_records = []
+        sites_available = self.layout.sites_available
+        for name, entry in self._entries.items():
+            flags = _ENABLED if entry.enabled else 0
+            if os.path.dirname(entry.conf_file) != sites_available:
+                flags |= _CONF_SHARDED
+            if entry.link_file:
+                flags |= _HAS_LINK
+                if os.path.dirname(entry.link_file) != self.layout.sites_enabled:
+                    flags |= _LINK_SHARDED
+            domain_records.append(_DOMAIN.pack(*strings.add(name), entry.conf_ino, entry.link_ino,
+                                               entry.created, flags))
+
+        cert_records = []
+        parsed = self.cert_index.parsed_entries() if self.cert_index is not None else {}
+        for path, (key, cert) in parsed.items():
+            if cert is None:
+                cert_records.append(_CERT.pack(*strings.add(path), 0, 0, *key, 0.0, 0))
+            else:
+                cert_records.append(_CERT.pack(*strings.add(path), *strings.add(",".join(cert["names"])),
+                                               *key, cert["not_after"].timestamp(), _PARSED))
+
+        header = _HEADER.pack(MAGIC, len(dir_records), len(domain_records), len(cert_records), strings.size,
+                              self._mode == SHARDED)
+        os.makedirs(os.path.dirname(self.snapshot_file), exist_ok=True)
+        # Unique per thread as well, for the threads of one long-lived process
+        tmp_file = f"{self.snapshot_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'wb') as f:
+            f.write(header)
+            f.write(b"".join(dir_records))
+            f.write(b"".join(domain_records))
+            f.write(b"".join(cert_records))
+            f.write(b"".join(strings.parts))
+        os.replace(tmp_file, self.snapshot_file)
+
+    def certificates(self) -> Dict[str, Tuple[Tuple, Optional[Dict]]]:
+        """Parsed certificates from the snapshot, handed to the certificate index once"""
+        with self._lock:
+            self._load()
+            certs, self._certs = self._certs, {}
+            return certs
+
+    def _scan(self, root: str, dirs: Dict[str, Tuple[int, int, int]]) -> Dict[str, Dict[str, int]]:
+        """
+        Stat every recorded directory under root and list those whose stat
+        changed, plus any new subdirectories they contain.
+        Returns {directory: {file name: inode}} for the listed directories.
+        """
+        changed = {}
+        now_ns = time.time_ns()
+        prefix = root + os.sep
+        queue = [root] + [path for path in self._dirs if path.startswith(prefix)]
+        while queue:
+            directory = queue.pop()
+            if directory in dirs:
+                continue
+            try:
+                st = os.stat(directory)
+            except OSError:
+                continue
+            key = (st.st_ino, st.st_size, st.st_mtime_ns)
+            # Modified this close to now, it may change again within the same
+            # mtime tick; recorded as unverified, so the next call lists it again
+            dirs[directory] = key if now_ns - st.st_mtime_ns >= RACY_WINDOW_NS else (st.st_ino, st.st_size, -1)
+            if self._dirs.get(directory) == key:
+                continue
+
+            files = {}
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.name.startswith("."):
+                            continue
+                        if entry.is_dir(follow_symlinks=False):
+                            queue.append(entry.path)
+                        else:
+                            files[entry.name] = entry.inode()
+            except OSError:
+                del dirs[directory]
+                continue
+            changed[directory] = files
+        return changed
+
+    def _vhosts(self, dirs: Dict, changed: Dict[str, Dict[str, int]]) -> Dict[str, Tuple[str, int]]:
+        """domain -> (vhost path, inode), with the same flat/sharded precedence as SiteLayout.conf_files"""
+        root = self.layout.sites_available
+        flat = {}
+        sharded = {}
+
+        # Unchanged directories still hold exactly the domains recorded for them
+        for name, entry in self._entries.items():
+            directory = os.path.dirname(entry.conf_file)
+            if directory in dirs and directory not in changed:
+                (flat if directory == root else sharded)[name] = (entry.conf_file, entry.conf_ino)
+
+        for directory, files in changed.items():
+            if directory == root:
+                target = flat
+            elif os.path.dirname(os.path.dirname(directory)) == root:
+                target = sharded
+            else:
+                # Shard directories themselves hold no vhosts
+                continue
+            for file_name, ino in files.items():
+                if not file_name.endswith(".conf"):
+                    continue
+                name = file_name[:-len(".conf")]
+                # Names kept in the snapshot were accepted before
+                if name in self._entries or self.accept(name):
+                    target[name] = (os.path.join(directory, file_name), ino)
+
+        has_shards = any(directory != root for directory in dirs
+                         if directory.startswith(root + os.sep))
+        groups = [sharded, flat]
+        if has_shards and self.layout.mode == SHARDED:
+            groups.reverse()
+        found = {}
+        for group in groups:
+            found.update(group)
+        return found
+
+    def _links_unchanged(self, name: str, entry: InventoryEntry, dirs: Dict,
+                         changed: Dict[str, Dict[str, int]], sharded_links: bool) -> bool:
+        if entry.link_file and os.path.dirname(entry.link_file) not in dirs:
+            return False
+        for mode in (FLAT, SHARDED):
+            if mode == SHARDED and not sharded_links:
+                continue
+            link_file = self.layout.link_path(name, mode)
+            files = changed.get(os.path.dirname(link_file))
+            if files is None:
+                continue
+            ino = files.get(os.path.basename(link_file))
+            if link_file == entry.link_file:
+                if ino != entry.link_ino:
+                    return False
+            elif ino is not None:
+                # A link appeared where there was none
+                return False
+        return True
+
+    def _examine(self, name: str, conf_file: str, conf_ino: int, modes: List[str]) -> InventoryEntry:
+        link_file = None
+        link_ino = 0
+        for mode in modes:
+            path = self.layout.link_path(name, mode)
+            try:
+                link_ino = os.lstat(path).st_ino
+            except OSError:
+                continue
+            link_file = path
+            break
+        enabled = link_file is not None and os.path.exists(link_file)
+        try:
+            created = os.path.getctime(conf_file)
+        except OSError:
+            created = 0.0
+        return InventoryEntry(conf_file, conf_ino, link_file, link_ino, enabled, created)
+
+    def domains(self) -> List[Tuple[str, str]]:
+        """(domain, vhost path) for every per-domain vhost, sorted by name, revalidated against the directory stats"""
+        with self._lock:
+            self._load()
+            dirs: Dict[str, Tuple[int, int, int]] = {}
+            changed = self._scan(self.layout.sites_available, dirs)
+
+            link_changed = self._scan(self.layout.sites_enabled, dirs)
+            link_changed.update(self._scan(self.layout.sharded_enabled, dirs))
+            active = self.layout.mode
+
+            if not changed and not link_changed and dirs == self._dirs and active == self._mode:
+                # Nothing was listed again, so the recorded entries are the answer as they are
+                dirty = False
+            else:
+                vhosts = self._vhosts(dirs, changed)
+                sharded_links = self.layout.sharded_enabled in dirs
+                modes = [active, FLAT if active == SHARDED else SHARDED]
+
+                entries = {}
+                dirty = dirs != self._dirs or len(vhosts) != len(self._entries) or active != self._mode
+                for name in sorted(vhosts):
+                    conf_file, conf_ino = vhosts[name]
+                    entry = self._entries.get(name)
+                    if (entry is None or entry.conf_file != conf_file or entry.conf_ino != conf_ino
+                            or (link_changed and not self._links_unchanged(name, entry, dirs, link_changed, sharded_links))):
+                        entry = self._examine(name, conf_file, conf_ino, modes)
+                        dirty = True
+                    entries[name] = entry
+
+                self._dirs = dirs
+                self._entries = entries
+                self._mode = active
+                self._listing = None
+
+            generation = self.cert_index.generation if self.cert_index is not None else 0
+            if dirty or generation != self._saved_generation:
+                try:
+                    self._save()
+                    self._saved_generation = generation
+                except OSError as e:
+                    print(f"Error saving inventory snapshot: {e}", file=sys.stderr)
+            if self._listing is None:
+                self._listing = [(name, entry.conf_file) for name, entry in self._entries.items()]
+            # Callers extend the list they get
+            return list(self._listing)
+
+    def entry(self, name: str) -> Optional[InventoryEntry]:
+        """The entry for name as of the last domains() call"""
+        return self._entries.get(name)
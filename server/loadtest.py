@@ -0,0 +1,430 @@
+#!/usr/bin/env python3
+"""
+Load test for the HTTP -> Python bridge.
+
+Builds a synthetic nginx_config fleet in a scratch directory, puts stub
+nginx/systemctl/acme.sh/sudo binaries first on PATH, starts the Express
+server against it and drives an open-loop mix of GET/POST/DELETE requests
+at a fixed rate. The report is one JSON document with throughput and
+p50/p95/p99 latency per route, so runs can be diffed against each other.
+
+    python3 server/loadtest.py --fleet 1000 --rate 50 --duration 30 \
+        --mix list=30,get=30,search=10,stats=10,add=10,delete=10 --output run.json
+
+Requests are sent on schedule whether or not earlier ones have finished, and
+latency is measured from the scheduled send time, so a saturated server shows
+up as growing latency instead of a silently lower request rate.
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import signal
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ROUTES = {
+    "list": "GET /api/domains",
+    "get": "GET /api/domains/:id",
+    "search": "GET /api/domains/search",
+    "stats": "GET /api/domains/stats",
+    "add": "POST /api/domains",
+    "delete": "DELETE /api/domains/:id",
+}
+
+DEFAULT_MIX = "list=30,get=30,search=10,stats=10,add=10,delete=10"
+
+SCRIPTS = {
+    "secure": "secure_api.py",
+    "production": "production_api.py",
+}
+
+# Every stub records its arguments, so the report shows how often the managers shelled out
+_STUB = """#!/bin/sh
+echo "{name} $*" >> "{log}"
+{body}
+"""
+
+_STUB_BODIES = {
+    "nginx": 'case "$1" in -t) echo "nginx: configuration file test is successful" >&2;; esac\nexit 0',
+    "systemctl": "exit 0",
+    "acme.sh": "exit 0",
+    "sudo": 'exec "$@"',
+}
+
+
+def parse_mix(spec: str) -> Dict[str, int]:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ROUTES:
+            raise ValueError(f"Unknown route in mix: {name} (expected one of {', '.join(ROUTES)})")
+        if not weight.strip().isdigit():
+            raise ValueError(f"Mix weight for {name} must be a non-negative integer")
+        mix[name] = int(weight)
+    if not any(mix.values()):
+        raise ValueError("Mix needs at least one route with a positive weight")
+    return mix
+
+
+def percentile(ordered: List[float], pct: float) -> Optional[float]:
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return None
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def write_stubs(bin_dir: str, log_file: str) -> None:
+    os.makedirs(bin_dir, exist_ok=True)
+    for name, body in _STUB_BODIES.items():
+        path = os.path.join(bin_dir, name)
+        with open(path, 'w') as f:
+            f.write(_STUB.format(name=name, log=log_file, body=body))
+        os.chmod(path, os.stat(path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def build_fleet(workdir: str, size: int, ssl_every: int) -> List[str]:
+    """Write `size` vhosts into workdir/nginx_config the way the manager lays them out"""
+    sys.path.insert(0, os.path.join(REPO_DIR, "server"))
+    from secure_domain_manager import SecureDomainManager
+
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        manager = SecureDomainManager()
+        names = [f"site{i:05d}.loadtest.example" for i in range(size)]
+        for name in names:
+            conf_file = manager.layout.new_conf(name)
+            with open(conf_file, 'w') as f:
+                f.write(manager.generate_nginx_config(name))
+            manager.layout.enable(name, conf_file)
+
+        # One self-signed certificate copied to every ssl_every-th domain, so the
+        # certificate paths of the listing are exercised as well
+        if ssl_every and shutil.which("openssl"):
+            cert_file = os.path.join(workdir, "loadtest.crt")
+            key_file = os.path.join(workdir, "loadtest.key")
+            subprocess.run(
+                ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "90",
+                 "-subj", "/CN=loadtest.example", "-keyout", key_file, "-out", cert_file],
+                check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            for name in names[::ssl_every]:
+                shutil.copyfile(cert_file, os.path.join(manager.ssl_dir, f"{name}.crt"))
+                shutil.copyfile(key_file, os.path.join(manager.ssl_dir, f"{name}.key"))
+    finally:
+        os.chdir(cwd)
+    return names
+
+
+class ServerProcess:
+    """The Express server started from the repo, with the scratch directory as its working directory"""
+
+    def __init__(self, workdir: str, port: int, api: str, worker: bool, env_path: str):
+        self.workdir = workdir
+        self.port = port
+        self.log_file = os.path.join(workdir, "server.log")
+        self.env = dict(os.environ)
+        self.env.update({
+            "PATH": env_path,
+            "PORT": str(port),
+            "NODE_ENV": "development",
+            "DOMAIN_MANAGER_SCRIPT": os.path.join(REPO_DIR, "server", SCRIPTS[api]),
+        })
+        if worker:
+            self.env["DOMAIN_MANAGER_WORKER"] = "1"
+        else:
+            self.env.pop("DOMAIN_MANAGER_WORKER", None)
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self, timeout: float) -> str:
+        tsx = os.path.join(REPO_DIR, "node_modules", ".bin", "tsx")
+        if not os.path.exists(tsx):
+            raise RuntimeError("node_modules/.bin/tsx not found - run npm install first")
+
+        log = open(self.log_file, 'w')
+        self.process = subprocess.Popen(
+            [tsx, os.path.join(REPO_DIR, "server", "index.ts")],
+            cwd=self.workdir, env=self.env, stdout=log, stderr=subprocess.STDOUT,
+            start_new_session=True
+        )
+        log.close()
+
+        base_url = f"http://127.0.0.1:{self.port}"
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise RuntimeError(f"Server exited during startup, see {self.log_file}")
+            try:
+                with urllib.request.urlopen(f"{base_url}/api/domains/stats", timeout=2) as response:
+                    if response.status == 200:
+                        return base_url
+            except (urllib.error.URLError, OSError):
+                pass
+            time.sleep(0.25)
+        raise RuntimeError(f"Server did not answer within {timeout:.0f}s, see {self.log_file}")
+
+    def stop(self) -> None:
+        if self.process and self.process.poll() is None:
+            # tsx runs node as a child, so the whole group is signalled
+            os.killpg(self.process.pid, signal.SIGTERM)
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                os.killpg(self.process.pid, signal.SIGKILL)
+                self.process.wait()
+
+
+class LoadRun:
+    """Open-loop request schedule against a running server"""
+
+    def __init__(self, base_url: str, fleet: List[str], mix: Dict[str, int], concurrency: int,
+                 timeout: float, seed: int):
+        self.base_url = base_url
+        self.fleet = fleet
+        self.routes = [name for name in mix if mix[name] > 0]
+        self.weights = [mix[name] for name in self.routes]
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        # Domains this run added and has not deleted yet; deletes only ever remove these
+        self.created: List[str] = []
+        self.next_created = 0
+        self.samples: Dict[str, List] = {}
+
+    def _request(self, method: str, path: str, body: Optional[Dict] = None) -> int:
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(f"{self.base_url}{path}", data=data, method=method)
+        if data is not None:
+            request.add_header("Content-Type", "application/json")
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+        except (urllib.error.URLError, OSError):
+            # Connection refused, reset or timed out
+            return 0
+
+    def _pick(self) -> Dict:
+        """Choose the next request; a delete with nothing of ours left to delete becomes an add"""
+        with self.lock:
+            route = self.random.choices(self.routes, self.weights)[0]
+            if route == "delete" and not self.created:
+                route = "add"
+            if route == "add":
+                name = f"new{os.getpid()}-{self.next_created:06d}.loadtest.example"
+                self.next_created += 1
+                return {"route": route, "method": "POST", "path": "/api/domains",
+                        "body": {"name": name}, "created": name}
+            if route == "delete":
+                name = self.created.pop(self.random.randrange(len(self.created)))
+                return {"route": route, "method": "DELETE", "path": f"/api/domains/{name}"}
+            if route == "get":
+                return {"route": route, "method": "GET", "path": f"/api/domains/{self.random.choice(self.fleet)}"}
+            if route == "search":
+                prefix = self.random.choice(self.fleet)[:len("site000")]
+                return {"route": route, "method": "GET", "path": f"/api/domains/search?q={prefix}&mode=substring"}
+            if route == "stats":
+                return {"route": route, "method": "GET", "path": "/api/domains/stats"}
+            return {"route": route, "method": "GET", "path": "/api/domains"}
+
+    def _send(self, job: Dict, scheduled: float, measured: bool) -> None:
+        status = self._request(job["method"], job["path"], job.get("body"))
+        latency = time.monotonic() - scheduled
+        with self.lock:
+            if job.get("created") and status == 201:
+                self.created.append(job["created"])
+            if measured:
+                self.samples.setdefault(job["route"], []).append((latency, status))
+
+    def run(self, rate: float, duration: float, warmup: float) -> float:
+        """Send rate requests per second for warmup + duration seconds; returns the measured wall time"""
+        interval = 1.0 / rate
+        total = int((warmup + duration) * rate)
+        warmup_count = int(warmup * rate)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            start = time.monotonic()
+            for index in range(total):
+                scheduled = start + index * interval
+                delay = scheduled - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                pool.submit(self._send, self._pick(), scheduled, index >= warmup_count)
+        return time.monotonic() - (start + warmup)
+
+    def cleanup(self) -> None:
+        """Delete whatever this run added, outside the measured window"""
+        for name in self.created:
+            self._request("DELETE", f"/api/domains/{name}")
+        self.created = []
+
+    def report(self, elapsed: float) -> Dict:
+        routes = {}
+        all_latencies = []
+        total_errors = 0
+        total_rejected = 0
+        for route in self.routes:
+            samples = self.samples.get(route, [])
+            latencies = sorted(latency * 1000 for latency, _ in samples)
+            statuses: Dict[str, int] = {}
+            for _, status in samples:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+            # 429 and 503 are the server shedding load, reported apart from failures
+            rejected = sum(1 for _, status in samples if status in (429, 503))
+            errors = sum(1 for _, status in samples if status == 0 or (status >= 500 and status != 503))
+            total_errors += errors
+            total_rejected += rejected
+            all_latencies.extend(latencies)
+            routes[ROUTES[route]] = {
+                "requests": len(samples),
+                "errors": errors,
+                "rejected": rejected,
+                "status": statuses,
+                "throughput": round(len(samples) / elapsed, 2) if elapsed > 0 else None,
+                "latencyMs": _latency_summary(latencies),
+            }
+
+        all_latencies.sort()
+        return {
+            "requests": len(all_latencies),
+            "errors": total_errors,
+            "rejected": total_rejected,
+            "elapsed": round(elapsed, 3),
+            "throughput": round(len(all_latencies) / elapsed, 2) if elapsed > 0 else None,
+            "latencyMs": _latency_summary(all_latencies),
+            "routes": routes,
+        }
+
+
+def _latency_summary(ordered: List[float]) -> Dict:
+    summary = {"p50": percentile(ordered, 50), "p95": percentile(ordered, 95), "p99": percentile(ordered, 99),
+               "max": ordered[-1] if ordered else None}
+    return {key: round(value, 2) if value is not None else None for key, value in summary.items()}
+
+
+def _stub_calls(log_file: str) -> Dict[str, int]:
+    calls: Dict[str, int] = {}
+    try:
+        with open(log_file, 'r') as f:
+            for line in f:
+                name = line.split(" ", 1)[0]
+                calls[name] = calls.get(name, 0) + 1
+    except FileNotFoundError:
+        pass
+    return calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the domain API against a synthetic nginx_config fleet")
+    parser.add_argument("--fleet", type=int, default=500, help="domains in the synthetic fleet")
+    parser.add_argument("--ssl-every", type=int, default=4, help="give every Nth domain a certificate (0: none)")
+    parser.add_argument("--rate", type=float, default=20.0, help="requests per second")
+    parser.add_argument("--duration", type=float, default=30.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=5.0, help="unmeasured seconds before the measurement")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"route weights (default {DEFAULT_MIX})")
+    parser.add_argument("--concurrency", type=int, default=64, help="most requests in flight at once")
+    parser.add_argument("--timeout", type=float, default=30.0, help="per-request timeout in seconds")
+    parser.add_argument("--api", choices=sorted(SCRIPTS), default="secure", help="Python entry point behind the routes")
+    parser.add_argument("--worker", action="store_true", help="use the long-lived Python worker (DOMAIN_MANAGER_WORKER=1)")
+    parser.add_argument("--port", type=int, default=5055)
+    parser.add_argument("--url", help="test an already running server instead of starting one")
+    parser.add_argument("--workdir", help="scratch directory (default: a new temporary directory)")
+    parser.add_argument("--keep", action="store_true", help="keep the scratch directory afterwards")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.rate <= 0 or args.duration <= 0:
+        parser.error("--rate and --duration must be positive")
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="domain-loadtest-")
+    os.makedirs(workdir, exist_ok=True)
+    bin_dir = os.path.join(workdir, "bin")
+    stub_log = os.path.join(workdir, "stub-calls.log")
+    server = None
+    failed = False
+
+    try:
+        if args.url:
+            base_url = args.url.rstrip("/")
+            # The fleet of a server started elsewhere is whatever it already serves
+            with urllib.request.urlopen(f"{base_url}/api/domains?fields=name", timeout=args.timeout) as response:
+                fleet = [d["name"] for d in json.loads(response.read())]
+        else:
+            write_stubs(bin_dir, stub_log)
+            fleet = build_fleet(workdir, args.fleet, args.ssl_every)
+            server = ServerProcess(workdir, args.port, args.api, args.worker,
+                                   f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}")
+            print(f"Starting server in {workdir} ...", file=sys.stderr)
+            base_url = server.start(timeout=60)
+        if not fleet:
+            raise RuntimeError("The fleet is empty")
+
+        load = LoadRun(base_url, fleet, mix, args.concurrency, args.timeout, args.seed)
+        started_at = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime())
+        print(f"Sending {args.rate:g} req/s for {args.warmup:g}s warmup + {args.duration:g}s ...", file=sys.stderr)
+        elapsed = load.run(args.rate, args.duration, args.warmup)
+        load.cleanup()
+
+        report = {
+            "config": {
+                "fleet": len(fleet),
+                "rate": args.rate,
+                "duration": args.duration,
+                "warmup": args.warmup,
+                "mix": mix,
+                "concurrency": args.concurrency,
+                "api": None if args.url else args.api,
+                "worker": None if args.url else args.worker,
+                "url": args.url,
+                "seed": args.seed,
+            },
+            "startedAt": started_at,
+        }
+        report.update(load.report(elapsed))
+        if not args.url:
+            report["stubCalls"] = _stub_calls(stub_log)
+    except (RuntimeError, OSError, urllib.error.URLError, subprocess.CalledProcessError) as e:
+        failed = True
+        print(f"Load test failed: {e}", file=sys.stderr)
+    finally:
+        if server:
+            server.stop()
+        # A failed run keeps its scratch directory for server.log
+        if not args.keep and not args.workdir and not failed:
+            shutil.rmtree(workdir, ignore_errors=True)
+    if failed:
+        sys.exit(1)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
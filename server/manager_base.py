@@ -0,0 +1,1232 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import sys
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from typing import Dict, FrozenSet, Iterator, List, Optional, Set, Tuple
+
+from backend_health import BackendProber, config_backends, read_include_file, summarize_health
+from cert_index import CertificateIndex
+from change_feed import ChangeFeed
+from consolidated_vhosts import ConsolidatedVhosts, PLACEHOLDER_DOMAIN
+from domain_index import DomainIndex
+from domain_rules import domain_name_error
+from expiry_index import ExpiryIndex
+from fs_lock import LockManager
+from inventory_snapshot import Inventory, InventoryEntry
+from orphan_gc import OrphanCollector, referenced_ssl_files
+from record_fields import LIST_FIELDS, SSL_FIELDS, domain_id
+from request_cache import SingleFlightCache
+from site_layout import FLAT, SHARDED, SiteLayout
+from snapshot_store import SnapshotStore
+from tls_audit import TlsAuditor
+from tls_config import acme_commands, apply_tls, certificate_files, load_tls_profile, write_tls_snippet
+from traffic_log import TrafficAggregator, access_log_directive
+from upstreams import DEFAULT_UPSTREAM, UpstreamRegistry, upstream_name
+from vhost_template import (DEFAULT_PROFILE, PROFILE_NAMES, matches_template, render_vhost,
+                            upgrade_vhost, write_snippets)
+from vhost_drift import DriftDetector, normalize_config
+from write_journal import Journal
+
+# What the file-only managers ask the operator to run after a config change
+MANUAL_RELOAD_STEPS = [
+    "Run: sudo nginx -t",
+    "Run: sudo systemctl reload nginx"
+]
+
+
+class BaseDomainManager:
+    """
+    Domain, vhost and certificate management shared by every manager.
+
+    Subclasses choose the directories and how a config change reaches nginx:
+    _apply_config() tests and reloads it (or leaves that to the operator) and
+    _success() builds the result reported for the change.
+    """
+
+    def __init__(self, sites_available: str, sites_enabled: str, ssl_dir: str, access_log_dir: str,
+                 simulate_expiry: bool = True):
+        self.nginx_sites_available = sites_available
+        self.nginx_sites_enabled = sites_enabled
+        self.ssl_dir = ssl_dir
+        # acme.sh locations
+        self.webroot = "/var/www/letsencrypt"
+        self.acme_home = "/root/.acme.sh"
+
+        # Caches and other manager state live next to the nginx site directories
+        self.state_dir = os.path.join(os.path.dirname(self.nginx_sites_available), ".domain-manager")
+        self.locks = LockManager(os.path.join(self.state_dir, "locks"))
+        # Overrides for the TLS block written when a certificate is installed
+        self.tls_profile_file = os.path.join(self.state_dir, "tls-profile.json")
+        # Settings shared by all vhosts are included from here
+        self.snippets_dir = os.path.join(os.path.dirname(self.nginx_sites_available), "snippets")
+        # Flat or hash-sharded placement of per-domain vhosts and symlinks
+        self.layout = SiteLayout(self.nginx_sites_available, self.nginx_sites_enabled, self.state_dir)
+        # Keepalive upstream pools shared by all vhosts
+        self.upstreams = UpstreamRegistry(self.nginx_sites_available, self.nginx_sites_enabled)
+        # Per-domain access logs
+        self.access_log_dir = access_log_dir
+        self.traffic = TrafficAggregator(self.access_log_dir, os.path.join(self.state_dir, "traffic"))
+        # Connect checks for the upstreams and sockets the vhosts use, kept between requests
+        self.prober = BackendProber(os.path.join(self.state_dir, "backend-health.json"))
+        # Config writes go through a write-ahead journal; finish or undo any a crash interrupted
+        self.journal = Journal(os.path.join(self.state_dir, "journal"))
+        self.journal.recover()
+        # Every version of every vhost, deduplicated by normalized content
+        self.snapshots = SnapshotStore(os.path.join(self.state_dir, "snapshots"))
+        # Sequence-numbered domain changes for clients that apply deltas
+        self.changes = ChangeFeed(os.path.join(self.state_dir, "changes.log"),
+                                  os.path.join(self.state_dir, "changes-certs.json"))
+        # Vhosts, enabled links and parsed certificates persisted between processes,
+        # so a new process only revalidates what changed instead of rescanning
+        self.inventory = Inventory(os.path.join(self.state_dir, "inventory.bin"), self.layout, self._is_managed_name)
+        # Read results are shared between concurrent callers in a long-lived process;
+        # the stamp lets writes from other processes invalidate them
+        self.cache = SingleFlightCache(ttl=2.0, stale_ttl=10.0,
+                                       stamp_file=os.path.join(self.state_dir, "cache.stamp"))
+        # Optional shared server block for domains on the unmodified template
+        self.vhost_group = ConsolidatedVhosts(
+            self.nginx_sites_available,
+            self.nginx_sites_enabled,
+            os.path.join(os.path.dirname(self.nginx_sites_available), "consolidated")
+        )
+
+
+        # Certificates are parsed lazily and shared across all covered domains; without
+        # simulate_expiry, unparseable files are not treated as SSL
+        self.cert_index = CertificateIndex(self.ssl_dir, simulate_expiry=simulate_expiry,
+                                           preload=self.inventory.certificates)
+        self.inventory.track(self.cert_index)
+
+    def _apply_config(self) -> bool:
+        """Make nginx pick up the config just written; False when it rejected it"""
+        raise NotImplementedError
+
+    def _success(self, message: str, **extra) -> Dict:
+        """Result of a config change that _apply_config() accepted"""
+        raise NotImplementedError
+
+    def _ssl_on_add(self, server_name: str) -> Dict:
+        """Extra result fields for add_domain(install_ssl=True)"""
+        raise NotImplementedError
+
+    def validate_domain_name(self, domain: str) -> bool:
+        """Validate domain name format for security"""
+        # The rules shared with the API schema only allow letters, digits and
+        # inner hyphens in each label, which also rules out path traversal
+        return domain_name_error(domain) is None
+
+    def generate_nginx_config(self, server_name: str, upstream: str = DEFAULT_UPSTREAM,
+                              profile: str = DEFAULT_PROFILE, access_log: bool = False) -> str:
+        """Generate nginx configuration for domain"""
+        if not self.validate_domain_name(server_name):
+            raise ValueError("Invalid domain name")
+            
+        access_log_line = access_log_directive(self.access_log_dir, server_name) if access_log else None
+        return render_vhost(server_name, self.snippets_dir, upstream_name(upstream), profile, access_log_line)
+
+    def _write_shared_config(self, upstream: str = DEFAULT_UPSTREAM) -> None:
+        """Write the snippets and http-level upstreams that generated vhosts rely on"""
+        write_snippets(self.snippets_dir)
+        with self.locks.write(UpstreamRegistry.VHOST_NAME):
+            self.upstreams.ensure(upstream)
+
+    def _joins_group(self, upstream: str, profile: str, access_log: bool = False) -> bool:
+        """Whether a new domain goes into the consolidated server block instead of a vhost of its own"""
+        return (self.vhost_group.enabled and upstream == DEFAULT_UPSTREAM and profile == DEFAULT_PROFILE
+                and not access_log)
+
+    def add_domain(self, server_name: str, install_ssl: bool = False, upstream: str = DEFAULT_UPSTREAM,
+                   profile: str = DEFAULT_PROFILE, access_log: bool = False) -> Dict:
+        """Add new domain with nginx configuration"""
+        try:
+            if not self.validate_domain_name(server_name):
+                return {"success": False, "message": "Invalid domain name format"}
+
+            with self.locks.write(server_name):
+                # Check if domain already exists
+                file_path = self.layout.find_conf(server_name)
+                if os.path.exists(file_path) or self.vhost_group.contains(server_name):
+                    return {"success": False, "message": f"Domain {server_name} already exists"}
+
+                self._write_shared_config(upstream)
+                # Decided once, so a failed reload undoes exactly what this add did
+                grouped = self._joins_group(upstream, profile, access_log)
+                if grouped:
+                    # Consolidated mode: only the shared server_name include changes
+                    with self.locks.write(ConsolidatedVhosts.VHOST_NAME):
+                        self.vhost_group.add([server_name])
+                else:
+                    # Generate and write nginx configuration
+                    if access_log:
+                        os.makedirs(self.access_log_dir, exist_ok=True)
+                    config = self.generate_nginx_config(server_name, upstream, profile, access_log)
+                    file_path = self.layout.new_conf(server_name)
+                    # The vhost and its symlink appear together or not at all
+                    with self.journal.batch() as batch:
+                        batch.write(file_path, config)
+                        batch.symlink(file_path, self.layout.link_for(server_name, file_path))
+                    self._snapshot(server_name, "add")
+                self.cache.invalidate()
+                self._record_change("added", server_name)
+
+                if not self._apply_config():
+                    # Cleanup on failure
+                    if grouped:
+                        with self.locks.write(ConsolidatedVhosts.VHOST_NAME):
+                            self.vhost_group.remove(server_name)
+                    else:
+                        with self.journal.batch() as batch:
+                            batch.remove(self.layout.find_link(server_name))
+                            batch.remove(file_path)
+                    self.cache.invalidate()
+                    return {"success": False, "message": "Failed to reload nginx"}
+
+                result = self._success(f"Domain {server_name} configuration created", domain=server_name)
+                if install_ssl:
+                    result.update(self._ssl_on_add(server_name))
+                return result
+
+        except Exception as e:
+            return {"success": False, "message": f"Error adding domain: {str(e)}"}
+
+    def add_domains(self, server_names: List[str], upstream: str = DEFAULT_UPSTREAM,
+                    profile: str = DEFAULT_PROFILE) -> Dict:
+        """Add many domains at once: one lock, one journal batch and one change-feed append for all of them"""
+        try:
+            added = []
+            failed = []
+            with self.locks.exclusive():
+                self._write_shared_config(upstream)
+                consolidated = self._joins_group(upstream, profile)
+                # Consolidated names and names earlier in this call, checked without rereading the include
+                taken = set(self.vhost_group.names()) if self.vhost_group.enabled else set()
+
+                with self.journal.batch() as batch:
+                    for server_name in server_names:
+                        if not self.validate_domain_name(server_name):
+                            failed.append({"name": server_name, "error": "Invalid domain name format"})
+                            continue
+                        if server_name in taken or os.path.exists(self.layout.find_conf(server_name)):
+                            failed.append({"name": server_name, "error": "already exists"})
+                            continue
+                        if not consolidated:
+                            file_path = self.layout.new_conf(server_name)
+                            batch.write(file_path, self.generate_nginx_config(server_name, upstream, profile))
+                            batch.symlink(file_path, self.layout.link_for(server_name, file_path))
+                        added.append(server_name)
+                        taken.add(server_name)
+
+                if consolidated and added:
+                    self.vhost_group.add(added)
+                elif added:
+                    for server_name in added:
+                        self._snapshot(server_name, "import")
+                self.cache.invalidate()
+                if added:
+                    self._record_change("added", *added)
+
+                # One test and reload for the whole chunk; a failure takes all of it back out
+                if added and not self._apply_config():
+                    if consolidated:
+                        for server_name in added:
+                            self.vhost_group.remove(server_name)
+                    else:
+                        with self.journal.batch() as batch:
+                            for server_name in added:
+                                batch.remove(self.layout.find_conf(server_name))
+                                batch.remove(self.layout.find_link(server_name))
+                        for server_name in added:
+                            self._snapshot(server_name, "import rolled back")
+                    self.cache.invalidate()
+                    failed.extend({"name": server_name, "error": "Failed to reload nginx"} for server_name in added)
+                    added = []
+
+            return self._success(f"Added {len(added)} domains, {len(failed)} failed", added=added, failed=failed)
+
+        except Exception as e:
+            return {"success": False, "message": f"Error adding domains: {str(e)}"}
+
+    def get_ssl_expiry_info(self, domain: str, full_scan: bool = True) -> Dict:
+        """Get SSL certificate expiry information from the covering certificate"""
+        if not self.validate_domain_name(domain):
+            return {"has_ssl": False, "status": "no_ssl"}
+
+        try:
+            # Own {domain}.crt first, then any SAN or wildcard certificate covering it
+            cert = self.cert_index.lookup(domain, full_scan)
+            if cert is None:
+                return {"has_ssl": False, "status": "no_ssl"}
+
+            expiry_date = cert["not_after"]
+            
+            # Calculate days left from today to expiry
+            today = datetime.now()
+            days_left = (expiry_date - today).days
+            
+            if days_left < 0:
+                status = "expired"
+            elif days_left <= 30:
+                status = "expiring_soon"
+            else:
+                status = "valid"
+
+            return {
+                "has_ssl": True,
+                "status": status,
+                "expiry_date": expiry_date.strftime('%Y-%m-%d'),
+                "days_left": days_left,
+                "covered_by": cert["file_domain"] if cert["file_domain"] != domain else None
+            }
+
+        except Exception as e:
+            return {"has_ssl": False, "status": "no_ssl"}
+
+    def _is_managed_name(self, domain_name: str) -> bool:
+        """Whether a vhost file in sites-available belongs to a managed domain"""
+        # Skip default nginx configs
+        if domain_name in ['default', 'default-ssl', ConsolidatedVhosts.VHOST_NAME, UpstreamRegistry.VHOST_NAME,
+                               UpstreamRegistry.LEGACY_VHOST_NAME]:
+            return False
+        return self.validate_domain_name(domain_name)
+
+    def _conf_files(self) -> List[Tuple[str, str]]:
+        """Return (domain name, config path) for every managed vhost in sites-available"""
+        # Flat and sharded vhosts, revalidated against the persisted inventory
+        result = self.inventory.domains()
+            
+        # Domains served by the shared consolidated server block
+        if self.vhost_group.enabled:
+            for domain_name in self.vhost_group.names():
+                result.append((domain_name, self.vhost_group.conf_file))
+            
+        return result
+
+    def _domain_record(self, domain_name: str, conf_file: str, full_scan: bool = True, fields: Optional[FrozenSet[str]] = None,
+                       entry: Optional[InventoryEntry] = None) -> Dict:
+        """Build the domain record returned by list and get, limited to fields when given"""
+        domain_info = {
+            "id": domain_id(domain_name),
+            "name": domain_name
+        }
+
+        # Each remaining field costs a stat or a certificate lookup, so only requested ones are built
+        if fields is None or "enabled" in fields:
+            # Check if enabled (consolidated domains follow the shared vhost)
+            if entry is not None:
+                # Already revalidated by the inventory
+                domain_info["enabled"] = entry.enabled
+            elif conf_file == self.vhost_group.conf_file:
+                domain_info["enabled"] = os.path.exists(self.vhost_group.link_file)
+            else:
+                domain_info["enabled"] = os.path.exists(self.layout.find_link(domain_name))
+
+        if fields is None or fields & SSL_FIELDS:
+            # Get SSL information
+            ssl_info = self.get_ssl_expiry_info(domain_name, full_scan)
+            domain_info["sslStatus"] = ssl_info["status"]
+            domain_info["sslExpiryDate"] = ssl_info.get("expiry_date")
+            domain_info["daysToExpire"] = ssl_info.get("days_left")
+            domain_info["sslCoveredBy"] = ssl_info.get("covered_by")
+
+        if fields is None or "createdAt" in fields:
+            created = entry.created if entry is not None else os.path.getctime(conf_file)
+            domain_info["createdAt"] = datetime.fromtimestamp(created).isoformat()
+
+        if fields is not None:
+            return {field: domain_info[field] for field in LIST_FIELDS if field in fields}
+        return domain_info
+
+    def get_domain(self, domain_name: str) -> Optional[Dict]:
+        """Get a single domain, touching only its own config, symlink and certificate"""
+        if not self.validate_domain_name(domain_name):
+            return None
+
+        conf_file = self.layout.find_conf(domain_name)
+        with self.locks.read():
+            if not os.path.exists(conf_file):
+                if not self.vhost_group.contains(domain_name):
+                    return None
+                conf_file = self.vhost_group.conf_file
+
+            return self._domain_record(domain_name, conf_file, full_scan=False)
+
+    def list_domains(self, fields: Optional[FrozenSet[str]] = None) -> List[Dict]:
+        """List all domains from nginx sites-available (file operations only); fields limits each record to those keys"""
+        if fields is None:
+            return self.cache.get("list", self._scan_domains)
+        return self.cache.get(("list", fields), lambda: self._scan_domains(fields))
+
+    def _scan_domains(self, fields: Optional[FrozenSet[str]] = None) -> List[Dict]:
+        """Scan sites-available and build the record of every domain"""
+        domains = []
+        
+        try:
+            # Check if sites-available directory exists
+            if not os.path.exists(self.nginx_sites_available):
+                return []
+
+            domains.extend(self.iter_domains(fields))
+
+        except Exception as e:
+            print(f"Error listing domains: {e}", file=sys.stderr)
+            
+        return domains
+
+    def iter_domains(self, fields: Optional[FrozenSet[str]] = None) -> Iterator[Dict]:
+        """Build domain records one at a time, for exports too large to hold as one list"""
+        with self.locks.read():
+            # Parse every certificate once for the whole listing and look each domain up in that scan
+            scan = self.cert_index.scanned() if fields is None or fields & SSL_FIELDS else nullcontext()
+            with scan:
+                for domain_name, conf_file in self._conf_files():
+                    entry = self.inventory.entry(domain_name)
+                    if entry is not None and entry.conf_file != conf_file:
+                        entry = None
+                    yield self._domain_record(domain_name, conf_file, fields=fields, entry=entry)
+
+    def search_domains(self, query: str, mode: str = "suffix", limit: int = 50, offset: int = 0) -> Dict:
+        """Search domain names: suffix (parent domain), exact or substring matches"""
+        limit = max(1, min(limit, 1000))
+        offset = max(0, offset)
+        index = self.cache.get("name_index", self._build_name_index)
+        result = index.search(query, mode, limit, offset)
+
+        records = []
+        with self.locks.read():
+            for name in result["names"]:
+                conf_file = index.path(name)
+                # The index may be a few seconds old; skip names deleted since
+                if os.path.exists(conf_file):
+                    records.append(self._domain_record(name, conf_file, full_scan=False))
+
+        return {"total": result["total"], "offset": offset, "limit": limit, "domains": records}
+
+    def _build_name_index(self) -> DomainIndex:
+        """Reversed-label index over every managed domain name"""
+        with self.locks.read():
+            return DomainIndex(self._conf_files())
+
+    def expiring_domains(self, within_days: Optional[int] = None, expired_for: Optional[int] = None,
+                         limit: int = 50, offset: int = 0) -> Dict:
+        """Domains whose certificates expire in the next within_days, or expired over expired_for days ago"""
+        limit = max(1, min(limit, 1000))
+        offset = max(0, offset)
+        now = datetime.now()
+        if expired_for is not None:
+            start, end = None, now - timedelta(days=expired_for)
+        else:
+            start, end = now, now + timedelta(days=30 if within_days is None else within_days)
+
+        index = self.cache.get("expiry_index", self._build_expiry_index)
+        page = index.range(start, end, limit, offset)
+
+        records = []
+        with self.locks.read():
+            for _, domain_name in page["entries"]:
+                conf_file = index.path(domain_name)
+                # The index may be a few seconds old; skip domains deleted since
+                if os.path.exists(conf_file):
+                    records.append(self._domain_record(domain_name, conf_file))
+
+        return {
+            "total": page["total"],
+            "offset": offset,
+            "limit": limit,
+            "from": start.isoformat() if start else None,
+            "until": end.isoformat(),
+            "domains": records
+        }
+
+    def _build_expiry_index(self) -> ExpiryIndex:
+        """Sorted (notAfter, domain) index over every domain with a covering certificate"""
+        entries = []
+        with self.locks.read(), self.cert_index.scanned():
+            for domain_name, conf_file in self._conf_files():
+                cert = self.cert_index.lookup(domain_name)
+                if cert is not None:
+                    entries.append((cert["not_after"], domain_name, conf_file))
+        return ExpiryIndex(entries)
+
+    def traffic_stats(self, domain: Optional[str] = None, since_hours: Optional[int] = None,
+                      limit: int = 50) -> Dict:
+        """Fold new access log lines into the traffic counters and report them"""
+        # One aggregator run at a time; each only reads bytes added since the last
+        with self.locks.write("_traffic"):
+            self.traffic.update()
+
+        since = int(datetime.now().timestamp()) - since_hours * 3600 if since_hours else None
+        if domain is not None:
+            buckets = self.traffic.buckets(domain)
+            return {
+                "name": domain,
+                "totals": TrafficAggregator.summarize(buckets, since),
+                "series": TrafficAggregator.series(buckets, since)
+            }
+
+        rows = [{"name": name, **TrafficAggregator.summarize(buckets, since)}
+                for name, buckets in self.traffic.all_buckets().items()]
+        rows.sort(key=lambda row: (-row["requests"], row["name"]))
+        return {
+            "bucketSeconds": self.traffic.bucket_seconds,
+            "total": len(rows),
+            "domains": rows[:max(1, min(limit, 1000))]
+        }
+
+    def backend_health(self, refresh: bool = False) -> Dict:
+        """Probe every distinct upstream and socket the vhosts use, once each"""
+        usage = self.cache.get("backends", self._collect_backends)
+        return summarize_health(usage, self.prober.probe(list(usage), refresh))
+
+    def _collect_backends(self) -> Dict[str, List[str]]:
+        """Map each backend address to the domains whose vhost uses it"""
+        upstreams = {upstream_name(address): address for address in self.upstreams.addresses()}
+        includes: Dict[str, str] = {}
+
+        def read_include(path: str) -> str:
+            if path not in includes:
+                includes[path] = read_include_file(path)
+            return includes[path]
+
+        usage: Dict[str, List[str]] = {}
+        by_file: Dict[str, set] = {}
+        with self.locks.read():
+            for domain_name, conf_file in self._conf_files():
+                # Consolidated domains share one file, which is read once
+                if conf_file not in by_file:
+                    with open(conf_file, 'r') as f:
+                        by_file[conf_file] = config_backends(f.read(), upstreams, read_include)
+                for backend in by_file[conf_file]:
+                    usage.setdefault(backend, []).append(domain_name)
+        return usage
+
+    def _record_change(self, event_type: str, *domains: str) -> None:
+        """Append to the change feed; the mutation itself has already succeeded"""
+        try:
+            with self.locks.write("_changes"):
+                self.changes.append([(event_type, domain) for domain in domains])
+        except Exception as e:
+            print(f"Error recording change: {e}", file=sys.stderr)
+
+    def changes_since(self, seq: int, limit: int = 500) -> Dict:
+        """Domain changes after seq, with the current record of each domain still present"""
+        with self.locks.write("_changes"):
+            # Certificates installed or renewed outside the manager become events here
+            renewed = self.changes.certificate_changes(self.ssl_dir)
+            if renewed:
+                self.changes.append([("cert_changed", name) for name in renewed])
+                self.cache.invalidate()
+
+        feed = self.changes.since(seq, max(1, min(limit, 1000)))
+        records = {}
+        for event in feed["events"]:
+            if event["type"] != "removed" and event["name"] not in records:
+                records[event["name"]] = self.get_domain(event["name"])
+        # None for domains removed again after the event
+        feed["records"] = records
+        return feed
+
+    def audit_tls(self, failing_only: bool = True) -> Dict:
+        """Check every certificate in the ssl directory: key match, chain and name coverage"""
+        auditor = TlsAuditor(os.path.join(self.state_dir, "tls-audit.json"))
+        certificates = []
+        with self.locks.read():
+            try:
+                with os.scandir(self.ssl_dir) as entries:
+                    cert_names = sorted(entry.name for entry in entries if entry.name.endswith(".crt"))
+            except FileNotFoundError:
+                cert_names = []
+
+            for name in cert_names:
+                stem = name[:-len(".crt")]
+                # Extra key types are installed as {domain}.ecc.crt and {domain}.rsa.crt
+                domain = stem[:-4] if stem.endswith((".ecc", ".rsa")) else stem
+                conf_file = self.layout.find_conf(domain)
+                certificates.append((
+                    domain,
+                    os.path.join(self.ssl_dir, name),
+                    os.path.join(self.ssl_dir, f"{stem}.key"),
+                    conf_file if os.path.exists(conf_file) else None
+                ))
+            report = auditor.run(certificates)
+
+        if failing_only:
+            report["certificates"] = [entry for entry in report["certificates"] if not entry["ok"]]
+        return report
+
+    def detect_drift(self, include_diff: bool = True) -> Dict:
+        """Report domains whose configs deviate from what generate_nginx_config produces"""
+        detector = DriftDetector(
+            self.generate_nginx_config,
+            os.path.join(self.state_dir, "drift-cache.json")
+        )
+        with self.locks.read():
+            conf_files = [(name, path) for name, path in self._conf_files() if path != self.vhost_group.conf_file]
+            return detector.detect(conf_files, include_diff)
+
+    def _orphan_collector(self) -> OrphanCollector:
+        return OrphanCollector(self.ssl_dir, self.acme_home,
+                               [self.layout.sites_enabled, self.layout.sharded_enabled],
+                               self.cert_index.own_certificate)
+
+    def _live_vhosts(self) -> Tuple[Set[str], List[str]]:
+        """Names every vhost in sites-available serves, managed or not, and the vhost files"""
+        conf_files = self.layout.conf_files()
+        live = {name for name, _ in conf_files}
+        if self.vhost_group.enabled:
+            live.update(self.vhost_group.names())
+        return live, [path for _, path in conf_files]
+
+    def collect_garbage(self, dry_run: bool = True) -> Dict:
+        """Find, and unless dry_run remove, what deleted domains left behind"""
+        try:
+            with self.locks.exclusive():
+                live, conf_paths = self._live_vhosts()
+                orphans = self._orphan_collector().scan(live, referenced_ssl_files(conf_paths))
+                report = OrphanCollector.summarize(orphans)
+
+                if dry_run:
+                    message = f"Found {len(orphans)} orphaned files, orders and links ({report['reclaimableBytes']} bytes)"
+                    if orphans:
+                        message += ". Run gc with dry_run=false to remove them."
+                    return {"success": True, "message": message, "dryRun": True, **report, "orphans": orphans}
+
+                failed = OrphanCollector.remove(orphans, self.journal)
+                for orphan in orphans:
+                    if orphan["kind"] == "dangling_link":
+                        self.layout.prune(orphan["name"])
+                self.cache.invalidate()
+
+                return {
+                    "success": not failed,
+                    "message": f"Removed {len(orphans) - len(failed)} orphaned files, orders and links",
+                    "dryRun": False,
+                    **report,
+                    "orphans": orphans,
+                    "failed": failed
+                }
+
+        except Exception as e:
+            return {"success": False, "message": f"Error collecting garbage: {str(e)}"}
+
+    def _clean_up_after(self, domain_name: str) -> List[str]:
+        """Remove the certificate files and acme.sh orders of a deleted domain that no other vhost uses"""
+        live, _ = self._live_vhosts()
+        orphans = self._orphan_collector().scan(live, only={domain_name})
+        failed = {failure["path"] for failure in OrphanCollector.remove(orphans, self.journal)}
+        return [orphan["path"] for orphan in orphans if orphan["path"] not in failed]
+
+    def _write_config(self, path: str, content: str, reason: str) -> None:
+        """Replace a domain's vhost atomically, keeping the old and new versions as snapshots"""
+        domain = os.path.basename(path)[:-len(".conf")]
+        # Vhosts written before snapshots existed get their prior version recorded first
+        self._snapshot(domain, f"before {reason}")
+        with self.journal.batch() as batch:
+            batch.write(path, content)
+        self._snapshot(domain, reason)
+
+    def _snapshot(self, domain: str, reason: str) -> None:
+        """Record the domain's vhost as it is on disk now, if it changed"""
+        try:
+            conf_file = self.layout.find_conf(domain)
+            content = None
+            if os.path.exists(conf_file):
+                with open(conf_file, 'r') as f:
+                    content = f.read()
+            enabled = os.path.lexists(self.layout.find_link(domain))
+            self.snapshots.record(domain, content, enabled, reason)
+        except Exception as e:
+            print(f"Error recording snapshot: {e}", file=sys.stderr)
+
+    def _split_from_group(self, domain: str) -> None:
+        """Give a consolidated domain its own vhost file again"""
+        self._write_shared_config()
+        conf_file = self.layout.new_conf(domain)
+        with self.journal.batch() as batch:
+            batch.write(conf_file, self.generate_nginx_config(domain))
+            batch.symlink(conf_file, self.layout.link_for(domain, conf_file))
+
+        with self.locks.write(ConsolidatedVhosts.VHOST_NAME):
+            self.vhost_group.remove(domain)
+        self.cache.invalidate()
+
+    def set_consolidated_mode(self, enabled: bool) -> Dict:
+        """Switch between one vhost per domain and a shared server block for template domains"""
+        try:
+            with self.locks.exclusive():
+                self._write_shared_config()
+                if enabled:
+                    # (Re)render the shared block from the current template
+                    self.vhost_group.enable(self.generate_nginx_config(PLACEHOLDER_DOMAIN), self.journal)
+
+                    # Move every enabled domain still on the untouched template into it
+                    moved = []
+                    for domain_name, conf_file in self._conf_files():
+                        link_path = self.layout.find_link(domain_name)
+                        if conf_file == self.vhost_group.conf_file or not os.path.islink(link_path):
+                            continue
+
+                        with open(conf_file, 'r') as f:
+                            config = f.read()
+                        if matches_template(config, self.generate_nginx_config(domain_name)):
+                            moved.append((domain_name, conf_file, link_path))
+
+                    self.vhost_group.add([domain_name for domain_name, _, _ in moved])
+                    with self.journal.batch() as batch:
+                        for domain_name, conf_file, link_path in moved:
+                            batch.remove(link_path)
+                            batch.remove(conf_file)
+                    for domain_name, _, _ in moved:
+                        self.layout.prune(domain_name)
+
+                    message = f"Consolidated {len(moved)} domains into the shared server block"
+                else:
+                    members = list(self.vhost_group.names()) if self.vhost_group.enabled else []
+                    # Every restored vhost and symlink is committed as one batch
+                    with self.journal.batch() as batch:
+                        for domain_name in members:
+                            conf_file = self.layout.new_conf(domain_name)
+                            batch.write(conf_file, self.generate_nginx_config(domain_name))
+                            batch.symlink(conf_file, self.layout.link_for(domain_name, conf_file))
+
+                    self.vhost_group.disable()
+                    message = f"Restored individual vhosts for {len(members)} domains"
+
+                self.cache.invalidate()
+
+            if not self._apply_config():
+                return {"success": False, "message": f"{message}, but nginx reload failed"}
+
+            return self._success(message)
+
+        except Exception as e:
+            return {"success": False, "message": f"Error switching consolidated mode: {str(e)}"}
+
+    def migrate_vhosts(self) -> Dict:
+        """Rewrite vhosts still on an earlier generated template to the current one"""
+        try:
+            with self.locks.exclusive():
+                self._write_shared_config()
+                migrated = []
+                skipped = []
+
+                # Every rewritten vhost is committed as one batch
+                with self.journal.batch() as batch:
+                    for domain_name, conf_file in self._conf_files():
+                        if conf_file == self.vhost_group.conf_file:
+                            continue
+
+                        with open(conf_file, 'r') as f:
+                            config = f.read()
+
+                        upgraded = upgrade_vhost(config, domain_name, self.snippets_dir, upstream_name(DEFAULT_UPSTREAM))
+                        if upgraded is not None:
+                            self._snapshot(domain_name, "before migrate")
+                            batch.write(conf_file, upgraded)
+                            migrated.append(domain_name)
+                        elif normalize_config(config) != normalize_config(self.generate_nginx_config(domain_name)):
+                            # Hand-edited vhosts are left for manual review
+                            skipped.append(domain_name)
+
+                for domain_name in migrated:
+                    self._snapshot(domain_name, "migrate")
+
+                # The consolidated block is rendered from the template as well
+                if self.vhost_group.enabled:
+                    self.vhost_group.enable(self.generate_nginx_config(PLACEHOLDER_DOMAIN), self.journal)
+
+                self.cache.invalidate()
+                message = f"Migrated {len(migrated)} vhosts to the current template"
+
+            if not self._apply_config():
+                return {"success": False, "message": f"{message}, but nginx reload failed"}
+
+            return self._success(message, skipped=skipped)
+
+        except Exception as e:
+            return {"success": False, "message": f"Error migrating vhosts: {str(e)}"}
+
+    def set_layout(self, layout: str) -> Dict:
+        """Move per-domain vhosts between the flat and sharded layouts while the tree stays in use"""
+        try:
+            if layout not in (FLAT, SHARDED):
+                return {"success": False, "message": f"Unknown layout: {layout}"}
+
+            # New domains go to the target layout from here on
+            with self.locks.exclusive():
+                self.layout.set_mode(layout)
+
+            # Each domain moves under its own lock, so other domains stay writable meanwhile
+            moved = 0
+            for domain_name, conf_file in self._conf_files():
+                if conf_file == self.vhost_group.conf_file:
+                    continue
+                with self.locks.write(domain_name):
+                    if self.layout.relocate(domain_name, layout, self.journal):
+                        moved += 1
+                        self.cache.invalidate()
+
+            with self.locks.exclusive():
+                self.layout.finish(layout)
+            self.cache.invalidate()
+            message = f"Moved {moved} vhosts to the {layout} layout"
+
+            if not self._apply_config():
+                return {"success": False, "message": f"{message}, but nginx reload failed"}
+
+            return self._success(message)
+
+        except Exception as e:
+            return {"success": False, "message": f"Error changing layout: {str(e)}"}
+
+    def set_upstream(self, domain: str, upstream: str) -> Dict:
+        """Point a domain's proxy at another backend address"""
+        try:
+            if not self.validate_domain_name(domain):
+                return {"success": False, "message": "Invalid domain name format"}
+
+            name = upstream_name(upstream)
+
+            with self.locks.write(domain):
+                conf_file = self.layout.find_conf(domain)
+
+                # Only domains on the default backend can share the consolidated block
+                if not os.path.exists(conf_file) and self.vhost_group.contains(domain):
+                    self._split_from_group(domain)
+
+                if not os.path.exists(conf_file):
+                    return {"success": False, "message": f"Domain configuration not found"}
+
+                self._write_shared_config(upstream)
+
+                with open(conf_file, 'r') as f:
+                    config = f.read()
+
+                config, count = re.subn(r'^(\s*proxy_pass\s+)http://[^;\s]+;', rf'\g<1>http://{name};', config, flags=re.MULTILINE)
+                if count == 0:
+                    return {"success": False, "message": "No proxy_pass found in domain configuration"}
+
+                self._write_config(conf_file, config, "set_upstream")
+                self.cache.invalidate()
+
+                if not self._apply_config():
+                    return {"success": False, "message": "Upstream updated but nginx reload failed"}
+
+                return self._success(f"Domain {domain} now proxies to {upstream}")
+
+        except Exception as e:
+            return {"success": False, "message": f"Error setting upstream: {str(e)}"}
+
+    def set_profile(self, domain: str, profile: str) -> Dict:
+        """Switch a domain to another performance profile"""
+        try:
+            if not self.validate_domain_name(domain):
+                return {"success": False, "message": "Invalid domain name format"}
+
+            if profile not in PROFILE_NAMES:
+                return {"success": False, "message": f"Unknown performance profile: {profile}"}
+
+            with self.locks.write(domain):
+                conf_file = self.layout.find_conf(domain)
+
+                # Only domains on the default profile can share the consolidated block
+                if not os.path.exists(conf_file) and self.vhost_group.contains(domain):
+                    self._split_from_group(domain)
+
+                if not os.path.exists(conf_file):
+                    return {"success": False, "message": f"Domain configuration not found"}
+
+                self._write_shared_config()
+
+                with open(conf_file, 'r') as f:
+                    config = f.read()
+
+                include = f"include {self.snippets_dir}/profile-{profile}.conf;"
+                config, count = re.subn(r'^(\s*)include\s+\S+/profile-[a-z-]+\.conf;', lambda m: m.group(1) + include, config, flags=re.MULTILINE)
+                if count == 0:
+                    # Vhosts written before profiles existed get the include appended to the server block
+                    config, count = re.subn(r'^}[ \t]*$', lambda m: f"    {include}\n}}", config, count=1, flags=re.MULTILINE)
+                if count == 0:
+                    return {"success": False, "message": "No server block found in domain configuration"}
+
+                self._write_config(conf_file, config, "set_profile")
+                self.cache.invalidate()
+
+                if not self._apply_config():
+                    return {"success": False, "message": "Profile updated but nginx reload failed"}
+
+                return self._success(f"Domain {domain} now uses the {profile} profile")
+
+        except Exception as e:
+            return {"success": False, "message": f"Error setting profile: {str(e)}"}
+
+    def set_access_log(self, domain: str, enabled: bool) -> Dict:
+        """Turn the per-domain traffic access log on or off"""
+        try:
+            if not self.validate_domain_name(domain):
+                return {"success": False, "message": "Invalid domain name format"}
+
+            with self.locks.write(domain):
+                conf_file = self.layout.find_conf(domain)
+
+                # Consolidated domains have no server block of their own to log from
+                if not os.path.exists(conf_file) and self.vhost_group.contains(domain):
+                    self._split_from_group(domain)
+
+                if not os.path.exists(conf_file):
+                    return {"success": False, "message": f"Domain configuration not found"}
+
+                self._write_shared_config()
+
+                with open(conf_file, 'r') as f:
+                    config = f.read()
+
+                config = re.sub(r'^[ \t]*access_log \S+ domain_traffic [^\n]*\n', '', config, flags=re.MULTILINE)
+                if enabled:
+                    os.makedirs(self.access_log_dir, exist_ok=True)
+                    directive = access_log_directive(self.access_log_dir, domain)
+                    # Into the main server block, right after its server_name
+                    config, count = re.subn(
+                        rf'^([ \t]*server_name {re.escape(domain)}[ ;][^\n]*\n)',
+                        lambda m: f"{m.group(1)}    {directive}\n", config, count=1, flags=re.MULTILINE
+                    )
+                    if count == 0:
+                        return {"success": False, "message": "No server_name found in domain configuration"}
+
+                self._write_config(conf_file, config, "set_access_log")
+                self.cache.invalidate()
+
+                if not self._apply_config():
+                    return {"success": False, "message": "Access log updated but nginx reload failed"}
+
+                return self._success(f"Access log {'enabled' if enabled else 'disabled'} for {domain}")
+
+        except Exception as e:
+            return {"success": False, "message": f"Error setting access log: {str(e)}"}
+
+    def snapshot_history(self, domain: Optional[str] = None) -> Dict:
+        """Recorded versions of one domain's vhost, or the size of the snapshot store"""
+        if domain is None:
+            return self.snapshots.stats()
+        return {"name": domain, "versions": self.snapshots.history(domain)}
+
+    def _restore_into(self, batch, domain: str, entry: Optional[Dict]) -> bool:
+        """Stage the domain's vhost and symlink as recorded in entry (None: absent); False if already so"""
+        content = self.snapshots.content(domain, entry) if entry else None
+        enabled = bool(entry and entry["enabled"] and content is not None)
+
+        conf_file = self.layout.find_conf(domain)
+        current = None
+        if os.path.exists(conf_file):
+            with open(conf_file, 'r') as f:
+                current = f.read()
+        link_path = self.layout.find_link(domain)
+        if current == content and os.path.lexists(link_path) == enabled:
+            return False
+
+        if content is None:
+            if os.path.lexists(link_path):
+                batch.remove(link_path)
+            if current is not None:
+                batch.remove(conf_file)
+            return True
+
+        if current is None:
+            conf_file = self.layout.new_conf(domain)
+            link_path = self.layout.link_for(domain, conf_file)
+        batch.write(conf_file, content)
+        if enabled:
+            batch.symlink(conf_file, link_path)
+        elif os.path.lexists(link_path):
+            batch.remove(link_path)
+        return True
+
+    def restore_domain(self, domain: str, version: Optional[int] = None, at: Optional[float] = None) -> Dict:
+        """Put a domain's vhost back to a recorded version, by number or point in time"""
+        try:
+            with self.locks.write(domain):
+                entry = self.snapshots.version(domain, version, at)
+                if entry is None:
+                    return {"success": False, "message": f"No recorded version of {domain} matches"}
+
+                existed = os.path.exists(self.layout.find_conf(domain)) or self.vhost_group.contains(domain)
+                self._snapshot(domain, "before restore")
+                with self.journal.batch() as batch:
+                    changed = self._restore_into(batch, domain, entry)
+                if entry["blob"] is not None and self.vhost_group.contains(domain):
+                    # The restored vhost serves the domain now, not the shared block
+                    with self.locks.write(ConsolidatedVhosts.VHOST_NAME):
+                        self.vhost_group.remove(domain)
+                self._snapshot(domain, f"restore version {entry['version']}")
+                self.cache.invalidate()
+
+                if entry["blob"] is None and existed:
+                    self._record_change("removed", domain)
+                elif entry["blob"] is not None and not existed:
+                    self._record_change("added", domain)
+
+                if not self._apply_config():
+                    return {"success": False, "message": "Domain restored but nginx reload failed"}
+
+                state = "removed" if entry["blob"] is None else f"version {entry['version']}"
+                return self._success(f"Restored {domain} to {state}" + ("" if changed else " (already current)"))
+
+        except Exception as e:
+            return {"success": False, "message": f"Error restoring domain: {str(e)}"}
+
+    def restore_tree(self, at: float) -> Dict:
+        """Put every vhost with recorded history back to how it was at time `at`"""
+        try:
+            with self.locks.exclusive():
+                restored = []
+                # One journal batch: the whole tree switches over together
+                with self.journal.batch() as batch:
+                    for domain in self.snapshots.domains():
+                        if self.vhost_group.contains(domain):
+                            continue
+                        # Domains created after `at` are absent at that point in time
+                        if self._restore_into(batch, domain, self.snapshots.version(domain, at=at)):
+                            restored.append(domain)
+
+                for domain in restored:
+                    self._snapshot(domain, "restore tree")
+                self.cache.invalidate()
+
+                if not self._apply_config():
+                    return {"success": False, "message": "Tree restored but nginx reload failed"}
+
+            return self._success(f"Restored {len(restored)} vhosts to {datetime.fromtimestamp(at).isoformat()}",
+                                 restored=restored)
+
+        except Exception as e:
+            return {"success": False, "message": f"Error restoring tree: {str(e)}"}
+
+    def delete_domain(self, domain_name: str, cleanup: bool = False) -> Dict:
+        """Delete domain configuration; cleanup also removes its certificates and acme.sh orders"""
+        try:
+            if not self.validate_domain_name(domain_name):
+                return {"success": False, "message": "Invalid domain name format"}
+
+            with self.locks.write(domain_name):
+                conf_file = self.layout.find_conf(domain_name)
+                enabled_file = self.layout.find_link(domain_name)
+            
+                # Consolidated domains only have a line in the shared include
+                if not os.path.exists(conf_file) and self.vhost_group.contains(domain_name):
+                    with self.locks.write(ConsolidatedVhosts.VHOST_NAME):
+                        self.vhost_group.remove(domain_name)
+                    self.cache.invalidate()
+                    self._record_change("removed", domain_name)
+
+                    if not self._apply_config():
+                        return {"success": False, "message": "Domain deleted but nginx reload failed"}
+                    return self._success(f"Domain {domain_name} configuration deleted",
+                                         cleaned=self._clean_up_after(domain_name) if cleanup else [])
+
+                # Check if domain exists
+                if not os.path.exists(conf_file):
+                    return {"success": False, "message": f"Domain {domain_name} not found"}
+
+                # Keep the last version so the deletion can be rolled back
+                self._snapshot(domain_name, "before delete")
+
+                # Symlink and vhost go together
+                with self.journal.batch() as batch:
+                    if os.path.lexists(enabled_file):
+                        batch.remove(enabled_file)
+                    batch.remove(conf_file)
+                self._snapshot(domain_name, "delete")
+                self.layout.prune(domain_name)
+                self.cache.invalidate()
+                self._record_change("removed", domain_name)
+
+                if not self._apply_config():
+                    return {"success": False, "message": "Domain deleted but nginx reload failed"}
+
+                # Certificates go only once nginx has stopped serving the domain
+                return self._success(f"Domain {domain_name} configuration deleted",
+                                     cleaned=self._clean_up_after(domain_name) if cleanup else [])
+
+        except Exception as e:
+            return {"success": False, "message": f"Error deleting domain: {str(e)}"}
+
+    def get_domain_stats(self) -> Dict:
+        """Get statistics about domains and SSL certificates"""
+        return self.cache.get("stats", self._compute_domain_stats)
+
+    def _compute_domain_stats(self) -> Dict:
+        """Count domains by SSL status"""
+        domains = self.list_domains()
+        
+        total_domains = len(domains)
+        active_ssl = len([d for d in domains if d["sslStatus"] == "valid"])
+        expiring_soon = len([d for d in domains if d["sslStatus"] == "expiring_soon"])
+        expired = len([d for d in domains if d["sslStatus"] == "expired"])
+        
+        return {
+            "totalDomains": total_domains,
+            "activeSsl": active_ssl,
+            "expiringSoon": expiring_soon,
+            "expired": expired
+        }
+
+
+class FileOnlyDomainManager(BaseDomainManager):
+    """
+    Manager that works with file operations only.
+    No subprocess calls or command execution - nginx reloads and certificate
+    issuance are returned as manual steps for the operator.
+    """
+
+    def _apply_config(self) -> bool:
+        # Tested and reloaded by the operator, following the manual steps
+        return True
+
+    def _success(self, message: str, **extra) -> Dict:
+        return {
+            "success": True,
+            "message": f"{message}. Manual nginx reload required.",
+            **extra,
+            "manual_steps": list(MANUAL_RELOAD_STEPS)
+        }
+
+    def _ssl_on_add(self, server_name: str) -> Dict:
+        return {
+            "ssl_message": "SSL configuration prepared. Manual SSL installation required.",
+            "ssl_steps": [
+                f"Run: sudo certbot --nginx -d {server_name} -d www.{server_name}",
+                "Or use your acme.sh script for SSL installation"
+            ]
+        }
+
+    def _create_sample_data(self):
+        """Create sample domain configurations for development and demonstration"""
+        sample_domains = [
+            {
+                "name": "example.com",
+                "ssl_status": "valid",
+                "days_left": 45
+            },
+            {
+                "name": "blog.example.com", 
+                "ssl_status": "expiring_soon",
+                "days_left": 15
+            },
+            {
+                "name": "old.example.com",
+                "ssl_status": "expired", 
+                "days_left": -5
+            },
+            {
+                "name": "shop.example.com",
+                "ssl_status": "no_ssl",
+                "days_left": 0
+            }
+        ]
+        
+        missing = [domain['name'] for domain in sample_domains
+                   if not os.path.exists(self.layout.find_conf(domain['name']))
+                   and not self.vhost_group.contains(domain['name'])]
+        # Only a tree that still lacks sample vhosts needs the snippets and upstreams
+        # they include; constructing a manager over an existing tree writes nothing
+        if missing:
+            self._write_shared_config()
+
+        # Sample vhosts, symlinks and certificates are committed as one batch
+        certs = {}
+        with self.journal.batch() as batch:
+            for domain in sample_domains:
+                # Create nginx config
+                if domain['name'] in missing:
+                    config_path = self.layout.new_conf(domain['name'])
+                    batch.write(config_path, self.generate_nginx_config(domain['name']))
+                    link_path = self.layout.link_for(domain['name'], config_path)
+                    if not os.path.lexists(link_path):
+                        batch.symlink(config_path, link_path)
+
+                # Create SSL certificate file if has SSL
+                if domain['ssl_status'] != 'no_ssl':
+                    cert_path = os.path.join(self.ssl_dir, f"{domain['name']}.crt")
+                    if not os.path.exists(cert_path):
+                        # Create dummy certificate file with timestamp for expiry calculation
+                        batch.write(cert_path, f"# Sample certificate for {domain['name']}\n")
+                        certs[cert_path] = domain['days_left']
+
+        # Set file timestamps to simulate expiry
+        for cert_path, days_left in certs.items():
+            if days_left > 0:
+                # Certificate expires in future
+                future_time = datetime.now().timestamp() - (90 - days_left) * 86400
+            else:
+                # Certificate already expired
+                future_time = datetime.now().timestamp() - (90 + abs(days_left)) * 86400
+
+            os.utime(cert_path, (future_time, future_time))
+
+    def prepare_ssl_config(self, domain: str) -> Dict:
+        """Prepare SSL configuration (file operations only)"""
+        try:
+            if not self.validate_domain_name(domain):
+                return {"success": False, "message": "Invalid domain name format"}
+
+            with self.locks.write(domain):
+                conf_file = self.layout.find_conf(domain)
+
+                # TLS needs a server block of its own, so split the domain out of the shared one
+                if not os.path.exists(conf_file) and self.vhost_group.contains(domain):
+                    self._split_from_group(domain)
+
+                if not os.path.exists(conf_file):
+                    return {"success": False, "message": f"Domain configuration not found"}
+
+                # Read current configuration
+                with open(conf_file, 'r') as f:
+                    config = f.read()
+
+                # Add well-known location if missing
+                if ".well-known/acme-challenge" not in config:
+                    lines = config.split('\n')
+                    for i, line in enumerate(lines):
+                        if f"server_name {domain}" in line:
+                            well_known_block = [
+                                "    location ^~ /.well-known/acme-challenge/ {",
+                                "        root /var/www/letsencrypt;",
+                                '        default_type "text/plain";',
+                                "        try_files $uri =404;",
+                                "    }"
+                            ]
+                            lines[i+1:i+1] = well_known_block
+                            break
+
+                    self._write_config(conf_file, '\n'.join(lines), "prepare_ssl")
+                    self.cache.invalidate()
+
+                # Once the certificates are in place the vhost gets its TLS block
+                tls_profile = load_tls_profile(self.tls_profile_file)
+                certificates = certificate_files(self.ssl_dir, domain, tls_profile["key_types"])
+                if all(os.path.exists(cert) and os.path.exists(key) for _, cert, key in certificates):
+                    write_tls_snippet(self.snippets_dir, tls_profile)
+                    with open(conf_file, 'r') as f:
+                        config = f.read()
+                    self._write_config(conf_file, apply_tls(config, domain, self.snippets_dir, self.ssl_dir, self.webroot, tls_profile), "prepare_ssl")
+                    self.cache.invalidate()
+
+                    return self._success(f"TLS enabled for {domain}")
+
+                manual_steps = list(MANUAL_RELOAD_STEPS)
+                for issue_command, install_command in acme_commands(
+                        self.acme_home, domain, self.webroot, self.ssl_dir, tls_profile["key_types"]):
+                    manual_steps.append(f"Run: sudo {issue_command}")
+                    manual_steps.append(f"Run: sudo {install_command}")
+                manual_steps.append("Then prepare SSL again to add the TLS block")
+
+                return {
+                    "success": True,
+                    "message": f"SSL preparation completed for {domain}",
+                    "manual_steps": manual_steps
+                }
+
+        except Exception as e:
+            return {"success": False, "message": f"Error preparing SSL: {str(e)}"}
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import shutil
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# Files kept in the ssl directory per certificate: {domain}.crt, its key and the stapled OCSP response
+SSL_SUFFIXES = {".crt": "certificate", ".key": "key", ".ocsp": "ocsp"}
+
+_SSL_PATH = re.compile(r"^\s*ssl_(?:certificate|certificate_key|stapling_file)\s+(\S+);", re.MULTILINE)
+_ACME_SETTING = re.compile(r"^Le_(Domain|Alt)='([^']*)'", re.MULTILINE)
+# Where acme.sh --install-cert copies the certificate and key on every renewal
+_ACME_INSTALL_PATH = re.compile(r"^Le_Real(?:Cert|Key|FullChain)Path='([^']*)'", re.MULTILINE)
+
+
+def referenced_ssl_files(conf_paths: Iterable[str]) -> Set[str]:
+    """Every certificate, key and stapling file some vhost points nginx at"""
+    referenced = set()
+    for path in conf_paths:
+        try:
+            with open(path, 'r') as f:
+                referenced.update(os.path.normpath(value) for value in _SSL_PATH.findall(f.read()))
+        except (OSError, UnicodeDecodeError):
+            pass
+    return referenced
+
+
+class OrphanCollector:
+    """
+    Finds what deleted domains leave behind:
+
+    certificate/key/ocsp  {domain}.crt, .key and .ocsp (and the .ecc/.rsa
+                          variants of extra key types) in the ssl directory
+    acme_order            acme.sh's per-domain directory ({domain} or {domain}_ecc),
+                          which keeps the order in the renewal cron; only orders
+                          that install into the ssl directory, since the acme.sh
+                          home is shared with certificates this tool never issued
+    dangling_link         sites-enabled symlinks whose vhost is gone
+
+    A domain's files are kept while a live vhost has its name, references one
+    of its files, or is covered by its certificate's names (SAN or wildcard),
+    so shared certificates survive the domain they were issued under.
+    Account keys under acme.sh's ca/ directory are shared by every order and
+    are never collected.
+    """
+
+    def __init__(self, ssl_dir: str, acme_home: str, enabled_dirs: List[str],
+                 certificate: Callable[[str], Optional[Dict]]):
+        self.ssl_dir = ssl_dir
+        self.acme_home = acme_home
+        self.enabled_dirs = enabled_dirs
+        # Parsed certificate for a file stem in the ssl directory, or None
+        self.certificate = certificate
+
+    @staticmethod
+    def _size(path: str) -> int:
+        if os.path.islink(path) or not os.path.isdir(path):
+            try:
+                return os.lstat(path).st_size
+            except OSError:
+                return 0
+        total = 0
+        for root, _, files in os.walk(path):
+            for name in files:
+                try:
+                    total += os.lstat(os.path.join(root, name)).st_size
+                except OSError:
+                    pass
+        return total
+
+    @staticmethod
+    def _covers_live(names: Iterable[str], live: Set[str], parents: Set[str]) -> bool:
+        for name in names:
+            name = name.lower()
+            if name.startswith("*.") and name[2:] in parents:
+                return True
+            if name in live:
+                return True
+        return False
+
+    def _ssl_files(self, only: Optional[Set[str]]) -> Dict[str, List[Tuple[str, str]]]:
+        """domain -> [(kind, path)] for the ssl directory"""
+        by_domain: Dict[str, List[Tuple[str, str]]] = {}
+        try:
+            with os.scandir(self.ssl_dir) as entries:
+                names = [entry.name for entry in entries if entry.is_file(follow_symlinks=False)]
+        except FileNotFoundError:
+            return by_domain
+
+        for name in names:
+            stem, suffix = os.path.splitext(name)
+            if suffix not in SSL_SUFFIXES:
+                continue
+            # Extra key types are installed as {domain}.ecc.crt and {domain}.rsa.crt
+            domain = stem[:-4] if stem.endswith((".ecc", ".rsa")) else stem
+            if only is None or domain in only:
+                by_domain.setdefault(domain, []).append((SSL_SUFFIXES[suffix], os.path.join(self.ssl_dir, name)))
+        return by_domain
+
+    def _installs_here(self, settings: str) -> bool:
+        """Whether an order's recorded install paths all point into the ssl directory"""
+        paths = [path for path in _ACME_INSTALL_PATH.findall(settings) if path]
+        ssl_dir = os.path.realpath(self.ssl_dir)
+        return bool(paths) and all(
+            os.path.commonpath([ssl_dir, os.path.realpath(path)]) == ssl_dir for path in paths
+        )
+
+    def _acme_orders(self, only: Optional[Set[str]]) -> Dict[str, List[Tuple[str, List[str]]]]:
+        """domain -> [(order directory, names on the order)] for the orders installed into the ssl directory"""
+        orders: Dict[str, List[Tuple[str, List[str]]]] = {}
+        try:
+            with os.scandir(self.acme_home) as entries:
+                directories = [entry.name for entry in entries if entry.is_dir(follow_symlinks=False)]
+        except (FileNotFoundError, NotADirectoryError):
+            return orders
+
+        for name in directories:
+            domain = name[:-len("_ecc")] if name.endswith("_ecc") else name
+            if only is not None and domain not in only:
+                continue
+            path = os.path.join(self.acme_home, name)
+            # Only directories holding a renewal config are orders; ca/, deploy/, dnsapi/ are not
+            try:
+                with open(os.path.join(path, f"{domain}.conf"), 'r') as f:
+                    settings = f.read()
+            except (OSError, UnicodeDecodeError):
+                continue
+            if not self._installs_here(settings):
+                continue
+            names = [domain]
+            for key, value in _ACME_SETTING.findall(settings):
+                names.extend(part for part in value.split(",") if part and part != "no")
+            orders.setdefault(domain, []).append((path, names))
+        return orders
+
+    def _dangling_links(self) -> Iterator[str]:
+        for directory in self.enabled_dirs:
+            # Shard directories are walked too; a dangling symlink is listed with the files
+            for root, _, files in os.walk(directory):
+                for name in files:
+                    path = os.path.join(root, name)
+                    if os.path.islink(path) and not os.path.exists(path):
+                        yield path
+
+    def scan(self, live: Set[str], referenced: Optional[Set[str]] = None,
+             only: Optional[Set[str]] = None) -> List[Dict]:
+        """
+        Orphans given the names of live vhosts and the ssl files they reference.
+        With only, just those domains' certificates and orders are considered
+        and dangling links are skipped.
+        """
+        referenced = referenced or set()
+        parents = {name.split(".", 1)[1] for name in live if "." in name}
+        ssl_files = self._ssl_files(only)
+        orders = self._acme_orders(only)
+
+        orphans = []
+        for domain in sorted(set(ssl_files) | set(orders)):
+            if domain in live:
+                continue
+            files = ssl_files.get(domain, [])
+            if any(path in referenced for _, path in files):
+                continue
+
+            names = []
+            for kind, path in files:
+                if kind == "certificate":
+                    cert = self.certificate(os.path.basename(path)[:-len(".crt")])
+                    names.extend(cert["names"] if cert else [])
+            for _, order_names in orders.get(domain, []):
+                names.extend(order_names)
+            if self._covers_live(names, live, parents):
+                continue
+
+            for kind, path in sorted(files, key=lambda item: item[1]):
+                orphans.append({"kind": kind, "name": domain, "path": path, "bytes": self._size(path)})
+            for path, _ in orders.get(domain, []):
+                orphans.append({"kind": "acme_order", "name": domain, "path": path, "bytes": self._size(path)})
+
+        if only is None:
+            for path in self._dangling_links():
+                name = os.path.basename(path)
+                orphans.append({
+                    "kind": "dangling_link",
+                    "name": name[:-len(".conf")] if name.endswith(".conf") else name,
+                    "path": path,
+                    "bytes": self._size(path)
+                })
+        return orphans
+
+    @staticmethod
+    def remove(orphans: List[Dict], journal) -> List[Dict]:
+        """
+        Remove files and links in one journal batch, then the order directories;
+        returns the entries that could not be removed.
+        """
+        with journal.batch() as batch:
+            for orphan in orphans:
+                if orphan["kind"] != "acme_order":
+                    batch.remove(orphan["path"])
+
+        failed = []
+        for orphan in orphans:
+            if orphan["kind"] == "acme_order":
+                try:
+                    shutil.rmtree(orphan["path"])
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    failed.append({"path": orphan["path"], "error": str(e)})
+        return failed
+
+    @staticmethod
+    def summarize(orphans: List[Dict]) -> Dict:
+        counts: Dict[str, int] = {}
+        reclaimable: Dict[str, int] = {}
+        for orphan in orphans:
+            counts[orphan["kind"]] = counts.get(orphan["kind"], 0) + 1
+            reclaimable[orphan["kind"]] = reclaimable.get(orphan["kind"], 0) + orphan["bytes"]
+        return {
+            "counts": counts,
+            "reclaimableBytes": sum(reclaimable.values()),
+            "reclaimableByKind": reclaimable,
+            "domains": len({orphan["name"] for orphan in orphans if orphan["kind"] != "dangling_link"})
+        }
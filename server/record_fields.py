@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+
+import hashlib
+from typing import FrozenSet, Optional
+
+# Fields of a domain record, in the order list and get return them
+LIST_FIELDS = ["id", "name", "enabled", "sslStatus", "sslExpiryDate", "daysToExpire", "sslCoveredBy", "createdAt"]
+
+# Fields that need the domain's certificate
+SSL_FIELDS = frozenset(["sslStatus", "sslExpiryDate", "daysToExpire", "sslCoveredBy"])
+
+
+def domain_id(name: str) -> int:
+    """A record's id: derived from the name alone, so it is the same in list and get and never shifts"""
+    # 48 bits stay exact as a JavaScript number and make collisions negligible
+    return int.from_bytes(hashlib.blake2b(name.encode(), digest_size=6).digest(), "big")
+
+
+def parse_fields(spec: Optional[str]) -> Optional[FrozenSet[str]]:
+    """Comma-separated field names to a projection; None or empty means every field"""
+    if not spec:
+        return None
+    fields = frozenset(field.strip() for field in spec.split(",") if field.strip())
+    unknown = fields - set(LIST_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}. Valid fields: {', '.join(LIST_FIELDS)}")
+    return fields or None
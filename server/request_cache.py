@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class _Flight:
+    """A computation in progress that concurrent callers wait on"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class SingleFlightCache:
+    """
+    Result cache for read-only manager calls in a long-lived process.
+
+    Identical concurrent requests are collapsed onto one in-flight computation.
+    Results are fresh for `ttl` seconds; after that, and until `stale_ttl`,
+    the stale value is returned immediately while one background refresh runs.
+    invalidate() drops everything and detaches computations already running,
+    so a result computed before a mutation is never cached after it.
+
+    With stamp_file, invalidate() also replaces that file and every get()
+    compares it with the copy last seen, so writes made by other processes
+    sharing the file (one-shot CLI calls next to a worker) are noticed on
+    the next read instead of when the ttl runs out.
+    """
+
+    def __init__(self, ttl: float = 2.0, stale_ttl: float = 10.0, stamp_file: Optional[str] = None):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.stamp_file = stamp_file
+        self._lock = threading.Lock()
+        self._values: Dict[Hashable, tuple] = {}
+        self._flights: Dict[Hashable, _Flight] = {}
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.joined = 0
+        self._stamp = self._read_stamp()
+
+    def _read_stamp(self) -> Optional[tuple]:
+        if not self.stamp_file:
+            return None
+        try:
+            st = os.stat(self.stamp_file)
+        except OSError:
+            return None
+        # Replaced rather than rewritten, so a new inode marks every invalidation
+        return (st.st_ino, st.st_mtime_ns)
+
+    def _write_stamp(self) -> None:
+        if not self.stamp_file:
+            return
+        tmp = f"{self.stamp_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.stamp_file), exist_ok=True)
+            with open(tmp, 'w') as f:
+                f.write(f"{os.getpid()} {time.time_ns()}\n")
+            os.replace(tmp, self.stamp_file)
+        except OSError:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+
+    def _drop(self) -> None:
+        self._generation += 1
+        self._values.clear()
+        self._flights.clear()
+
+    def _run(self, key: Hashable, flight: _Flight, generation: int, compute: Callable[[], Any]) -> None:
+        try:
+            flight.result = compute()
+        except BaseException as e:
+            flight.error = e
+
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            if flight.error is None and generation == self._generation:
+                self._values[key] = (time.monotonic(), flight.result)
+        flight.done.set()
+
+    def get(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Return the cached value for key, computing it at most once at a time"""
+        now = time.monotonic()
+        stamp = self._read_stamp()
+
+        with self._lock:
+            if stamp != self._stamp:
+                # Another process wrote since the values here were computed
+                self._stamp = stamp
+                self._drop()
+
+            cached = self._values.get(key)
+            age = now - cached[0] if cached else None
+
+            if cached and age < self.ttl:
+                self.hits += 1
+                return cached[1]
+
+            flight = self._flights.get(key)
+            if cached and age < self.stale_ttl:
+                # Serve stale and make sure exactly one refresh is running
+                self.stale_hits += 1
+                if flight is None:
+                    flight = _Flight()
+                    self._flights[key] = flight
+                    threading.Thread(
+                        target=self._run, args=(key, flight, self._generation, compute), daemon=True
+                    ).start()
+                return cached[1]
+
+            if flight is not None:
+                self.joined += 1
+                owner = False
+            else:
+                self.misses += 1
+                flight = _Flight()
+                self._flights[key] = flight
+                generation = self._generation
+                owner = True
+
+        if owner:
+            self._run(key, flight, generation, compute)
+        else:
+            flight.done.wait()
+
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    def invalidate(self) -> None:
+        """Drop all cached values and in-flight computations, here and in processes sharing the stamp"""
+        self._write_stamp()
+        stamp = self._read_stamp()
+        with self._lock:
+            self._stamp = stamp
+            self._drop()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "joined": self.joined,
+                "misses": self.misses,
+                "entries": len(self._values)
+            }
@@ -1,13 +1,80 @@
-import type { Express } from "express";
+import type { Express, NextFunction, Request, Response } from "express";
 import { createServer, type Server } from "http";
-import { insertDomainSchema } from "@shared/schema";
+import { insertDomainSchema, setAccessLogSchema, setProfileSchema } from "@shared/schema";
 import { z } from "zod";
-import { spawn } from "child_process";
+import { spawn, type ChildProcessWithoutNullStreams } from "child_process";
+import os from "os";
 import path from "path";
 
+// DOMAIN_MANAGER_SCRIPT points the routes at another entry point, e.g. the load test's
+const pythonScript = process.env.DOMAIN_MANAGER_SCRIPT || path.join(process.cwd(), "server", "secure_api.py");
+
+// Optional long-lived Python worker (DOMAIN_MANAGER_WORKER=1). Requests are
+// multiplexed over its stdin/stdout as newline-delimited JSON, so concurrent
+// identical reads share one scan through the manager's cache.
+class PythonWorker {
+  private process: ChildProcessWithoutNullStreams | null = null;
+  private buffer = "";
+  private nextId = 1;
+  private pending = new Map<number, { resolve: (value: any) => void; reject: (error: Error) => void }>();
+
+  private start(): ChildProcessWithoutNullStreams {
+    const worker = spawn("python3", [pythonScript, "serve"]);
+
+    worker.stdout.on("data", (data) => {
+      this.buffer += data.toString();
+      let newline: number;
+      while ((newline = this.buffer.indexOf("\n")) >= 0) {
+        const line = this.buffer.slice(0, newline).trim();
+        this.buffer = this.buffer.slice(newline + 1);
+        if (!line) continue;
+        try {
+          const result = JSON.parse(line);
+          const request = this.pending.get(result.id);
+          if (request) {
+            this.pending.delete(result.id);
+            delete result.id;
+            request.resolve(result);
+          }
+        } catch (e) {
+          // Ignore lines that are not responses
+        }
+      }
+    });
+
+    worker.on("close", () => {
+      this.process = null;
+      this.buffer = "";
+      this.pending.forEach((request) => request.reject(new Error("Python worker exited")));
+      this.pending.clear();
+    });
+
+    worker.on("error", () => {
+      this.process = null;
+    });
+
+    this.process = worker;
+    return worker;
+  }
+
+  request(action: string, args: string[]): Promise<any> {
+    const worker = this.process || this.start();
+    const id = this.nextId++;
+    return new Promise((resolve, reject) => {
+      this.pending.set(id, { resolve, reject });
+      worker.stdin.write(JSON.stringify({ id, action, args }) + "\n");
+    });
+  }
+}
+
+const pythonWorker = process.env.DOMAIN_MANAGER_WORKER === "1" ? new PythonWorker() : null;
+
 function executePythonScript(action: string, ...args: string[]): Promise<any> {
+  if (pythonWorker) {
+    return pythonWorker.request(action, args);
+  }
+
   return new Promise((resolve, reject) => {
-    const pythonScript = path.join(process.cwd(), "server", "secure_api.py");
     const pythonProcess = spawn("python3", [pythonScript, action, ...args]);
     
     let output = "";
@@ -40,15 +107,216 @@ function executePythonScript(action: string, ...args: string[]): Promise<any> {
   });
 }
 
+// Admission control for the Python backend. At most maxActive API requests
+// run Python work at once; the rest wait in two bounded queues, and mutations
+// are always admitted before reads. A full queue is rejected at once with 429,
+// a request that waited longer than maxWaitMs gets 503; both carry Retry-After.
+// Most routes hold their slot for the whole request. The change feed long-poll
+// takes one per poll through acquire() and holds none while it sleeps.
+type AdmissionKind = "mutation" | "read";
+
+class AdmissionError extends Error {
+  constructor(public status: number, public retryAfter: number, message: string) {
+    super(message);
+  }
+}
+
+class AdmissionQueue {
+  private active = 0;
+  private queues: Record<AdmissionKind, Array<{ admit: () => void; cancel: () => void }>> = {
+    mutation: [],
+    read: [],
+  };
+  private counters = { admitted: 0, rejected: 0, timedOut: 0, abandoned: 0 };
+  // Recent queue waits and service times in ms, for the stats and the Retry-After estimate
+  private waits: number[] = [];
+  private serviceTimes: number[] = [];
+
+  constructor(
+    private maxActive: number,
+    private maxQueued: number,
+    private maxWaitMs: number,
+  ) {}
+
+  private static record(samples: number[], value: number) {
+    samples.push(value);
+    if (samples.length > 1000) samples.shift();
+  }
+
+  private static percentile(sorted: number[], p: number): number | null {
+    if (!sorted.length) return null;
+    return Math.round(sorted[Math.min(sorted.length - 1, Math.floor(sorted.length * p))] * 10) / 10;
+  }
+
+  // Seconds until a slot is likely free: the queue ahead drained at the recent service rate
+  private retryAfter(): number {
+    const times = this.serviceTimes.slice(-100);
+    const average = times.length ? times.reduce((sum, t) => sum + t, 0) / times.length : 1000;
+    const ahead = this.queues.mutation.length + this.queues.read.length + 1;
+    return Math.max(1, Math.ceil((ahead * average) / this.maxActive / 1000));
+  }
+
+  private next() {
+    while (this.active < this.maxActive) {
+      const waiting = this.queues.mutation.shift() || this.queues.read.shift();
+      if (!waiting) return;
+      waiting.admit();
+    }
+  }
+
+  // Queue for a slot. onAdmit runs once the slot is taken, with the wait in ms;
+  // onReject gets the error for a full queue or a timeout. The returned function
+  // gives the slot back, or the place in the queue when still waiting.
+  private enter(kind: AdmissionKind, onAdmit: (waited: number) => void,
+                onReject: (error: AdmissionError) => void): () => void {
+    const queue = this.queues[kind];
+    const queuedAt = process.hrtime.bigint();
+    let admittedAt = queuedAt;
+    let state: "queued" | "active" | "done" = "queued";
+    let timer: NodeJS.Timeout | undefined;
+
+    const leave = () => {
+      if (state === "active") {
+        this.active--;
+        AdmissionQueue.record(this.serviceTimes, Number(process.hrtime.bigint() - admittedAt) / 1e6);
+        this.next();
+      } else if (state === "queued") {
+        clearTimeout(timer);
+        const index = queue.indexOf(entry);
+        if (index >= 0) queue.splice(index, 1);
+        this.counters.abandoned++;
+      }
+      state = "done";
+    };
+
+    const entry = {
+      admit: () => {
+        clearTimeout(timer);
+        state = "active";
+        this.active++;
+        this.counters.admitted++;
+        admittedAt = process.hrtime.bigint();
+        const waited = Number(admittedAt - queuedAt) / 1e6;
+        AdmissionQueue.record(this.waits, waited);
+        onAdmit(waited);
+      },
+      cancel: () => {
+        const index = queue.indexOf(entry);
+        if (index >= 0) queue.splice(index, 1);
+        state = "done";
+        this.counters.timedOut++;
+        onReject(new AdmissionError(503, this.retryAfter(), "Backend busy, request timed out in the queue"));
+      },
+    };
+
+    // Anyone still queued means every slot is taken, so a free slot is never jumped ahead of them
+    if (this.active < this.maxActive) {
+      entry.admit();
+    } else if (queue.length >= this.maxQueued) {
+      state = "done";
+      this.counters.rejected++;
+      onReject(new AdmissionError(429, this.retryAfter(), "Too many requests queued for the backend"));
+    } else {
+      timer = setTimeout(entry.cancel, this.maxWaitMs);
+      queue.push(entry);
+    }
+    return leave;
+  }
+
+  // Resolves with the function that gives the slot back; rejects with an AdmissionError
+  acquire(kind: AdmissionKind): Promise<() => void> {
+    return new Promise((resolve, reject) => {
+      const leave = this.enter(kind, () => resolve(() => leave()), reject);
+    });
+  }
+
+  respond(res: Response, error: AdmissionError) {
+    res.set("Retry-After", String(error.retryAfter));
+    res.status(error.status).json({ message: error.message, queue: this.stats().queued });
+  }
+
+  middleware = (req: Request, res: Response, next: NextFunction) => {
+    // The long-poll admits each poll itself
+    if (req.path === "/domains/changes") {
+      return next();
+    }
+
+    const kind = req.method === "GET" || req.method === "HEAD" ? "read" : "mutation";
+    const leave = this.enter(kind, (waited) => {
+      res.set("Server-Timing", `queue;dur=${waited.toFixed(1)}`);
+      next();
+    }, (error) => this.respond(res, error));
+    // "close" also fires when the client goes away while still queued
+    res.on("close", leave);
+  };
+
+  stats() {
+    const waits = [...this.waits].sort((a, b) => a - b);
+    return {
+      active: this.active,
+      queued: { mutation: this.queues.mutation.length, read: this.queues.read.length },
+      limits: { maxActive: this.maxActive, maxQueued: this.maxQueued, maxWaitMs: this.maxWaitMs },
+      ...this.counters,
+      waitMs: {
+        p50: AdmissionQueue.percentile(waits, 0.5),
+        p95: AdmissionQueue.percentile(waits, 0.95),
+        max: waits.length ? Math.round(waits[waits.length - 1] * 10) / 10 : null,
+      },
+    };
+  }
+}
+
+// PYTHON_MAX_ACTIVE, PYTHON_MAX_QUEUE (per queue) and PYTHON_MAX_WAIT_MS tune the limits
+const admission = new AdmissionQueue(
+  parseInt(process.env.PYTHON_MAX_ACTIVE || "", 10) || Math.max(2, Math.floor(os.cpus().length / 2)),
+  parseInt(process.env.PYTHON_MAX_QUEUE || "", 10) || 50,
+  parseInt(process.env.PYTHON_MAX_WAIT_MS || "", 10) || 10000,
+);
+
+// Resolve a route parameter to a domain record. Names are looked up directly
+// through "get"; numeric IDs are hashes of the name, so they still need a
+// names-only "list" to resolve.
+async function resolveDomain(idOrName: string): Promise<any | null> {
+  if (!/^\d+$/.test(idOrName)) {
+    const result = await executePythonScript("get", idOrName);
+    return result.success ? result.data : null;
+  }
+
+  // The names-only listing skips every stat and certificate
+  const domainsResult = await executePythonScript("list", "fields=id,name");
+  if (!domainsResult.success) {
+    throw new Error(domainsResult.message || "Failed to fetch domains");
+  }
+  const match = domainsResult.data.find((d: any) => d.id.toString() === idOrName);
+  if (!match) {
+    return null;
+  }
+
+  const result = await executePythonScript("get", match.name);
+  return result.success ? result.data : null;
+}
+
 export async function registerRoutes(app: Express): Promise<Server> {
-  // Get all domains
+  // Queue depth, limits and recent waits; registered first so it answers while the backend is saturated
+  app.get("/api/admission", (req, res) => {
+    res.json(admission.stats());
+  });
+
+  app.use("/api", admission.middleware);
+
+  // Get all domains; ?fields=name,sslStatus returns only those keys
   app.get("/api/domains", async (req, res) => {
     try {
-      const result = await executePythonScript("list");
+      const fields = req.query.fields;
+      if (fields !== undefined && (typeof fields !== "string" || !/^[a-zA-Z,]+$/.test(fields))) {
+        return res.status(400).json({ message: "fields must be a comma-separated list of field names" });
+      }
+
+      const result = await executePythonScript("list", ...(fields ? [`fields=${fields}`] : []));
       if (result.success) {
         res.json(result.data);
       } else {
-        res.status(500).json({ message: result.message || "Failed to fetch domains" });
+        res.status(fields ? 400 : 500).json({ message: result.message || "Failed to fetch domains" });
       }
     } catch (error) {
       res.status(500).json({ message: "Failed to fetch domains from server" });
@@ -69,20 +337,317 @@ export async function registerRoutes(app: Express): Promise<Server> {
     }
   });
 
+  // Search domain names: ?q=example.com&mode=suffix|exact|substring&limit=50&offset=0
+  app.get("/api/domains/search", async (req, res) => {
+    try {
+      const query = typeof req.query.q === "string" ? req.query.q : "";
+      if (!query) {
+        return res.status(400).json({ message: "Search query is required" });
+      }
+      const mode = typeof req.query.mode === "string" ? req.query.mode : "suffix";
+      if (!["suffix", "exact", "substring"].includes(mode)) {
+        return res.status(400).json({ message: "mode must be suffix, exact or substring" });
+      }
+      const limit = typeof req.query.limit === "string" ? req.query.limit : "50";
+      const offset = typeof req.query.offset === "string" ? req.query.offset : "0";
+
+      const result = await executePythonScript("search", query, mode, limit, offset);
+      if (result.success) {
+        res.json(result.data);
+      } else {
+        res.status(400).json({ message: result.message || "Search failed" });
+      }
+    } catch (error) {
+      res.status(500).json({ message: "Failed to search domains" });
+    }
+  });
+
+  // Certificates expiring within ?days=N, or expired more than ?expired_for=M days ago, soonest first
+  app.get("/api/domains/expiring", async (req, res) => {
+    try {
+      const options: string[] = [];
+      for (const key of ["days", "expired_for", "limit", "offset"]) {
+        const value = req.query[key];
+        if (typeof value === "string") {
+          if (!/^-?\d+$/.test(value)) {
+            return res.status(400).json({ message: `${key} must be an integer` });
+          }
+          options.push(`${key}=${value}`);
+        }
+      }
+      if (req.query.days !== undefined && req.query.expired_for !== undefined) {
+        return res.status(400).json({ message: "Use either days or expired_for, not both" });
+      }
+
+      const result = await executePythonScript("expiring", ...options);
+      if (result.success) {
+        res.json(result.data);
+      } else {
+        res.status(400).json({ message: result.message || "Expiry query failed" });
+      }
+    } catch (error) {
+      res.status(500).json({ message: "Failed to query expiring certificates" });
+    }
+  });
+
+  // Request, byte and status-class counts from the per-domain access logs
+  app.get("/api/domains/traffic", async (req, res) => {
+    try {
+      const options: string[] = [];
+      for (const key of ["since", "limit"]) {
+        const value = req.query[key];
+        if (typeof value === "string") {
+          if (!/^\d+$/.test(value)) {
+            return res.status(400).json({ message: `${key} must be a positive integer` });
+          }
+          options.push(`${key}=${value}`);
+        }
+      }
+      if (typeof req.query.domain === "string") {
+        options.push(`domain=${req.query.domain}`);
+      }
+
+      const result = await executePythonScript("traffic", ...options);
+      if (result.success) {
+        res.json(result.data);
+      } else {
+        res.status(400).json({ message: result.message || "Traffic query failed" });
+      }
+    } catch (error) {
+      res.status(500).json({ message: "Failed to query traffic" });
+    }
+  });
+
+  // Domain changes after ?since=<seq>; with ?wait=N it long-polls up to N seconds for the first event
+  app.get("/api/domains/changes", async (req, res) => {
+    try {
+      const options: Record<string, number> = {};
+      for (const key of ["since", "limit", "wait"]) {
+        const value = req.query[key];
+        if (typeof value === "string") {
+          if (!/^\d+$/.test(value)) {
+            return res.status(400).json({ message: `${key} must be a non-negative integer` });
+          }
+          options[key] = parseInt(value, 10);
+        }
+      }
+
+      const args = [`since=${options.since ?? 0}`, `limit=${options.limit ?? 500}`];
+      const deadline = Date.now() + Math.min(options.wait ?? 0, 30) * 1000;
+      // Each poll takes an admission slot and gives it back before sleeping
+      const poll = async () => {
+        const release = await admission.acquire("read");
+        try {
+          return await executePythonScript("changes", ...args);
+        } finally {
+          release();
+        }
+      };
+      let result = await poll();
+      while (result.success && !result.data.resync && result.data.events.length === 0 && Date.now() < deadline) {
+        await new Promise((resolve) => setTimeout(resolve, 1000));
+        if (req.socket.destroyed) return;
+        result = await poll();
+      }
+
+      if (result.success) {
+        res.json(result.data);
+      } else {
+        res.status(500).json({ message: result.message || "Change feed query failed" });
+      }
+    } catch (error) {
+      if (error instanceof AdmissionError) {
+        return admission.respond(res, error);
+      }
+      res.status(500).json({ message: "Failed to fetch domain changes" });
+    }
+  });
+
+  // TLS audit of every installed certificate; ?all=1 includes the passing ones
+  app.get("/api/tls/audit", async (req, res) => {
+    try {
+      const all = req.query.all === "1" || req.query.all === "true";
+      const result = await executePythonScript("audit", ...(all ? ["all"] : []));
+      if (result.success) {
+        res.json(result.data);
+      } else {
+        res.status(500).json({ message: result.message || "TLS audit failed" });
+      }
+    } catch (error) {
+      res.status(500).json({ message: "Failed to audit certificates" });
+    }
+  });
+
+  // Connect checks for every distinct upstream and PHP-FPM socket the vhosts use
+  app.get("/api/backends/health", async (req, res) => {
+    try {
+      const refresh = req.query.refresh === "1" || req.query.refresh === "true";
+      const result = await executePythonScript("health", ...(refresh ? ["refresh"] : []));
+      if (result.success) {
+        res.json(result.data);
+      } else {
+        res.status(500).json({ message: result.message || "Health check failed" });
+      }
+    } catch (error) {
+      res.status(500).json({ message: "Failed to check backend health" });
+    }
+  });
+
+  // Certificates, keys, acme.sh orders and enabled links left behind by deleted domains.
+  // GET only reports them; POST removes them
+  app.get("/api/gc", async (req, res) => {
+    try {
+      const result = await executePythonScript("gc");
+      if (result.success) {
+        res.json(result);
+      } else {
+        res.status(500).json({ message: result.message || "Orphan scan failed" });
+      }
+    } catch (error) {
+      res.status(500).json({ message: "Failed to scan for orphaned files" });
+    }
+  });
+
+  app.post("/api/gc", async (req, res) => {
+    try {
+      const result = await executePythonScript("gc", "dry_run=false");
+      if (result.success) {
+        res.json(result);
+      } else {
+        res.status(500).json({ message: result.message, failed: result.failed });
+      }
+    } catch (error) {
+      res.status(500).json({ message: "Failed to remove orphaned files" });
+    }
+  });
+
+  // Stream the inventory as ?format=csv|ndjson, optionally limited to ?fields=name,sslStatus
+  app.get("/api/domains/export", (req, res) => {
+    const format = typeof req.query.format === "string" ? req.query.format : "ndjson";
+    if (!["csv", "ndjson"].includes(format)) {
+      return res.status(400).json({ message: "format must be csv or ndjson" });
+    }
+    const fields = req.query.fields;
+    if (fields !== undefined && (typeof fields !== "string" || !/^[a-zA-Z,]+$/.test(fields))) {
+      return res.status(400).json({ message: "fields must be a comma-separated list of field names" });
+    }
+
+    // Always its own process: the records are piped straight through instead of buffered
+    const args = [pythonScript, "export", `format=${format}`, ...(fields ? [`fields=${fields}`] : [])];
+    const exportProcess = spawn("python3", args);
+    let errorOutput = "";
+    let started = false;
+
+    exportProcess.stderr.on("data", (data) => {
+      errorOutput += data.toString();
+    });
+    exportProcess.on("error", () => {
+      if (!res.headersSent) {
+        res.status(500).json({ message: "Failed to export domains" });
+      }
+    });
+    exportProcess.on("close", (code) => {
+      if (code !== 0 && !started && !res.headersSent) {
+        res.status(400).json({ message: errorOutput.trim() || "Failed to export domains" });
+      } else {
+        res.end();
+      }
+    });
+    res.on("close", () => exportProcess.kill());
+
+    // Headers go out with the first chunk, so an error before it can still be a JSON response
+    exportProcess.stdout.once("data", (chunk) => {
+      started = true;
+      res.status(200).set({
+        "Content-Type": format === "csv" ? "text/csv" : "application/x-ndjson",
+        "Content-Disposition": `attachment; filename="domains.${format}"`,
+      });
+      res.write(chunk);
+      exportProcess.stdout.pipe(res, { end: false });
+    });
+  });
+
+  // Import names from a text/csv or text/plain body, streamed to the importer.
+  // ?format=auto|csv|lines&column=&chunk=&upstream=&profile=&dry_run=true
+  app.post("/api/domains/import", (req, res) => {
+    if (req.is("application/json") || req.is("application/x-www-form-urlencoded")) {
+      return res.status(415).json({ message: "Send the names as text/csv or text/plain" });
+    }
+
+    const args = [pythonScript, "import", "file=-"];
+    for (const key of ["format", "column", "chunk", "upstream", "profile", "dry_run", "errors"]) {
+      const value = req.query[key];
+      if (value === undefined) continue;
+      if (typeof value !== "string" || !/^[a-zA-Z0-9_.:-]*$/.test(value)) {
+        return res.status(400).json({ message: `Invalid ${key}` });
+      }
+      args.push(`${key}=${value}`);
+    }
+
+    const importProcess = spawn("python3", args);
+    let output = "";
+    let errorOutput = "";
+
+    importProcess.stdout.on("data", (data) => {
+      output += data.toString();
+    });
+    importProcess.stderr.on("data", (data) => {
+      errorOutput += data.toString();
+    });
+    importProcess.on("error", () => {
+      if (!res.headersSent) {
+        res.status(500).json({ message: "Failed to import domains" });
+      }
+    });
+    importProcess.on("close", () => {
+      if (res.headersSent) return;
+      try {
+        const result = JSON.parse(output.trim());
+        if (result.success) {
+          res.json(result.data);
+        } else {
+          res.status(400).json({ message: result.message || "Import failed" });
+        }
+      } catch (e) {
+        res.status(500).json({ message: errorOutput.trim() || "Failed to import domains" });
+      }
+    });
+
+    // The body is never buffered here; the importer reads it line by line from stdin
+    importProcess.stdin.on("error", () => {
+      // The importer stopped reading, e.g. on an invalid option; its result says why
+    });
+    req.pipe(importProcess.stdin);
+  });
+
+  // Get a single domain by name or ID
+  app.get("/api/domains/:id", async (req, res) => {
+    try {
+      const domain = await resolveDomain(req.params.id);
+      if (!domain) {
+        return res.status(404).json({ message: "Domain not found" });
+      }
+      res.json(domain);
+    } catch (error) {
+      res.status(500).json({ message: "Failed to fetch domain from server" });
+    }
+  });
+
   // Create a new domain
   app.post("/api/domains", async (req, res) => {
     try {
       const validatedData = insertDomainSchema.parse(req.body);
-      const { name, installSsl } = validatedData;
+      const { name, installSsl, upstream, profile, accessLog } = validatedData;
       
-      const result = await executePythonScript("add", name, installSsl ? "true" : "false");
+      const result = await executePythonScript(
+        "add", name, installSsl ? "true" : "false", upstream || "", profile || "", accessLog ? "true" : "false"
+      );
       
       if (result.success) {
-        // Get updated domain list to return the created domain
-        const domainsResult = await executePythonScript("list");
-        if (domainsResult.success) {
-          const newDomain = domainsResult.data.find((d: any) => d.name === name);
-          res.status(201).json(newDomain || { name, message: result.message });
+        // Fetch only the created domain to return it
+        const domainResult = await executePythonScript("get", name);
+        if (domainResult.success) {
+          res.status(201).json(domainResult.data);
         } else {
           res.status(201).json({ name, message: result.message });
         }
@@ -100,15 +665,7 @@ export async function registerRoutes(app: Express): Promise<Server> {
   // Prepare SSL configuration for a domain
   app.post("/api/domains/:id/ssl", async (req, res) => {
     try {
-      const domainId = req.params.id;
-      
-      // First get the domain list to find the domain name by ID
-      const domainsResult = await executePythonScript("list");
-      if (!domainsResult.success) {
-        return res.status(500).json({ message: "Failed to fetch domains" });
-      }
-      
-      const domain = domainsResult.data.find((d: any) => d.id.toString() === domainId);
+      const domain = await resolveDomain(req.params.id);
       if (!domain) {
         return res.status(404).json({ message: "Domain not found" });
       }
@@ -129,26 +686,106 @@ export async function registerRoutes(app: Express): Promise<Server> {
     }
   });
 
+  // Switch a domain to another performance profile
+  app.put("/api/domains/:id/profile", async (req, res) => {
+    try {
+      const { profile } = setProfileSchema.parse(req.body);
+      const domain = await resolveDomain(req.params.id);
+      if (!domain) {
+        return res.status(404).json({ message: "Domain not found" });
+      }
+
+      const result = await executePythonScript("set_profile", domain.name, profile);
+
+      if (result.success) {
+        res.json({ message: result.message, manual_steps: result.manual_steps });
+      } else {
+        res.status(500).json({ message: result.message });
+      }
+    } catch (error) {
+      if (error instanceof z.ZodError) {
+        return res.status(400).json({ message: error.errors[0].message });
+      }
+      res.status(500).json({ message: "Failed to set performance profile" });
+    }
+  });
+
+  // Turn a domain's traffic access log on or off
+  app.put("/api/domains/:id/access-log", async (req, res) => {
+    try {
+      const { enabled } = setAccessLogSchema.parse(req.body);
+      const domain = await resolveDomain(req.params.id);
+      if (!domain) {
+        return res.status(404).json({ message: "Domain not found" });
+      }
+
+      const result = await executePythonScript("access_log", domain.name, enabled ? "on" : "off");
+
+      if (result.success) {
+        res.json({ message: result.message, manual_steps: result.manual_steps });
+      } else {
+        res.status(500).json({ message: result.message });
+      }
+    } catch (error) {
+      if (error instanceof z.ZodError) {
+        return res.status(400).json({ message: error.errors[0].message });
+      }
+      res.status(500).json({ message: "Failed to set access log" });
+    }
+  });
+
+  // Recorded versions of a domain's vhost
+  app.get("/api/domains/:id/history", async (req, res) => {
+    try {
+      const domain = await resolveDomain(req.params.id);
+      const name = domain ? domain.name : req.params.id;
+      const result = await executePythonScript("history", name);
+      if (result.success) {
+        res.json(result.data);
+      } else {
+        res.status(500).json({ message: result.message });
+      }
+    } catch (error) {
+      res.status(500).json({ message: "Failed to fetch domain history" });
+    }
+  });
+
+  // Roll a domain back to a recorded version (by number, or the latest when omitted);
+  // deleted domains are addressed by name
+  app.post("/api/domains/:id/restore", async (req, res) => {
+    try {
+      const { version } = req.body ?? {};
+      if (version !== undefined && !Number.isInteger(version)) {
+        return res.status(400).json({ message: "version must be an integer" });
+      }
+      const domain = await resolveDomain(req.params.id);
+      const name = domain ? domain.name : req.params.id;
+
+      const result = await executePythonScript("restore", name, ...(version !== undefined ? [`version=${version}`] : []));
+      if (result.success) {
+        res.json({ message: result.message, manual_steps: result.manual_steps });
+      } else {
+        res.status(400).json({ message: result.message });
+      }
+    } catch (error) {
+      res.status(500).json({ message: "Failed to restore domain" });
+    }
+  });
+
   // Delete a domain
   app.delete("/api/domains/:id", async (req, res) => {
     try {
-      const domainId = req.params.id;
-      
-      // First get the domain list to find the domain name by ID
-      const domainsResult = await executePythonScript("list");
-      if (!domainsResult.success) {
-        return res.status(500).json({ message: "Failed to fetch domains" });
-      }
-      
-      const domain = domainsResult.data.find((d: any) => d.id.toString() === domainId);
+      const domain = await resolveDomain(req.params.id);
       if (!domain) {
         return res.status(404).json({ message: "Domain not found" });
       }
 
-      const result = await executePythonScript("delete", domain.name);
+      // ?cleanup=1 also removes the domain's certificates and acme.sh orders
+      const cleanup = req.query.cleanup === "1" || req.query.cleanup === "true";
+      const result = await executePythonScript("delete", domain.name, ...(cleanup ? ["cleanup=true"] : []));
       
       if (result.success) {
-        res.json({ message: result.message });
+        res.json({ message: result.message, cleaned: result.cleaned });
       } else {
         res.status(500).json({ message: result.message });
       }
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+import glob
+import hashlib
+import json
+import os
+import threading
+from typing import List, Optional, Tuple
+
+from write_journal import Journal
+
+FLAT = "flat"
+SHARDED = "sharded"
+
+
+class SiteLayout:
+    """
+    Where per-domain vhost files and enabled symlinks live.
+
+    flat:     sites-available/<domain>.conf, sites-enabled/<domain>.conf
+    sharded:  sites-available/ab/cd/<domain>.conf and
+              sites-enabled-sharded/ab/cd/<domain>.conf, where abcd are the
+              first hex digits of sha1(domain). nginx picks the sharded links
+              up through sites-enabled/_sharded.conf, so the stock
+              "include sites-enabled/*" keeps working and never sees a directory.
+
+    Lookups probe the active layout first and the other one second, so every
+    domain stays reachable while an online migration is moving files.
+    Shared files (00-http-common.conf, _consolidated.conf, default) always stay flat.
+    """
+
+    INCLUDE_NAME = "_sharded.conf"
+
+    def __init__(self, sites_available: str, sites_enabled: str, state_dir: str):
+        self.sites_available = sites_available
+        self.sites_enabled = sites_enabled
+        self.sharded_enabled = os.path.join(os.path.dirname(sites_enabled), "sites-enabled-sharded")
+        self.include_file = os.path.join(sites_enabled, self.INCLUDE_NAME)
+        self.state_file = os.path.join(state_dir, "layout.json")
+
+    @property
+    def mode(self) -> str:
+        try:
+            with open(self.state_file, 'r') as f:
+                return json.load(f).get("layout", FLAT)
+        except (OSError, ValueError):
+            return FLAT
+
+    @staticmethod
+    def shard(domain: str) -> str:
+        digest = hashlib.sha1(domain.encode()).hexdigest()
+        return os.path.join(digest[:2], digest[2:4])
+
+    def conf_path(self, domain: str, mode: Optional[str] = None) -> str:
+        """Path of a domain's vhost in the given layout (default: the active one)"""
+        if (mode or self.mode) == SHARDED:
+            return os.path.join(self.sites_available, self.shard(domain), f"{domain}.conf")
+        return os.path.join(self.sites_available, f"{domain}.conf")
+
+    def link_path(self, domain: str, mode: Optional[str] = None) -> str:
+        """Path of a domain's enabled symlink in the given layout (default: the active one)"""
+        if (mode or self.mode) == SHARDED:
+            return os.path.join(self.sharded_enabled, self.shard(domain), f"{domain}.conf")
+        return os.path.join(self.sites_enabled, f"{domain}.conf")
+
+    def _modes(self) -> List[str]:
+        active = self.mode
+        return [active, FLAT if active == SHARDED else SHARDED]
+
+    def find_conf(self, domain: str) -> str:
+        """Existing vhost for domain in either layout, else where a new one would go"""
+        modes = self._modes()
+        for mode in modes:
+            path = self.conf_path(domain, mode)
+            if os.path.exists(path):
+                return path
+        return self.conf_path(domain, modes[0])
+
+    def find_link(self, domain: str) -> str:
+        """Existing enabled symlink for domain in either layout, else where a new one would go"""
+        modes = self._modes()
+        for mode in modes:
+            path = self.link_path(domain, mode)
+            if os.path.lexists(path):
+                return path
+        return self.link_path(domain, modes[0])
+
+    def new_conf(self, domain: str) -> str:
+        """Path for a new vhost in the active layout, with its shard directory created"""
+        path = self.conf_path(domain)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return path
+
+    def link_for(self, domain: str, conf_file: str) -> str:
+        """Enabled symlink path in the same layout as conf_file"""
+        mode = SHARDED if os.path.dirname(conf_file) != self.sites_available else FLAT
+        return self.link_path(domain, mode)
+
+    def enable(self, domain: str, conf_file: str) -> None:
+        """Create the enabled symlink next to wherever conf_file lives"""
+        link_path = self.link_for(domain, conf_file)
+        if not os.path.lexists(link_path):
+            os.makedirs(os.path.dirname(link_path), exist_ok=True)
+            os.symlink(conf_file, link_path)
+
+    def conf_files(self) -> List[Tuple[str, str]]:
+        """(domain, path) for every *.conf in both layouts"""
+        flat = []
+        shard_dirs = []
+        # One directory read finds the flat files and any shard directories;
+        # a flat tree never touches anything else
+        try:
+            with os.scandir(self.sites_available) as entries:
+                for entry in entries:
+                    if entry.name.startswith("."):
+                        continue
+                    if entry.is_dir():
+                        shard_dirs.append(entry.path)
+                    elif entry.name.endswith(".conf"):
+                        flat.append(entry.path)
+        except FileNotFoundError:
+            return []
+
+        sharded = []
+        for directory in shard_dirs:
+            sharded.extend(glob.glob(os.path.join(directory, "*", "*.conf")))
+
+        found = {}
+        # The sharded files first, so flat files win when a migration is half done
+        groups = [sharded, flat]
+        if shard_dirs and self.mode == SHARDED:
+            groups.reverse()
+        for paths in groups:
+            for path in paths:
+                found[os.path.basename(path)[:-len(".conf")]] = path
+        return list(found.items())
+
+    def _write_include(self) -> None:
+        tmp_file = f"{self.include_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'w') as f:
+            f.write("# Generated by the domain manager - enabled vhosts in the sharded layout\n")
+            f.write(f"include {os.path.join(self.sharded_enabled, '*', '*', '*.conf')};\n")
+        os.replace(tmp_file, self.include_file)
+
+    def set_mode(self, mode: str) -> None:
+        """Switch the layout new files are written to; existing files move with relocate()"""
+        if mode not in (FLAT, SHARDED):
+            raise ValueError(f"Unknown layout: {mode}")
+
+        # The include stays until a migration back to flat has moved every link
+        if mode == SHARDED and not os.path.exists(self.include_file):
+            os.makedirs(self.sharded_enabled, exist_ok=True)
+            self._write_include()
+
+        os.makedirs(os.path.dirname(self.state_file), exist_ok=True)
+        tmp_file = f"{self.state_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump({"layout": mode}, f)
+        os.replace(tmp_file, self.state_file)
+
+    def relocate(self, domain: str, mode: str, journal: Journal) -> bool:
+        """Move one domain's vhost and symlink into the given layout; False if already there"""
+        source_mode = SHARDED if mode == FLAT else FLAT
+        source_conf = self.conf_path(domain, source_mode)
+        if not os.path.exists(source_conf):
+            return False
+
+        with open(source_conf, 'r') as f:
+            config = f.read()
+
+        # One batch, applied in order: the new vhost and symlink are in place before the
+        # old ones go, so an nginx reload in between never misses the domain
+        target_conf = self.conf_path(domain, mode)
+        source_link = self.link_path(domain, source_mode)
+        with journal.batch() as batch:
+            batch.write(target_conf, config)
+            if os.path.lexists(source_link):
+                batch.symlink(target_conf, self.link_path(domain, mode))
+                batch.remove(source_link)
+            batch.remove(source_conf)
+
+        if source_mode == SHARDED:
+            self.prune(domain)
+        return True
+
+    def prune(self, domain: str) -> None:
+        """Remove the domain's shard directories if they were left empty"""
+        for root in (self.sites_available, self.sharded_enabled):
+            directory = os.path.join(root, self.shard(domain))
+            while directory != root:
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    break
+                directory = os.path.dirname(directory)
+
+    def finish(self, mode: str) -> None:
+        """Drop the sharded include once nothing is left in the sharded layout"""
+        if mode == FLAT and os.path.exists(self.include_file):
+            if not glob.glob(os.path.join(self.sharded_enabled, "*", "*", "*.conf")):
+                os.remove(self.include_file)
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+# Stands in for the domain name in stored vhosts, so vhosts that differ only
+# in server_name, log paths and certificate paths share one blob
+PLACEHOLDER = "__SNAPSHOT_DOMAIN__"
+
+
+class SnapshotStore:
+    """
+    Version history of every per-domain vhost.
+
+    blobs/ab/<sha256>  zlib-compressed vhost text with the domain name replaced
+                       by PLACEHOLDER, stored once per distinct content
+    refs/<domain>.jsonl one line per version: time, blob (null once the vhost
+                       was removed), whether it was enabled and why it was recorded
+
+    Storage grows with distinct normalized content plus one short line per
+    version, not with domains times edits.
+    """
+
+    def __init__(self, root: str):
+        self.blob_dir = os.path.join(root, "blobs")
+        self.ref_dir = os.path.join(root, "refs")
+
+    def _ref_file(self, domain: str) -> str:
+        return os.path.join(self.ref_dir, f"{domain}.jsonl")
+
+    def _blob_file(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest[:2], digest)
+
+    @staticmethod
+    def normalize(content: str, domain: str) -> Tuple[str, bool]:
+        """(stored text, whether it was normalized); text already containing PLACEHOLDER is kept as is"""
+        if PLACEHOLDER in content:
+            return content, False
+        return content.replace(domain, PLACEHOLDER), True
+
+    def _put_blob(self, text: str) -> str:
+        digest = hashlib.sha256(text.encode()).hexdigest()
+        path = self._blob_file(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_file = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_file, 'wb') as f:
+                f.write(zlib.compress(text.encode(), 6))
+            os.replace(tmp_file, path)
+        return digest
+
+    def history(self, domain: str) -> List[Dict]:
+        """Every recorded version of domain, oldest first"""
+        versions = []
+        try:
+            with open(self._ref_file(domain), 'r') as f:
+                for line in f:
+                    try:
+                        versions.append(json.loads(line))
+                    except ValueError:
+                        break
+        except FileNotFoundError:
+            pass
+        for number, version in enumerate(versions, 1):
+            version["version"] = number
+        return versions
+
+    def record(self, domain: str, content: Optional[str], enabled: bool, reason: str) -> bool:
+        """Add a version unless it matches the latest one; content None records a removal"""
+        if content is None:
+            blob, normalized = None, False
+        else:
+            text, normalized = self.normalize(content, domain)
+            blob = self._put_blob(text)
+
+        versions = self.history(domain)
+        if versions:
+            latest = versions[-1]
+            if latest["blob"] == blob and (blob is None or latest["enabled"] == enabled):
+                return False
+        elif blob is None:
+            # Nothing to remember for a domain that never had a recorded vhost
+            return False
+
+        entry = {"at": round(time.time(), 3), "blob": blob, "normalized": normalized,
+                 "enabled": enabled, "reason": reason}
+        os.makedirs(self.ref_dir, exist_ok=True)
+        with open(self._ref_file(domain), 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+        return True
+
+    def version(self, domain: str, number: Optional[int] = None, at: Optional[float] = None) -> Optional[Dict]:
+        """A version by number, the one current at time `at`, or else the latest that had a vhost"""
+        versions = self.history(domain)
+        if number is not None:
+            return versions[number - 1] if 0 < number <= len(versions) else None
+        if at is None:
+            # Undoing a deletion is the common case, so removals are skipped here
+            return next((entry for entry in reversed(versions) if entry["blob"] is not None), None)
+        current = None
+        for entry in versions:
+            if entry["at"] > at:
+                break
+            current = entry
+        return current
+
+    def content(self, domain: str, entry: Dict) -> Optional[str]:
+        """The vhost text of a version, rendered for domain; None for a removal"""
+        if entry["blob"] is None:
+            return None
+        with open(self._blob_file(entry["blob"]), 'rb') as f:
+            text = zlib.decompress(f.read()).decode()
+        return text.replace(PLACEHOLDER, domain) if entry["normalized"] else text
+
+    def domains(self) -> List[str]:
+        try:
+            return sorted(name[:-len(".jsonl")] for name in os.listdir(self.ref_dir) if name.endswith(".jsonl"))
+        except FileNotFoundError:
+            return []
+
+    def stats(self) -> Dict:
+        blobs = 0
+        blob_bytes = 0
+        for root, _, files in os.walk(self.blob_dir):
+            for name in files:
+                blobs += 1
+                blob_bytes += os.path.getsize(os.path.join(root, name))
+        return {"domains": len(self.domains()), "blobs": blobs, "blobBytes": blob_bytes}
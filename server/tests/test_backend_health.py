@@ -0,0 +1,246 @@
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from backend_health import BackendProber, config_backends, summarize_health
+from upstreams import upstream_name
+
+
+class _OkHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.send_response(200)
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def prober(tmp_path):
+    """Factory for probers sharing one state file, as consecutive requests do"""
+    def make(**options):
+        return BackendProber(str(tmp_path / "state" / "backend-health.json"), **options)
+    return make
+
+
+@pytest.fixture
+def healthy():
+    """An HTTP backend that accepts connections"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _OkHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def counting():
+    """A TCP backend that counts the connections it accepts"""
+    server = socket.socket()
+    server.bind(("127.0.0.1", 0))
+    server.listen(16)
+    accepted = []
+
+    def accept():
+        while True:
+            try:
+                client, _ = server.accept()
+            except OSError:
+                return
+            accepted.append(client)
+
+    threading.Thread(target=accept, daemon=True).start()
+    yield f"127.0.0.1:{server.getsockname()[1]}", accepted
+    server.close()
+    for client in accepted:
+        client.close()
+
+
+@pytest.fixture
+def refusing():
+    """A port nothing listens on any more"""
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return f"127.0.0.1:{port}"
+
+
+@pytest.fixture
+def stalled():
+    """Factory for listeners that never accept, with their backlog full so new handshakes stall"""
+    sockets = []
+
+    def listener():
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        server.listen(0)
+        port = server.getsockname()[1]
+        sockets.append(server)
+        for _ in range(4):
+            client = socket.socket()
+            client.setblocking(False)
+            client.connect_ex(("127.0.0.1", port))
+            sockets.append(client)
+        time.sleep(0.1)
+        return f"127.0.0.1:{port}"
+
+    yield listener
+    for sock in sockets:
+        sock.close()
+
+
+@pytest.fixture
+def slow(stalled):
+    return stalled()
+
+
+@pytest.fixture
+def unix_socket(tmp_path):
+    """A listening unix socket, like php-fpm's"""
+    path = str(tmp_path / "php-fpm.sock")
+    server = socket.socket(socket.AF_UNIX)
+    server.bind(path)
+    server.listen(16)
+    yield f"unix:{path}"
+    server.close()
+
+
+def test_classifies_up_down_and_timeout(prober, healthy, refusing, slow):
+    results = prober(timeout=0.5).probe([healthy, refusing, slow])
+
+    assert results[healthy]["healthy"] is True
+    assert results[healthy]["error"] is None
+    assert results[healthy]["type"] == "tcp"
+
+    assert results[refusing]["healthy"] is False
+    assert results[refusing]["error"]
+    assert not results[refusing]["error"].startswith("timed out")
+
+    assert results[slow]["healthy"] is False
+    assert results[slow]["error"] == "timed out after 0.5s"
+    assert results[slow]["latencyMs"] >= 500
+
+
+def test_classifies_unix_sockets(prober, unix_socket, tmp_path):
+    missing = f"unix:{tmp_path / 'missing.sock'}"
+    results = prober(timeout=0.5).probe([unix_socket, missing])
+
+    assert results[unix_socket]["type"] == "unix"
+    assert results[unix_socket]["healthy"] is True
+
+    assert results[missing]["type"] == "unix"
+    assert results[missing]["healthy"] is False
+    assert results[missing]["error"]
+
+
+def test_probes_run_concurrently(prober, stalled):
+    # Backends that stall share the timeout instead of adding up
+    backends = [stalled() for _ in range(3)]
+    started = time.monotonic()
+    results = prober(timeout=0.5).probe(backends)
+    assert all(not result["healthy"] for result in results.values())
+    assert time.monotonic() - started < 1.0
+
+
+def test_each_backend_is_probed_once(prober, counting):
+    backend, accepted = counting
+    results = prober(timeout=0.5).probe([backend, backend, backend])
+    time.sleep(0.1)
+
+    assert list(results) == [backend]
+    assert len(accepted) == 1
+
+
+def test_results_are_kept_between_probers_until_refresh(prober, counting, refusing):
+    backend, accepted = counting
+    prober(timeout=0.5, ttl=60).probe([backend, refusing])
+
+    # A new prober over the same state file, as in the next request's process
+    again = prober(timeout=0.5, ttl=60).probe([backend, refusing])
+    assert again[backend]["cached"] and again[refusing]["cached"]
+    assert again[backend]["healthy"] is True
+    assert again[refusing]["healthy"] is False
+
+    refreshed = prober(timeout=0.5, ttl=60).probe([backend], refresh=True)
+    time.sleep(0.1)
+    assert refreshed[backend]["cached"] is False
+    assert len(accepted) == 2
+
+
+def test_expired_results_are_probed_again(prober, counting):
+    backend, accepted = counting
+    prober(timeout=0.5, ttl=0).probe([backend])
+    results = prober(timeout=0.5, ttl=0).probe([backend])
+    time.sleep(0.1)
+
+    assert results[backend]["cached"] is False
+    assert len(accepted) == 2
+
+
+def test_config_backends_resolves_upstreams_and_includes(tmp_path):
+    snippet = tmp_path / "php-fpm.conf"
+    snippet.write_text("location ~ \\.php$ {\n    fastcgi_pass unix:/run/php/php-fpm.sock;\n}\n")
+    nested = tmp_path / "nested.conf"
+    # Includes that include each other are read once
+    nested.write_text(f"include {nested};\nfastcgi_pass 127.0.0.1:9000;\n")
+
+    config = "\n".join([
+        "server {",
+        f"    proxy_pass http://{upstream_name('127.0.0.1:3000')};",
+        "    proxy_pass https://10.0.0.5:8443/api;",
+        "    proxy_pass http://$backend;",
+        f"    include {snippet};",
+        f"    include {nested};",
+        f"    include {tmp_path}/*.conf;",
+        "}",
+    ])
+    reads = []
+
+    def read_include(path):
+        reads.append(path)
+        with open(path) as f:
+            return f.read()
+
+    upstreams = {upstream_name("127.0.0.1:3000"): "127.0.0.1:3000"}
+    backends = config_backends(config, upstreams, read_include)
+
+    assert backends == {"127.0.0.1:3000", "10.0.0.5:8443", "unix:/run/php/php-fpm.sock", "127.0.0.1:9000"}
+    assert sorted(reads) == sorted([str(snippet), str(nested)])
+
+
+def test_shared_backends_are_summarized_once():
+    usage = {"127.0.0.1:3000": ["b.com", "a.com", "c.com"], "unix:/run/php.sock": ["a.com"]}
+    results = {
+        "127.0.0.1:3000": {"backend": "127.0.0.1:3000", "healthy": True},
+        "unix:/run/php.sock": {"backend": "unix:/run/php.sock", "healthy": False},
+    }
+    summary = summarize_health(usage, results, sample=2)
+
+    assert (summary["checked"], summary["healthy"], summary["unhealthy"]) == (2, 1, 1)
+    # Unhealthy first
+    assert [entry["backend"] for entry in summary["backends"]] == ["unix:/run/php.sock", "127.0.0.1:3000"]
+    assert summary["backends"][1]["domains"] == 3
+    assert summary["backends"][1]["sample"] == ["a.com", "b.com"]
+
+
+def test_vhosts_sharing_an_upstream_are_probed_once(tmp_path, monkeypatch, counting):
+    from secure_domain_manager import SecureDomainManager
+
+    backend, accepted = counting
+    monkeypatch.chdir(tmp_path)
+    dm = SecureDomainManager()
+    for name in ("a.example.org", "b.example.org", "c.example.org"):
+        assert dm.add_domain(name, upstream=backend)["success"]
+
+    report = dm.backend_health()
+    time.sleep(0.1)
+
+    entry = next(entry for entry in report["backends"] if entry["backend"] == backend)
+    assert entry["healthy"] is True
+    assert entry["domains"] == 3
+    assert len(accepted) == 1
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import re
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from cert_index import CertificateIndex, certificate_names, certificate_not_after, load_certificate, x509_module
+
+_PEM_CERT = re.compile(r"-----BEGIN CERTIFICATE-----.+?-----END CERTIFICATE-----", re.DOTALL)
+_SERVER_NAME = re.compile(r"^\s*server_name\s+([^;]+);", re.MULTILINE)
+
+# Below this many changed certificates the audit runs inline; a process pool costs more to start
+POOL_THRESHOLD = 16
+
+_trusted_subjects: Optional[set] = None
+
+
+def _trusted_roots() -> set:
+    """DER-encoded subjects of the system trust store's CA certificates, loaded once per process"""
+    global _trusted_subjects
+    if _trusted_subjects is None:
+        import ssl
+        import warnings
+
+        x509 = x509_module()
+        context = ssl.create_default_context()
+        _trusted_subjects = set()
+        with warnings.catch_warnings():
+            # Some store roots predate RFC 5280 (e.g. negative serials) and only draw deprecation warnings
+            warnings.simplefilter("ignore")
+            for der in context.get_ca_certs(binary_form=True):
+                try:
+                    _trusted_subjects.add(x509.load_der_x509_certificate(der).subject.public_bytes())
+                except ValueError:
+                    pass
+    return _trusted_subjects
+
+
+def vhost_names(conf_file: Optional[str], domain: str) -> List[str]:
+    """Names the domain's vhost serves, from its server_name lines"""
+    names = []
+    if conf_file:
+        try:
+            with open(conf_file, 'r') as f:
+                for match in _SERVER_NAME.finditer(f.read()):
+                    for name in match.group(1).split():
+                        if name not in names and not name.startswith(("~", "_")) and "$" not in name:
+                            names.append(name.lower())
+        except OSError:
+            pass
+    return names or [domain, f"www.{domain}"]
+
+
+def audit_certificate(job: Dict) -> Dict:
+    """
+    Check one installed certificate: the key matches, the chain links up to a
+    trusted root and the certificate covers every name the vhost serves.
+    Runs in a worker process, so it only takes and returns plain data.
+    """
+    import ssl
+
+    result = {"cert": job["cert"], "key": job["key"], "name": job["domain"], "issues": [], "notAfter": None}
+
+    try:
+        with open(job["cert"], 'r') as f:
+            blocks = _PEM_CERT.findall(f.read())
+    except (OSError, UnicodeDecodeError):
+        blocks = []
+    chain = [load_certificate(block.encode()) for block in blocks]
+    if not chain or chain[0] is None:
+        result["issues"].append("unparseable_certificate")
+        return result
+
+    leaf = chain[0]
+    result["notAfter"] = certificate_not_after(leaf).isoformat()
+
+    # Key match: OpenSSL refuses to load a certificate with a key that is not its own
+    if not os.path.exists(job["key"]):
+        result["issues"].append("key_missing")
+    else:
+        try:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(job["cert"], job["key"])
+        except ssl.SSLError as e:
+            result["issues"].append("key_mismatch" if "mismatch" in str(e).lower() else "key_unreadable")
+        except OSError:
+            result["issues"].append("key_unreadable")
+
+    # Chain: each certificate is issued by the next, and the last one by a trusted root
+    if any(cert is None for cert in chain):
+        result["issues"].append("chain_unparseable")
+    else:
+        for child, parent in zip(chain, chain[1:]):
+            if child.issuer != parent.subject:
+                result["issues"].append("chain_out_of_order")
+                break
+        last = chain[-1]
+        self_signed = last.issuer == last.subject
+        trusted = _trusted_roots()
+        if len(chain) == 1 and self_signed:
+            result["issues"].append("self_signed")
+        elif trusted and self_signed and last.subject.public_bytes() not in trusted:
+            result["issues"].append("untrusted_root")
+        elif trusted and not self_signed and last.issuer.public_bytes() not in trusted:
+            # Without a readable trust store the root cannot be checked offline
+            result["issues"].append("chain_incomplete")
+
+    # Coverage: SANs (or the subject CN without them) against the vhost's server_name
+    names = certificate_names(leaf)
+    missing = [name for name in job["names"] if not CertificateIndex.covers({"names": names}, name)]
+    if missing:
+        result["issues"].append("name_not_covered")
+        result["uncovered"] = missing
+    return result
+
+
+class TlsAuditor:
+    """
+    Fleet-wide TLS audit of an ssl directory.
+
+    Results are cached by the stat of the certificate, its key and the vhost
+    that declares the names, so a re-audit only re-checks what changed since.
+    Changed certificates are checked in a process pool; everything works on
+    local files only.
+    """
+
+    def __init__(self, cache_file: str, workers: Optional[int] = None):
+        self.cache_file = cache_file
+        self.workers = workers
+
+    def _load_cache(self) -> Dict:
+        try:
+            with open(self.cache_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self, cache: Dict) -> None:
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        tmp_file = f"{self.cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(cache, f, separators=(",", ":"))
+        os.replace(tmp_file, self.cache_file)
+
+    @staticmethod
+    def _stat_key(*paths: Optional[str]) -> List:
+        key = []
+        for path in paths:
+            try:
+                st = os.stat(path) if path else None
+            except OSError:
+                st = None
+            key.append([st.st_ino, st.st_size, st.st_mtime_ns] if st else None)
+        return key
+
+    def run(self, certificates: List[Tuple[str, str, str, Optional[str]]]) -> Dict:
+        """Audit (domain, cert path, key path, vhost path) entries and summarize the findings"""
+        if x509_module() is None:
+            raise RuntimeError("The TLS audit needs the cryptography package")
+        cache = self._load_cache()
+        results: Dict[str, Dict] = {}
+        pending = []
+        keys = {}
+
+        for domain, cert_file, key_file, conf_file in certificates:
+            key = self._stat_key(cert_file, key_file, conf_file)
+            keys[cert_file] = key
+            cached = cache.get(cert_file)
+            if cached and cached["key"] == key:
+                results[cert_file] = cached["result"]
+            else:
+                pending.append({"domain": domain, "cert": cert_file, "key": key_file,
+                                "names": vhost_names(conf_file, domain)})
+
+        if len(pending) >= POOL_THRESHOLD:
+            from concurrent.futures import ProcessPoolExecutor
+
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                audited = list(pool.map(audit_certificate, pending, chunksize=8))
+        else:
+            audited = [audit_certificate(job) for job in pending]
+        for result in audited:
+            results[result["cert"]] = result
+
+        # Entries for certificates that are gone are dropped with the rewrite
+        self._save_cache({path: {"key": keys[path], "result": results[path]} for path in results})
+
+        now = datetime.now()
+        report = []
+        counts: Dict[str, int] = {}
+        for path in sorted(results):
+            entry = dict(results[path])
+            entry["issues"] = list(entry["issues"])
+            if entry["notAfter"]:
+                days_left = (datetime.fromisoformat(entry["notAfter"]) - now).days
+                entry["daysToExpire"] = days_left
+                # Expiry changes with the clock, so it is not part of the cached result
+                if days_left < 0:
+                    entry["issues"].append("expired")
+            entry["ok"] = not entry["issues"]
+            for issue in entry["issues"]:
+                counts[issue] = counts.get(issue, 0) + 1
+            report.append(entry)
+
+        return {
+            "checked": len(report),
+            "reaudited": len(pending),
+            "failing": sum(1 for entry in report if not entry["ok"]),
+            "issues": counts,
+            "certificates": report
+        }
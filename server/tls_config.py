@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Tuple
+
+# Defaults for the TLS block added when a certificate is installed.
+# Any key can be overridden in the manager's tls-profile.json.
+TLS_DEFAULTS: Dict = {
+    "http2": True,
+    "protocols": "TLSv1.2 TLSv1.3",
+    "ciphers": ("ECDHE-ECDSA-AES128-GCM-SHA256:ECDHE-RSA-AES128-GCM-SHA256:"
+                "ECDHE-ECDSA-AES256-GCM-SHA384:ECDHE-RSA-AES256-GCM-SHA384:"
+                "ECDHE-ECDSA-CHACHA20-POLY1305:ECDHE-RSA-CHACHA20-POLY1305"),
+    # One shared cache across workers lets clients resume instead of doing a full handshake
+    "session_cache": "shared:managed_tls:20m",
+    "session_timeout": "1d",
+    # Tickets are off by default: the ticket key never rotates without a restart
+    "session_tickets": False,
+    # Staple {domain}.ocsp from the ssl directory when that file exists
+    "stapling": True,
+    "redirect": True,
+    # acme.sh --keylength values; the first is served as {domain}.crt.
+    # ["ec-256", "2048"] serves ECDSA and RSA certificates side by side.
+    "key_types": ["ec-256"],
+}
+
+SNIPPET_NAME = "tls-common.conf"
+
+# Marks the generated port 80 server block appended to a TLS vhost
+REDIRECT_MARKER = "# Managed: HTTP to HTTPS redirect"
+
+_MANAGED_TLS_LINE = re.compile(
+    r"^\s*(listen 443 ssl( http2)?;|ssl_certificate(_key)? \S+;|ssl_stapling on;|ssl_stapling_file \S+;"
+    r"|include \S+/" + re.escape(SNIPPET_NAME) + r";)\s*$"
+)
+
+
+def load_tls_profile(path: str) -> Dict:
+    """TLS defaults merged with the overrides in path, if it exists"""
+    profile = dict(TLS_DEFAULTS)
+    try:
+        with open(path, 'r') as f:
+            overrides = json.load(f)
+    except FileNotFoundError:
+        return profile
+
+    unknown = set(overrides) - set(TLS_DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown TLS profile settings: {', '.join(sorted(unknown))}")
+    profile.update(overrides)
+
+    if not profile["key_types"] or not all(re.match(r"^(ec-(256|384)|2048|3072|4096)$", str(k)) for k in profile["key_types"]):
+        raise ValueError("key_types must list acme.sh key lengths such as ec-256 or 2048")
+    return profile
+
+
+def is_ecc(key_type: str) -> bool:
+    return str(key_type).startswith("ec-")
+
+
+def certificate_files(ssl_dir: str, domain: str, key_types: List[str]) -> List[Tuple[str, str, str]]:
+    """(key type, certificate path, key path) for each configured key type"""
+    files = []
+    for index, key_type in enumerate(key_types):
+        # The first key type keeps the plain name the certificate index and expiry checks use
+        stem = domain if index == 0 else f"{domain}.{'ecc' if is_ecc(key_type) else 'rsa'}"
+        files.append((key_type, os.path.join(ssl_dir, f"{stem}.crt"), os.path.join(ssl_dir, f"{stem}.key")))
+    return files
+
+
+def acme_commands(acme_home: str, domain: str, webroot: str, ssl_dir: str,
+                  key_types: List[str], force: bool = False) -> List[Tuple[str, str]]:
+    """(issue command, install command) pairs for acme.sh, one per key type"""
+    commands = []
+    for key_type, cert_file, key_file in certificate_files(ssl_dir, domain, key_types):
+        ecc_flag = " --ecc" if is_ecc(key_type) else ""
+        issue = (f"{acme_home}/acme.sh --issue -d {domain} -d www.{domain} --webroot {webroot}"
+                 f" --keylength {key_type}" + (" --force" if force else ""))
+        install = (f'{acme_home}/acme.sh --install-cert -d {domain}{ecc_flag} --key-file {key_file}'
+                   f' --fullchain-file {cert_file} --reloadcmd "systemctl reload nginx"')
+        commands.append((issue, install))
+    return commands
+
+
+def render_tls_snippet(profile: Dict) -> str:
+    """Shared TLS settings included by every TLS server block"""
+    return f'''ssl_protocols {profile["protocols"]};
+ssl_ciphers {profile["ciphers"]};
+ssl_prefer_server_ciphers off;
+ssl_session_cache {profile["session_cache"]};
+ssl_session_timeout {profile["session_timeout"]};
+ssl_session_tickets {"on" if profile["session_tickets"] else "off"};
+'''
+
+
+def write_tls_snippet(snippets_dir: str, profile: Dict) -> bool:
+    """Write tls-common.conf, returning whether it changed"""
+    os.makedirs(snippets_dir, exist_ok=True)
+    path = os.path.join(snippets_dir, SNIPPET_NAME)
+    content = render_tls_snippet(profile)
+    try:
+        with open(path, 'r') as f:
+            if f.read() == content:
+                return False
+    except OSError:
+        pass
+
+    tmp_file = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_file, 'w') as f:
+        f.write(content)
+    os.replace(tmp_file, path)
+    return True
+
+
+def render_redirect_block(domain: str, webroot: str) -> str:
+    """Port 80 server that keeps serving acme challenges and redirects everything else"""
+    return f'''{REDIRECT_MARKER}
+server {{
+    listen 80;
+    server_name {domain} www.{domain};
+
+    location ^~ /.well-known/acme-challenge/ {{
+        root {webroot};
+        default_type "text/plain";
+        try_files $uri =404;
+    }}
+
+    location / {{
+        return 301 https://$host$request_uri;
+    }}
+}}
+'''
+
+
+def apply_tls(config: str, domain: str, snippets_dir: str, ssl_dir: str, webroot: str, profile: Dict) -> str:
+    """
+    Add the TLS block to a vhost. Managed TLS lines from an earlier install are
+    replaced, so re-running with a changed profile or extra key type is safe.
+    """
+    certificates = certificate_files(ssl_dir, domain, profile["key_types"])
+    http2 = " http2" if profile["http2"] else ""
+
+    tls_lines = [f"    listen 443 ssl{http2};"]
+    for key_type, cert_file, key_file in certificates:
+        tls_lines.append(f"    ssl_certificate {cert_file};")
+        tls_lines.append(f"    ssl_certificate_key {key_file};")
+    tls_lines.append(f"    include {snippets_dir}/{SNIPPET_NAME};")
+
+    # A stapling file holds the response for one certificate, so it is only used with a single key type
+    stapling_file = os.path.join(ssl_dir, f"{domain}.ocsp")
+    if profile["stapling"] and len(certificates) == 1 and os.path.exists(stapling_file):
+        tls_lines.append("    ssl_stapling on;")
+        tls_lines.append(f"    ssl_stapling_file {stapling_file};")
+
+    main_block = config.split(REDIRECT_MARKER)[0].rstrip("\n")
+    lines = [line for line in main_block.split("\n") if not _MANAGED_TLS_LINE.match(line)]
+
+    # With a redirect the port 80 listener moves to its own server block
+    lines = [line for line in lines if line.strip() != "listen 80;"]
+    if not profile["redirect"]:
+        tls_lines.insert(0, "    listen 80;")
+
+    for i, line in enumerate(lines):
+        if f"server_name {domain}" in line:
+            lines[i+1:i+1] = tls_lines
+            break
+    else:
+        raise ValueError(f"No server_name {domain} line in configuration")
+
+    result = "\n".join(lines) + "\n"
+    if profile["redirect"]:
+        result += "\n" + render_redirect_block(domain, webroot)
+    return result
+
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+
+import glob
+import gzip
+import json
+import mmap
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+# http-level format for the per-domain logs: one space-separated line per request.
+# The domain is the log file name, so it is not repeated on every line.
+LOG_FORMAT_NAME = "domain_traffic"
+LOG_FORMAT = f"log_format {LOG_FORMAT_NAME} '$msec $status $bytes_sent $request_time';"
+
+LOG_SUFFIX = ".access.log"
+
+# Per bucket: requests, bytes, 1xx, 2xx, 3xx, 4xx, 5xx
+_REQUESTS, _BYTES, _STATUS = 0, 1, 2
+
+
+def access_log_path(log_dir: str, domain: str) -> str:
+    return os.path.join(log_dir, f"{domain}{LOG_SUFFIX}")
+
+
+def access_log_directive(log_dir: str, domain: str) -> str:
+    """access_log line for a vhost; buffered so busy sites do not write per request"""
+    return f"access_log {access_log_path(log_dir, domain)} {LOG_FORMAT_NAME} buffer=32k flush=5s;"
+
+
+class TrafficAggregator:
+    """
+    Incremental per-domain traffic counts from the per-domain access logs.
+
+    Each run maps only the bytes appended since the saved offset of every log
+    and folds complete lines into requests, bytes and status-class counts per
+    time bucket. Offsets live in a small index and the buckets in one file per
+    domain, so a run only rewrites the domains whose log grew.
+    Offsets are tracked per inode: when the log's inode changes or it shrinks,
+    the previous file is found again under any rotated name (numbered or
+    dateext) by its inode, or among copied and compressed rotations by its
+    first bytes, and finished from the old offset before the new file is read
+    from the start.
+    """
+
+    # Bytes of the start of a log kept to recognise it once it is compressed
+    HEAD_BYTES = 64
+
+    def __init__(self, log_dir: str, state_dir: str, bucket_seconds: int = 3600, retention_buckets: int = 168):
+        self.log_dir = log_dir
+        self.state_dir = state_dir
+        self.index_file = os.path.join(state_dir, "offsets.json")
+        self.buckets_dir = os.path.join(state_dir, "buckets")
+        self.bucket_seconds = bucket_seconds
+        self.retention_buckets = retention_buckets
+
+    @staticmethod
+    def _write_json(path: str, data) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_file = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'w') as f:
+            # dumps() uses the C encoder; dump() to a file streams through the Python one
+            f.write(json.dumps(data, separators=(",", ":")))
+        os.replace(tmp_file, path)
+
+    def _load_index(self) -> Dict[str, Dict]:
+        try:
+            with open(self.index_file, 'r') as f:
+                index = json.load(f)
+            if index.get("bucket_seconds") == self.bucket_seconds:
+                return index["files"]
+        except (OSError, ValueError, KeyError):
+            pass
+        return {}
+
+    def _buckets_file(self, domain: str) -> str:
+        return os.path.join(self.buckets_dir, f"{domain}.json")
+
+    def buckets(self, domain: str) -> Dict[str, List[int]]:
+        """The saved buckets of one domain"""
+        try:
+            with open(self._buckets_file(domain), 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def all_buckets(self) -> Dict[str, Dict[str, List[int]]]:
+        """The saved buckets of every domain"""
+        try:
+            names = os.listdir(self.buckets_dir)
+        except OSError:
+            return {}
+        return {name[:-len(".json")]: self.buckets(name[:-len(".json")]) for name in names if name.endswith(".json")}
+
+    @staticmethod
+    def _head(path: str) -> str:
+        try:
+            with open(path, 'rb') as f:
+                return f.read(TrafficAggregator.HEAD_BYTES).hex()
+        except OSError:
+            return ""
+
+    def _read_from(self, path: str, offset: int, buckets: Dict[str, List[int]]) -> int:
+        """Fold complete lines after offset into buckets; return the new offset"""
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size <= offset:
+                return offset
+
+            # mmap offsets must be page aligned
+            start = offset - offset % mmap.ALLOCATIONGRANULARITY
+            with mmap.mmap(f.fileno(), size - start, access=mmap.ACCESS_READ, offset=start) as data:
+                position = offset - start
+                end = len(data)
+                while position < end:
+                    newline = data.find(b"\n", position)
+                    if newline == -1:
+                        # Partial line still being written; pick it up next run
+                        break
+                    self._count(data[position:newline], buckets)
+                    position = newline + 1
+                return start + position
+
+    def _count(self, line: bytes, buckets: Dict[str, List[int]]) -> None:
+        parts = line.split()
+        if len(parts) < 3:
+            return
+        try:
+            timestamp = float(parts[0])
+            status = int(parts[1])
+            sent = int(parts[2])
+        except ValueError:
+            return
+
+        bucket = str(int(timestamp) // self.bucket_seconds * self.bucket_seconds)
+        counts = buckets.get(bucket)
+        if counts is None:
+            counts = buckets[bucket] = [0, 0, 0, 0, 0, 0, 0]
+        counts[_REQUESTS] += 1
+        counts[_BYTES] += sent
+        status_class = status // 100
+        if 1 <= status_class <= 5:
+            counts[_STATUS + status_class - 1] += 1
+
+    def _finish_rotated(self, path: str, saved: Dict, buckets: Dict[str, List[int]]) -> None:
+        """Read the rest of the previous log, wherever rotation moved it"""
+        if not saved["offset"]:
+            return
+        candidates = []
+        for candidate in glob.glob(f"{glob.escape(path)}?*"):
+            try:
+                st = os.stat(candidate)
+            except OSError:
+                continue
+            if st.st_ino == saved["inode"]:
+                self._read_from(candidate, saved["offset"], buckets)
+                return
+            candidates.append((st.st_mtime, candidate))
+
+        # Copies (copytruncate, compression) have a new inode; the newest one that
+        # starts like the old log is it
+        head = bytes.fromhex(saved.get("head", ""))
+        if not head:
+            return
+        for _, candidate in sorted(candidates, reverse=True):
+            try:
+                with (gzip.open if candidate.endswith(".gz") else open)(candidate, 'rb') as f:
+                    if f.read(len(head)) != head:
+                        continue
+                    f.seek(saved["offset"])
+                    lines = f.read().split(b"\n")
+            except (OSError, EOFError):
+                continue
+            for line in lines[:-1]:
+                self._count(line, buckets)
+            return
+
+    def update(self) -> List[str]:
+        """Process new bytes in every log; return the domains whose counts changed"""
+        files = self._load_index()
+        index = {}
+        changed = []
+
+        for path in glob.glob(os.path.join(self.log_dir, f"*{LOG_SUFFIX}")):
+            domain = os.path.basename(path)[:-len(LOG_SUFFIX)]
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+
+            saved = files.get(domain)
+            if saved and saved["inode"] == st.st_ino and st.st_size == saved["offset"]:
+                # Nothing appended since the last run
+                index[domain] = saved
+                continue
+
+            # Without a saved offset the log is read from the start, so old counts are not kept
+            buckets = self.buckets(domain) if saved else {}
+            offset = 0
+            if saved:
+                if saved["inode"] == st.st_ino and st.st_size >= saved["offset"]:
+                    offset = saved["offset"]
+                else:
+                    # Renamed away, or truncated or replaced under the same inode
+                    self._finish_rotated(path, saved, buckets)
+
+            entry = {"inode": st.st_ino, "offset": self._read_from(path, offset, buckets), "head": self._head(path)}
+            index[domain] = entry
+            if entry != saved:
+                # Keep a bounded window of buckets
+                if buckets:
+                    cutoff = max(int(b) for b in buckets) - self.retention_buckets * self.bucket_seconds
+                    buckets = {b: counts for b, counts in buckets.items() if int(b) > cutoff}
+                self._write_json(self._buckets_file(domain), buckets)
+                changed.append(domain)
+
+        # Logs that disappeared (domain deleted) stop being tracked; their counts
+        # are dropped once they are older than the retention window
+        expired = time.time() - self.retention_buckets * self.bucket_seconds
+        try:
+            names = os.listdir(self.buckets_dir)
+        except OSError:
+            names = []
+        for name in names:
+            if name.endswith(".json") and name[:-len(".json")] not in index:
+                path = os.path.join(self.buckets_dir, name)
+                try:
+                    if os.stat(path).st_mtime < expired:
+                        os.remove(path)
+                except OSError:
+                    pass
+
+        if index != files:
+            self._write_json(self.index_file, {"bucket_seconds": self.bucket_seconds, "files": index})
+        return changed
+
+    @staticmethod
+    def summarize(buckets: Dict[str, List[int]], since: Optional[int] = None) -> Dict:
+        """Totals over the buckets starting at or after since (epoch seconds)"""
+        selected = [counts for bucket, counts in buckets.items() if since is None or int(bucket) >= since]
+        totals = [sum(column) for column in zip(*selected)] if selected else [0, 0, 0, 0, 0, 0, 0]
+        return {
+            "requests": totals[_REQUESTS],
+            "bytes": totals[_BYTES],
+            "status": {f"{i + 1}xx": totals[_STATUS + i] for i in range(5)}
+        }
+
+    @staticmethod
+    def series(buckets: Dict[str, List[int]], since: Optional[int] = None) -> List[Dict]:
+        """Per-bucket counts in time order"""
+        result = []
+        for bucket in sorted(buckets, key=int):
+            if since is not None and int(bucket) < since:
+                continue
+            counts = buckets[bucket]
+            result.append({
+                "start": int(bucket),
+                "requests": counts[_REQUESTS],
+                "bytes": counts[_BYTES],
+                "status": {f"{i + 1}xx": counts[_STATUS + i] for i in range(5)}
+            })
+        return result
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import threading
+from typing import List, Tuple
+
+from traffic_log import LOG_FORMAT
+
+DEFAULT_UPSTREAM = "localhost:3000"
+
+_HOST_PATTERN = re.compile(r'^(?:[a-zA-Z0-9](?:[a-zA-Z0-9\-]{0,61}[a-zA-Z0-9])?)(?:\.[a-zA-Z0-9](?:[a-zA-Z0-9\-]{0,61}[a-zA-Z0-9])?)*$')
+
+
+def parse_upstream(address: str) -> Tuple[str, int]:
+    """Split and validate a host:port upstream address"""
+    host, sep, port = address.rpartition(":")
+    if not sep or not _HOST_PATTERN.match(host) or not port.isdigit() or not 0 < int(port) < 65536:
+        raise ValueError(f"Invalid upstream address: {address}")
+    return host.lower(), int(port)
+
+
+def upstream_name(address: str) -> str:
+    """Name of the upstream block for an address, e.g. backend_localhost_3000"""
+    host, port = parse_upstream(address)
+    return f"backend_{re.sub(r'[^a-z0-9]', '_', host)}_{port}"
+
+
+class UpstreamRegistry:
+    """
+    http-level configuration shared by all vhosts: one upstream block with a
+    keepalive pool per distinct backend address, plus the map that only sends
+    "Connection: upgrade" for real WebSocket requests so other requests can
+    reuse pooled upstream connections.
+    The per-domain access log format is defined here too.
+    Upstreams, maps and log formats may only be defined once, so they live in a
+    single 00-http-common.conf vhost file that is regenerated when a new backend
+    appears or the shared settings change. nginx reads sites-enabled in glob
+    order and a log format must be defined before a vhost uses it, so the name
+    sorts ahead of every domain.
+    """
+
+    VHOST_NAME = "00-http-common"
+    # Earlier name, which sorted after digits and uppercase letters; replaced on the next write
+    LEGACY_VHOST_NAME = "_http-common"
+
+    def __init__(self, sites_available: str, sites_enabled: str, keepalive: int = 32):
+        self.conf_file = os.path.join(sites_available, f"{self.VHOST_NAME}.conf")
+        self.link_file = os.path.join(sites_enabled, f"{self.VHOST_NAME}.conf")
+        self.legacy_conf_file = os.path.join(sites_available, f"{self.LEGACY_VHOST_NAME}.conf")
+        self.legacy_link_file = os.path.join(sites_enabled, f"{self.LEGACY_VHOST_NAME}.conf")
+        self.keepalive = keepalive
+
+    def addresses(self) -> List[str]:
+        """Backend addresses that currently have an upstream block"""
+        addresses = []
+        conf_file = self.conf_file if os.path.exists(self.conf_file) else self.legacy_conf_file
+        try:
+            with open(conf_file, 'r') as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) >= 2 and parts[0] == "server":
+                        addresses.append(parts[1].rstrip(";"))
+        except OSError:
+            pass
+        return addresses
+
+    def render(self, addresses: List[str]) -> str:
+        blocks = ['''# Generated by the domain manager - shared http-level settings
+map $http_upgrade $connection_upgrade {
+    default upgrade;
+    ''      '';
+}
+
+''' + LOG_FORMAT + "\n"]
+        for address in addresses:
+            blocks.append(f'''
+upstream {upstream_name(address)} {{
+    server {address};
+    keepalive {self.keepalive};
+    keepalive_requests 1000;
+    keepalive_timeout 60s;
+}}
+''')
+        return "".join(blocks)
+
+    def ensure(self, address: str) -> str:
+        """Make sure an upstream block exists for address and return its name"""
+        name = upstream_name(address)
+        addresses = self.addresses()
+        host, port = parse_upstream(address)
+        normalized = f"{host}:{port}"
+
+        if normalized not in addresses:
+            addresses.append(normalized)
+        content = self.render(addresses)
+
+        # Also rewritten when the shared settings themselves changed
+        try:
+            with open(self.conf_file, 'r') as f:
+                current = f.read()
+        except OSError:
+            current = None
+
+        if content != current:
+            tmp_file = f"{self.conf_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_file, 'w') as f:
+                f.write(content)
+            os.replace(tmp_file, self.conf_file)
+        if not os.path.lexists(self.link_file):
+            os.symlink(self.conf_file, self.link_file)
+        # Two copies would define every upstream twice
+        for path in (self.legacy_link_file, self.legacy_conf_file):
+            if os.path.lexists(path):
+                os.remove(path)
+
+        return name
@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+
+import difflib
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import Callable, Dict, List, Tuple
+
+from tls_config import REDIRECT_MARKER
+
+# Name used to fingerprint the template itself; any change to the generator
+# changes the config rendered for it and invalidates every cached expectation
+TEMPLATE_PROBE_DOMAIN = "drift-probe.invalid"
+
+# Lines the managers splice into existing vhosts (acme challenge location,
+# TLS listeners, certificate paths, TLS settings and per-domain access logs).
+# They are expected edits, not drift.
+MANAGED_LINE_PATTERNS = [
+    re.compile(r"^location \^~ /\.well-known/acme-challenge/ \{$"),
+    re.compile(r"^root /var/www/letsencrypt;$"),
+    re.compile(r'^default_type "text/plain";$'),
+    re.compile(r"^try_files \$uri =404;$"),
+    re.compile(r"^listen (80|443 ssl( http2)?);$"),
+    re.compile(r"^ssl_certificate(_key)? \S+;$"),
+    re.compile(r"^include \S+/tls-common\.conf;$"),
+    re.compile(r"^ssl_stapling( on|_file \S+);$"),
+    re.compile(r"^access_log \S+ domain_traffic .*;$"),
+]
+
+
+# Per-domain settings chosen through the API rather than hand edits
+PER_DOMAIN_SETTINGS = [
+    (re.compile(r"^proxy_pass http://backend_[a-z0-9_]+;$"), "proxy_pass http://<upstream>;"),
+    (re.compile(r"^include \S+/profile-[a-z-]+\.conf;$"), "include <profile>;"),
+]
+
+
+def normalize_config(text: str) -> List[str]:
+    """Normalize a vhost for comparison: whitespace, comment lines, managed edits and per-domain settings removed"""
+    lines = []
+    skip_closing_brace = False
+
+    for raw in text.splitlines():
+        line = " ".join(raw.split())
+        if line == REDIRECT_MARKER:
+            # The generated HTTP to HTTPS redirect server closes the file
+            break
+        if not line or line.startswith("#"):
+            continue
+
+        if any(pattern.match(line) for pattern in MANAGED_LINE_PATTERNS):
+            # The acme challenge block closes with its own brace
+            skip_closing_brace = skip_closing_brace or "acme-challenge" in line
+            continue
+        if skip_closing_brace and line == "}":
+            skip_closing_brace = False
+            continue
+
+        for pattern, replacement in PER_DOMAIN_SETTINGS:
+            if pattern.match(line):
+                line = replacement
+
+        lines.append(line)
+
+    return lines
+
+
+def content_hash(lines: List[str]) -> str:
+    return hashlib.sha1("\n".join(lines).encode()).hexdigest()
+
+
+class DriftDetector:
+    """
+    Compares on-disk vhost configs with what the generator would produce.
+    Results are cached by file stat and by the hash of the expected output,
+    so repeated audits only re-read configs that changed since the last run.
+    """
+
+    def __init__(self, generate: Callable[[str], str], cache_file: str):
+        self.generate = generate
+        self.cache_file = cache_file
+
+    def _load_cache(self) -> Dict:
+        try:
+            with open(self.cache_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"template": None, "files": {}}
+
+    def _save_cache(self, cache: Dict) -> None:
+        os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
+        tmp_file = f"{self.cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(cache, f, separators=(",", ":"))
+        os.replace(tmp_file, self.cache_file)
+
+    def _diff(self, domain: str, conf_file: str) -> str:
+        with open(conf_file, 'r') as f:
+            actual = normalize_config(f.read())
+        expected = normalize_config(self.generate(domain))
+        return "\n".join(difflib.unified_diff(
+            expected, actual, fromfile=f"expected/{domain}.conf", tofile=f"actual/{domain}.conf", lineterm=""
+        ))
+
+    def detect(self, conf_files: List[Tuple[str, str]], include_diff: bool = True) -> Dict:
+        """Report which of the given (domain, config path) pairs deviate from the template"""
+        cache = self._load_cache()
+        template = content_hash(normalize_config(self.generate(TEMPLATE_PROBE_DOMAIN)))
+        if cache.get("template") != template:
+            # Template changed - every expected hash is stale, file hashes still hold
+            for entry in cache["files"].values():
+                entry["expected"] = None
+            cache["template"] = template
+
+        files = {}
+        drifted = []
+        reread = 0
+
+        for domain, conf_file in conf_files:
+            try:
+                st = os.stat(conf_file)
+            except OSError:
+                continue
+
+            stat_key = [st.st_ino, st.st_size, st.st_mtime_ns]
+            entry = cache["files"].get(domain)
+            if not entry or entry["stat"] != stat_key:
+                with open(conf_file, 'r') as f:
+                    actual_hash = content_hash(normalize_config(f.read()))
+                entry = {"stat": stat_key, "hash": actual_hash, "expected": None}
+                reread += 1
+
+            if entry["expected"] is None:
+                entry["expected"] = content_hash(normalize_config(self.generate(domain)))
+
+            files[domain] = entry
+            if entry["hash"] != entry["expected"]:
+                report = {"name": domain}
+                if include_diff:
+                    report["diff"] = self._diff(domain, conf_file)
+                drifted.append(report)
+
+        # Entries for domains that no longer exist are dropped with the rewrite
+        cache["files"] = files
+        self._save_cache(cache)
+
+        return {
+            "checked": len(files),
+            "reread": reread,
+            "drifted": drifted
+        }
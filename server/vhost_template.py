@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+import os
+import re
+import threading
+from typing import Dict, List, Optional
+
+
+def render_legacy_vhost(server_name: str, listen: bool = True) -> str:
+    """
+    The original fully inlined vhost, kept to recognise configs written with it.
+    The nginx-reloading manager wrote it without the listen line, which nginx
+    treats the same as listen 80.
+    """
+    listen_line = "\n    listen 80;" if listen else ""
+    return rf'''server {{{listen_line}
+    server_name {server_name} www.{server_name};
+    root /data/site/public;
+    add_header X-Frame-Options "SAMEORIGIN";
+    add_header X-XSS-Protection "1; mode=block";
+    add_header X-Content-Type-Options "nosniff";
+    index index.php index.html index.htm;
+    charset utf-8;
+
+    location / {{
+        proxy_read_timeout     60;
+        proxy_connect_timeout  60;
+        proxy_redirect off;
+        proxy_http_version 1.1;
+        proxy_set_header Upgrade $http_upgrade;
+        proxy_set_header Connection 'upgrade';
+        proxy_cache_bypass $http_upgrade;
+        proxy_set_header Host $host ;
+        proxy_set_header X-Real-IP $remote_addr ;
+        proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for ;
+        proxy_set_header X-Forwarded-Proto https;
+        proxy_pass             http://localhost:3000;
+    }}
+
+    location @rules {{
+        rewrite ^(.*)$ $1.php last;
+    }}
+
+    location = /favicon.ico {{
+        access_log off;
+        log_not_found off;
+    }}
+
+    location = /robots.txt {{
+        access_log off;
+        log_not_found off;
+    }}
+
+    error_page 404 /index.php;
+
+    location ~ \.php$ {{
+        fastcgi_pass unix:/var/run/php-fpm/www.sock;
+        fastcgi_param SCRIPT_FILENAME $document_root$fastcgi_script_name;
+        include fastcgi_params;
+    }}
+
+    location ~ /\.(?!well-known).* {{
+        deny all;
+    }}
+}}
+'''
+
+
+# Settings shared by every vhost. They are written once to the snippets
+# directory and included, so nginx parses them once per file instead of once
+# per domain and a change to a common setting is a one-file edit.
+SNIPPETS: Dict[str, str] = {
+    "security-headers.conf": '''add_header X-Frame-Options "SAMEORIGIN";
+add_header X-XSS-Protection "1; mode=block";
+add_header X-Content-Type-Options "nosniff";
+index index.php index.html index.htm;
+charset utf-8;
+''',
+    "proxy-common.conf": '''proxy_redirect off;
+proxy_http_version 1.1;
+proxy_set_header Upgrade $http_upgrade;
+proxy_set_header Connection $connection_upgrade;
+proxy_cache_bypass $http_upgrade;
+proxy_set_header Host $host ;
+proxy_set_header X-Real-IP $remote_addr ;
+proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for ;
+proxy_set_header X-Forwarded-Proto https;
+''',
+    "site-common.conf": r'''location @rules {
+    rewrite ^(.*)$ $1.php last;
+}
+
+location = /favicon.ico {
+    access_log off;
+    log_not_found off;
+}
+
+location = /robots.txt {
+    access_log off;
+    log_not_found off;
+}
+
+error_page 404 /index.php;
+
+location ~ /\.(?!well-known).* {
+    deny all;
+}
+''',
+    "php-fpm.conf": r'''location ~ \.php$ {
+    fastcgi_pass unix:/var/run/php-fpm/www.sock;
+    fastcgi_param SCRIPT_FILENAME $document_root$fastcgi_script_name;
+    include fastcgi_params;
+}
+''',
+}
+
+
+# Static assets served straight from the document root with long expiry.
+# add_header in a location replaces the server-level headers, so they are
+# included again here. The lifetime goes in Cache-Control alone: expires
+# would add a second Cache-Control header of its own.
+def _static_assets_location(snippets_dir: str, cache_control: str) -> str:
+    return f'''location ~* \\.(?:css|js|mjs|map|jpe?g|png|gif|webp|avif|ico|svg|woff2?|ttf|eot|mp4|webm)$ {{
+    include {snippets_dir}/security-headers.conf;
+    add_header Cache-Control "{cache_control}";
+    access_log off;
+    try_files $uri @rules;
+}}
+'''
+
+
+_COMPRESSION = '''gzip on;
+gzip_comp_level 5;
+gzip_min_length 1024;
+gzip_proxied any;
+gzip_vary on;
+gzip_types text/plain text/css text/xml application/json application/javascript application/xml application/rss+xml image/svg+xml;
+'''
+
+
+def render_profiles(snippets_dir: str) -> Dict[str, str]:
+    """Performance profile snippets, included at the end of each vhost's server block"""
+    return {
+        # Dynamic app behind the upstream: compression and proxy buffering only
+        "proxy-app": _COMPRESSION + '''proxy_connect_timeout 60s;
+proxy_read_timeout 60s;
+proxy_send_timeout 60s;
+proxy_buffering on;
+proxy_buffer_size 16k;
+proxy_buffers 16 16k;
+proxy_busy_buffers_size 32k;
+''',
+        # PHP application: cached file metadata, FastCGI buffers, static assets for a week
+        "php-site": _COMPRESSION + '''open_file_cache max=10000 inactive=60s;
+open_file_cache_valid 120s;
+open_file_cache_min_uses 2;
+open_file_cache_errors on;
+fastcgi_buffer_size 32k;
+fastcgi_buffers 16 16k;
+fastcgi_read_timeout 120s;
+proxy_connect_timeout 60s;
+proxy_read_timeout 60s;
+''' + _static_assets_location(snippets_dir, "public, max-age=604800"),
+        # Mostly static files: precompressed assets, large descriptor cache, long expiry
+        "static-heavy": _COMPRESSION + '''gzip_static on;
+sendfile on;
+tcp_nopush on;
+open_file_cache max=50000 inactive=300s;
+open_file_cache_valid 300s;
+open_file_cache_min_uses 1;
+open_file_cache_errors on;
+proxy_connect_timeout 30s;
+proxy_read_timeout 30s;
+''' + _static_assets_location(snippets_dir, "public, max-age=2592000, immutable"),
+    }
+
+
+DEFAULT_PROFILE = "proxy-app"
+PROFILE_NAMES = ["proxy-app", "php-site", "static-heavy"]
+
+
+def write_snippets(snippets_dir: str) -> List[str]:
+    """Write the shared snippets, returning the names of files that changed"""
+    os.makedirs(snippets_dir, exist_ok=True)
+    changed = []
+
+    snippets = dict(SNIPPETS)
+    for profile, content in render_profiles(snippets_dir).items():
+        snippets[f"profile-{profile}.conf"] = f"# Performance profile: {profile}\n" + content
+
+    for name, content in snippets.items():
+        path = os.path.join(snippets_dir, name)
+        try:
+            with open(path, 'r') as f:
+                if f.read() == content:
+                    continue
+        except OSError:
+            pass
+
+        tmp_file = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, 'w') as f:
+            f.write(content)
+        os.replace(tmp_file, path)
+        changed.append(name)
+
+    return changed
+
+
+def matches_template(config: str, expected: str) -> bool:
+    """Check whether a vhost is the untouched template output (whitespace aside)"""
+    normalized = lambda text: [" ".join(line.split()) for line in text.splitlines() if line.strip()]
+    return normalized(config) == normalized(expected)
+
+
+def render_vhost(server_name: str, snippets_dir: str, upstream: str,
+                 profile: Optional[str] = DEFAULT_PROFILE, access_log: Optional[str] = None) -> str:
+    """Render a vhost that includes the shared snippets and proxies to a named upstream"""
+    if profile is not None and profile not in PROFILE_NAMES:
+        raise ValueError(f"Unknown performance profile: {profile}")
+
+    profile_include = f"\n    include {snippets_dir}/profile-{profile}.conf;" if profile else ""
+    access_log_line = f"\n    {access_log}" if access_log else ""
+    return f'''server {{
+    listen 80;
+    server_name {server_name} www.{server_name};{access_log_line}
+    root /data/site/public;
+    include {snippets_dir}/security-headers.conf;
+
+    location / {{
+        include {snippets_dir}/proxy-common.conf;
+        proxy_pass             http://{upstream};
+    }}
+
+    include {snippets_dir}/site-common.conf;
+    include {snippets_dir}/php-fpm.conf;{profile_include}
+}}
+'''
+
+
+def upgrade_vhost(config: str, server_name: str, snippets_dir: str, default_upstream: str) -> Optional[str]:
+    """Re-render a vhost written by an earlier template, keeping its upstream; None if it was not"""
+    match = re.search(r"^\s*proxy_pass\s+http://(backend_[a-z0-9_]+);", config, re.MULTILINE)
+    upstream = match.group(1) if match else default_upstream
+
+    previous = [
+        render_legacy_vhost(server_name),
+        render_legacy_vhost(server_name, listen=False),
+        # Snippet includes with a direct proxy_pass, before upstream keepalive pools
+        render_vhost(server_name, snippets_dir, "localhost:3000", None),
+        # Upstream keepalive pools, before performance profiles
+        render_vhost(server_name, snippets_dir, upstream, None),
+    ]
+    if any(matches_template(config, template) for template in previous):
+        return render_vhost(server_name, snippets_dir, upstream)
+    return None
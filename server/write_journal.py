@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+
+import fcntl
+import itertools
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+
+def _fsync_dir(path: str) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _staging_path(path: str, txid: str) -> str:
+    # Hidden, so nginx's "include sites-enabled/*" and "*.conf" globs never pick it up
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.{txid}.tmp")
+
+
+class WriteBatch:
+    """
+    File writes, symlinks and removals that become visible together.
+
+    Nothing on disk changes until commit(): new contents are staged next to
+    their targets and then renamed into place, so a reader or a crash never
+    sees a half-written vhost. Leaving the with block through an exception
+    discards the batch.
+    """
+
+    def __init__(self, journal: "Journal"):
+        self.journal = journal
+        self.ops: List[Dict] = []
+
+    def write(self, path: str, content: str) -> None:
+        self.ops.append({"op": "write", "path": path, "content": content})
+
+    def symlink(self, target: str, link: str) -> None:
+        self.ops.append({"op": "symlink", "path": link, "target": target})
+
+    def remove(self, path: str) -> None:
+        self.ops.append({"op": "remove", "path": path})
+
+    def commit(self) -> None:
+        if self.ops:
+            self.journal.commit(self.ops)
+        self.ops = []
+
+    def __enter__(self) -> "WriteBatch":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            self.commit()
+        else:
+            self.ops = []
+
+
+class Journal:
+    """
+    Write-ahead journal for multi-file config changes.
+
+    A commit
+      1. records its intent (targets and staging paths) and fsyncs the journal,
+      2. writes and fsyncs every staged file and creates staged symlinks,
+      3. appends a commit mark and fsyncs the journal again,
+      4. renames staged files over their targets and applies removals,
+      5. fsyncs each touched directory once and deletes the journal.
+    The fsync cost is per batch, not per file, apart from the staged file
+    contents themselves. recover() rolls journals without a commit mark back
+    (their staged files are deleted) and replays committed ones, which is
+    safe because every step of the apply phase is idempotent. A journal
+    whose owner still holds its flock is left alone.
+    """
+
+    _counter = itertools.count()
+
+    def __init__(self, journal_dir: str):
+        self.journal_dir = journal_dir
+
+    def batch(self) -> WriteBatch:
+        return WriteBatch(self)
+
+    @staticmethod
+    def _append(fd: int, record: Dict) -> None:
+        os.write(fd, (json.dumps(record) + "\n").encode())
+        os.fsync(fd)
+
+    def commit(self, ops: List[Dict]) -> None:
+        txid = f"{time.time_ns()}-{os.getpid()}-{next(self._counter)}"
+        entries = []
+        for op in ops:
+            entry = {"op": op["op"], "path": op["path"]}
+            if op["op"] != "remove":
+                entry["staged"] = _staging_path(op["path"], txid)
+            entries.append(entry)
+
+        os.makedirs(self.journal_dir, exist_ok=True)
+        journal_file = os.path.join(self.journal_dir, f"{txid}.journal")
+        # Written under a temporary name and renamed once locked, so recover()
+        # in another process never sees a journal its owner has not locked yet
+        tmp_file = os.path.join(self.journal_dir, f".{txid}.tmp")
+        fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            self._append(fd, {"intent": entries})
+            os.rename(tmp_file, journal_file)
+            _fsync_dir(self.journal_dir)
+
+            for op, entry in zip(ops, entries):
+                if op["op"] == "write":
+                    os.makedirs(os.path.dirname(op["path"]), exist_ok=True)
+                    with open(entry["staged"], 'w') as f:
+                        f.write(op["content"])
+                        f.flush()
+                        os.fsync(f.fileno())
+                elif op["op"] == "symlink":
+                    os.makedirs(os.path.dirname(op["path"]), exist_ok=True)
+                    os.symlink(op["target"], entry["staged"])
+
+            self._append(fd, {"commit": True})
+            self._apply(entries)
+            os.remove(journal_file)
+        except BaseException:
+            # Before the commit mark nothing is visible yet and the batch is undone;
+            # after it the batch is finished
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            self._rollback_or_replay(journal_file)
+            raise
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _apply(entries: List[Dict]) -> None:
+        directories = set()
+        for entry in entries:
+            path = entry["path"]
+            if entry["op"] == "remove":
+                if os.path.lexists(path):
+                    os.remove(path)
+            elif os.path.lexists(entry["staged"]):
+                os.replace(entry["staged"], path)
+            directories.add(os.path.dirname(path))
+
+        for directory in directories:
+            if os.path.isdir(directory):
+                _fsync_dir(directory)
+
+    @staticmethod
+    def _read(journal_file: str) -> Optional[Dict]:
+        intent = None
+        committed = False
+        try:
+            with open(journal_file, 'r') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Torn final record
+                        break
+                    if "intent" in record:
+                        intent = record["intent"]
+                    elif record.get("commit"):
+                        committed = True
+        except FileNotFoundError:
+            return None
+        return {"intent": intent or [], "committed": committed}
+
+    def _rollback_or_replay(self, journal_file: str) -> str:
+        state = self._read(journal_file)
+        if state is None:
+            return "gone"
+
+        if state["committed"]:
+            self._apply(state["intent"])
+            outcome = "replayed"
+        else:
+            for entry in state["intent"]:
+                staged = entry.get("staged")
+                if staged and os.path.lexists(staged):
+                    os.remove(staged)
+            outcome = "rolled_back"
+        os.remove(journal_file)
+        return outcome
+
+    @staticmethod
+    def _remove_unlocked(path: str) -> None:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            os.remove(path)
+        except (BlockingIOError, FileNotFoundError):
+            pass
+        finally:
+            os.close(fd)
+
+    def recover(self) -> Dict[str, int]:
+        """Finish or undo batches interrupted by a crash"""
+        result = {"replayed": 0, "rolled_back": 0}
+        try:
+            names = sorted(os.listdir(self.journal_dir))
+        except FileNotFoundError:
+            return result
+
+        for name in names:
+            journal_file = os.path.join(self.journal_dir, name)
+            if name.endswith(".tmp"):
+                # Crashed before its intent was recorded, so nothing was staged yet
+                self._remove_unlocked(journal_file)
+                continue
+            if not name.endswith(".journal"):
+                continue
+            try:
+                fd = os.open(journal_file, os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Still being committed by a live process
+                    continue
+                outcome = self._rollback_or_replay(journal_file)
+                if outcome in result:
+                    result[outcome] += 1
+            finally:
+                os.close(fd)
+        return result
@@ -1,6 +1,7 @@
 import { pgTable, text, serial, integer, boolean, timestamp } from "drizzle-orm/pg-core";
 import { createInsertSchema } from "drizzle-zod";
 import { z } from "zod";
+import domainRules from "./domain-rules.json";
 
 export const domains = pgTable("domains", {
   id: serial("id").primaryKey(),
@@ -10,16 +11,41 @@ export const domains = pgTable("domains", {
   createdAt: timestamp("created_at").defaultNow().notNull(),
 });
 
+// Performance profiles defined in server/vhost_template.py
+export const performanceProfiles = ["proxy-app", "php-site", "static-heavy"] as const;
+
+// Same rules as server/domain_rules.py, read from the one shared file
+const domainLabel = new RegExp(domainRules.labelPattern);
+
+export const domainNameSchema = z.string()
+  .min(1, "Domain name is required")
+  .max(domainRules.maxLength, "Invalid domain format")
+  .refine(
+    (name) => name.split(".").every((label) => label.length <= domainRules.maxLabelLength && domainLabel.test(label)),
+    "Invalid domain format"
+  );
+
 export const insertDomainSchema = createInsertSchema(domains).pick({
   name: true,
   sslStatus: true,
   sslExpiryDate: true,
 }).extend({
-  name: z.string().min(1, "Domain name is required").regex(
-    /^[a-zA-Z0-9][a-zA-Z0-9-]{0,61}[a-zA-Z0-9](?:\.[a-zA-Z0-9][a-zA-Z0-9-]{0,61}[a-zA-Z0-9])*$/,
-    "Invalid domain format"
-  ),
+  name: domainNameSchema,
   installSsl: z.boolean().optional(),
+  upstream: z.string().regex(
+    /^[a-zA-Z0-9](?:[a-zA-Z0-9.-]{0,251}[a-zA-Z0-9])?:\d{1,5}$/,
+    "Upstream must be host:port"
+  ).optional(),
+  profile: z.enum(performanceProfiles).optional(),
+  accessLog: z.boolean().optional(),
+});
+
+export const setProfileSchema = z.object({
+  profile: z.enum(performanceProfiles),
+});
+
+export const setAccessLogSchema = z.object({
+  enabled: z.boolean(),
 });
 
 export type InsertDomain = z.infer<typeof insertDomainSchema>;